@@ -0,0 +1,65 @@
+#
+# BenchmarkJsonCodec.py Python script to compare the JSON libraries supported by idrac_telemetry.json_codec on
+# MetricReport sized documents.
+#
+#
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from idrac_telemetry.json_codec import JsonCodec, available_libraries
+from GenerateRsyslogCorpus import REPORT_TYPES, build_metric_report
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Python script to compare the JSON libraries on MetricReports")
+    parser.add_argument('--report-types', help='Comma separated list of report types', default=','.join(REPORT_TYPES))
+    parser.add_argument('--number', help='Number of decodes and encodes per measurement', type=int, default=2000)
+    parser.add_argument('script_examples', action="store_true",
+                        help="'python BenchmarkJsonCodec.py --report-types MemorySensor,NICStatistics' compares the "
+                             "installed JSON libraries on MemorySensor and NICStatistics reports")
+    return vars(parser.parse_args(argv))
+
+
+def benchmark(report_types, number):
+    rng = random.Random(0)
+    for report_id in report_types:
+        report = build_metric_report(report_id, 1, datetime(2022, 5, 10, 12, 0, 0), rng)
+        document = json.dumps(report)
+        logging.info("\n- {} report, {} bytes -".format(report_id, len(document)))
+        measurements = {}
+        for library in available_libraries():
+            codec = JsonCodec(library)
+            results = {
+                'loads': timeit.timeit(lambda: codec.loads(document), number=number),
+                'dumps compact': timeit.timeit(lambda: codec.dumps(report, 'compact'), number=number)}
+            results['round trip'] = results['loads'] + timeit.timeit(lambda: codec.dumps(report), number=number)
+            measurements[library] = results
+        # Speedups are relative to the standard library json module
+        for library, results in measurements.items():
+            logging.info("{:8} {}".format(library, ", ".join(
+                "{} {:.1f} us ({:.1f}x)".format(name, seconds / number * 10 ** 6, measurements['json'][name] / seconds)
+                for name, seconds in results.items())))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(message)s', stream=sys.stdout, level=logging.INFO)
+    args = parse_arguments()
+    benchmark([name.strip() for name in args["report_types"].split(',') if name.strip()], args["number"])
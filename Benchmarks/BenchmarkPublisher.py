@@ -0,0 +1,81 @@
+#
+# BenchmarkPublisher.py Python script to compare publishing MetricReports one by one with publishing them in
+# compressed batches, against the in-process broker stand-in of idrac_telemetry.publisher.
+#
+#
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from idrac_telemetry.publisher import COMPRESSIONS, FORMATS, MemoryBroker, Publisher
+from GenerateRsyslogCorpus import REPORT_TYPES, build_metric_report
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Python script to compare per report and batched publishing")
+    parser.add_argument('--hosts', help='Number of iDRACs', type=int, default=50)
+    parser.add_argument('--reports', help='Number of reports per iDRAC', type=int, default=20)
+    parser.add_argument('--latency', help='Milliseconds every send to the broker takes', type=float, default=2.0)
+    parser.add_argument('--format', help='Published records', default='reports', choices=FORMATS)
+    parser.add_argument('--batch-bytes', help='Uncompressed bytes per batch', type=int, default=1048576)
+    parser.add_argument('script_examples', action="store_true",
+                        help="'python BenchmarkPublisher.py --hosts 100 --latency 5' publishes 20 reports of 100 "
+                             "iDRACs to a broker taking 5 ms per send, one by one and in batches")
+    return vars(parser.parse_args(argv))
+
+
+def build_reports(hosts, reports):
+    rng = random.Random(0)
+    start = datetime(2022, 5, 10, 12, 0, 0)
+    report_types = list(REPORT_TYPES)
+    return [('idrac-{:04d}'.format(host), build_metric_report(report_types[number % len(report_types)], number,
+                                                              start + timedelta(seconds=60 * number), rng))
+            for number in range(reports) for host in range(hosts)]
+
+
+def measure(reports, latency, record_format, batch_bytes, compression):
+    broker = MemoryBroker(latency=latency)
+    publisher = Publisher(broker, record_format=record_format, batch_bytes=batch_bytes, linger=0.5,
+                          compression=compression)
+    started = time.perf_counter()
+    for host, report in reports:
+        publisher.publish(host, report)
+    publisher.close()
+    seconds = time.perf_counter() - started
+    statistics = publisher.statistics
+    assert statistics['acked_records'] == statistics['records'] == len(broker.records())
+    return seconds, statistics
+
+
+def benchmark(hosts, reports, latency, record_format, batch_bytes):
+    reports = build_reports(hosts, reports)
+    logging.info("- INFO, publishing {} reports of {} iDRACs, {} ms per send".format(len(reports), hosts, latency))
+    runs = [('one by one', 0, 'none')] + [('batched ' + compression, batch_bytes, compression)
+                                          for compression in COMPRESSIONS]
+    for name, run_batch_bytes, compression in runs:
+        seconds, statistics = measure(reports, latency / 1000, record_format, run_batch_bytes, compression)
+        logging.info("{:16} {:8.2f} s {:9.0f} reports/s {:7} batches {:11} bytes sent ({:.1f}x smaller)".format(
+            name, seconds, len(reports) / seconds, statistics['batches'], statistics['compressed_bytes'],
+            statistics['raw_bytes'] / statistics['compressed_bytes']))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(message)s', stream=sys.stdout, level=logging.INFO)
+    args = parse_arguments()
+    benchmark(args["hosts"], args["reports"], args["latency"], args["format"], args["batch_bytes"])
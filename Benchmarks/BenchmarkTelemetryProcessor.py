@@ -0,0 +1,214 @@
+#
+# BenchmarkTelemetryProcessor.py Python script to benchmark TelemetryRsysLogProcessor.py against a corpus generated
+# by GenerateRsyslogCorpus.py and to record the results so regressions between releases show up.
+#
+#
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # not available on Windows, the memory high-water mark is then not reported
+    resource = None
+
+BENCHMARKS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_FOLDER = os.path.dirname(BENCHMARKS_FOLDER)
+PROCESSOR_FOLDER = os.path.join(REPOSITORY_FOLDER, 'TelemetryReportProcessingScripts')
+# Kept in the user cache folder, outside of the working tree
+DEFAULT_HISTORY = os.path.join(os.path.expanduser('~'), '.cache', 'idrac-telemetry', 'benchmark_history.jsonl')
+
+# Processor modes, each one maps to the keyword arguments of TelemetryRsyslogParser
+MODES = {
+    'text': {'reader': 'text', 'json_library': 'json'},
+    'bytes': {'reader': 'bytes', 'json_library': 'json'},
+    'bytes-fastjson': {'reader': 'bytes', 'json_library': 'auto'},
+    'bytes-fastjson-compact': {'reader': 'bytes', 'json_library': 'auto', 'json_format': 'compact'},
+}
+
+# Metrics compared against the previous run, True if a higher value is better
+TRACKED_METRICS = {'parse_lines_per_sec': True, 'reports_per_sec': True, 'max_rss_kb': False, 'output_bytes': False}
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Python script to benchmark the Telemetry Rsyslog processor")
+    parser.add_argument('-c', help='Corpus folder created by GenerateRsyslogCorpus.py', required=True)
+    parser.add_argument('--modes', help='Comma separated list of processor modes to run. Possible values are {}'.format(
+        ', '.join(MODES)), default=','.join(MODES))
+    parser.add_argument('--repeat', help='Number of runs per mode, the best run is reported', type=int, default=3)
+    parser.add_argument('--label', help='Release label stored with the results', default='')
+    parser.add_argument('--history', help='JSON lines file the results are appended to', default=DEFAULT_HISTORY)
+    parser.add_argument('--no-record', help='Do not append the results to the history file', action='store_true')
+    parser.add_argument('--threshold', help='Relative change against the previous run reported as regression',
+                        type=float, default=0.1)
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('script_examples', action="store_true",
+                        help="'python GenerateRsyslogCorpus.py -o /tmp/corpus && python BenchmarkTelemetryProcessor.py "
+                             "-c /tmp/corpus --label 1.1' benchmarks all processor modes and records the results")
+    return vars(parser.parse_args(argv))
+
+
+def load_manifest(corpus_folder):
+    with open(os.path.join(corpus_folder, 'manifest.json')) as file:
+        return json.load(file)
+
+
+def folder_size(folder):
+    total = 0
+    for root, _, file_names in os.walk(folder):
+        total += sum(os.path.getsize(os.path.join(root, file_name)) for file_name in file_names)
+    return total
+
+
+def max_rss_kb():
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage // 1024 if sys.platform == 'darwin' else usage
+
+
+def run_worker(corpus_folder, mode):
+    """Runs one processor mode against the corpus. Executed in a fresh interpreter so the memory high-water mark
+    only covers this mode."""
+    sys.path.insert(0, PROCESSOR_FOLDER)
+    import TelemetryRsysLogProcessor
+
+    logging.getLogger('RsysLogProcessor').setLevel(logging.CRITICAL)
+    manifest = load_manifest(corpus_folder)
+    files = [os.path.join(corpus_folder, file_name) for file_name in manifest['files']]
+    destination_folder = tempfile.mkdtemp(prefix='telemetry_benchmark_')
+    try:
+        processor = TelemetryRsysLogProcessor.TelemetryRsyslogParser(destination_folder, **MODES[mode])
+        start = time.perf_counter()
+        reports = sum(processor.process_file(file_name) for file_name in files)
+        end_to_end_seconds = time.perf_counter() - start
+        peak_memory = max_rss_kb()
+        output_bytes = folder_size(destination_folder)
+    finally:
+        shutil.rmtree(destination_folder, ignore_errors=True)
+
+    # Read, split and parse only, without reassembly and writing the reports
+    input_bytes = sum(os.path.getsize(file_name) for file_name in files)
+    lines = 0
+    start = time.perf_counter()
+    for file_name in files:
+        for _ in processor.read_file(file_name):
+            lines += 1
+    parse_seconds = time.perf_counter() - start
+    return {'lines': lines, 'input_bytes': input_bytes,
+            'parse_seconds': round(parse_seconds, 4),
+            'parse_lines_per_sec': round(lines / parse_seconds, 1),
+            'parse_mb_per_sec': round(input_bytes / parse_seconds / 2 ** 20, 2),
+            'reports': reports, 'expected_reports': manifest['expected_reports'],
+            'end_to_end_seconds': round(end_to_end_seconds, 4),
+            'reports_per_sec': round(reports / end_to_end_seconds, 1),
+            'max_rss_kb': peak_memory, 'output_bytes': output_bytes}
+
+
+def run_mode(corpus_folder, mode, repeat):
+    """Runs a mode repeat times in subprocesses and keeps the fastest end to end run"""
+    best = None
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '-c', corpus_folder,
+                                          '--worker', mode])
+        result = json.loads(output.decode().strip().splitlines()[-1])
+        if best is None or result['end_to_end_seconds'] < best['end_to_end_seconds']:
+            best = result
+    return best
+
+
+def repository_version():
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'], cwd=REPOSITORY_FOLDER,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def load_history(history_file):
+    if not os.path.exists(history_file):
+        return []
+    with open(history_file) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def find_regressions(record, history, threshold):
+    """Compares a result with the latest recorded result of the same corpus, mode and machine"""
+    previous = [entry for entry in history if entry['signature'] == record['signature'] and
+                entry['mode'] == record['mode'] and entry['machine'] == record['machine']]
+    if not previous:
+        return None, []
+    baseline = previous[-1]
+    regressions = []
+    for metric, higher_is_better in TRACKED_METRICS.items():
+        old, new = baseline['results'].get(metric), record['results'].get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        if (higher_is_better and change < -threshold) or (not higher_is_better and change > threshold):
+            regressions.append("{} {} -> {} ({:+.1%})".format(metric, old, new, change))
+    return baseline, regressions
+
+
+def benchmark(args):
+    manifest = load_manifest(args["c"])
+    history = load_history(args["history"])
+    version = repository_version()
+    records = []
+    regressed = False
+    for mode in [name.strip() for name in args["modes"].split(',') if name.strip()]:
+        if mode not in MODES:
+            logging.error("- FAIL, unknown processor mode '{}'".format(mode))
+            sys.exit(1)
+        results = run_mode(args["c"], mode, args["repeat"])
+        record = {'date': datetime.now().isoformat(timespec='seconds'), 'version': version, 'label': args["label"],
+                  'machine': platform.node(), 'python': platform.python_version(),
+                  'signature': manifest['signature'], 'corpus': manifest['options'], 'mode': mode,
+                  'results': results}
+        records.append(record)
+        logging.info("- INFO, mode '{}': {} lines parsed at {} lines/sec ({} MB/sec), {} of {} reports at {} "
+                     "reports/sec, max RSS {} KB, {} output bytes".format(
+                      mode, results['lines'], results['parse_lines_per_sec'], results['parse_mb_per_sec'],
+                      results['reports'], results['expected_reports'], results['reports_per_sec'],
+                      results['max_rss_kb'], results['output_bytes']))
+        baseline, regressions = find_regressions(record, history, args["threshold"])
+        if baseline:
+            for regression in regressions:
+                logging.warning("- WARNING, regression of mode '{}' against version {}: {}".format(
+                    mode, baseline['version'], regression))
+            regressed = regressed or bool(regressions)
+    if not args["no_record"]:
+        os.makedirs(os.path.dirname(os.path.abspath(args["history"])), exist_ok=True)
+        with open(args["history"], 'a') as file:
+            for record in records:
+                file.write(json.dumps(record, sort_keys=True) + "\n")
+        logging.info("- INFO, results appended to '{}'".format(args["history"]))
+    return regressed
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    if args["worker"]:
+        print(json.dumps(run_worker(args["c"], args["worker"])))
+        sys.exit(0)
+    logging.basicConfig(format='%(message)s', stream=sys.stdout, level=logging.INFO)
+    sys.exit(1 if benchmark(args) else 0)
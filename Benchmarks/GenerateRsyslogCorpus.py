@@ -0,0 +1,256 @@
+#
+# GenerateRsyslogCorpus.py Python script to generate synthetic iDRAC Telemetry Rsyslog files for benchmarking and
+# testing the Telemetry report processing scripts.
+#
+#
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+# Report definitions modelled on the iDRAC 5.x MetricReportDefinitions. Each entry lists the MetricIds of the report,
+# the FQDD pattern and number of devices reporting them and the value range of the MetricValues.
+REPORT_TYPES = {
+    'PowerMetrics': {'metrics': ['SystemInputPower', 'SystemOutputPower', 'TotalCPUPower', 'TotalMemoryPower',
+                                 'TotalFanPower', 'TotalStoragePower'],
+                     'fqdd': 'System.Embedded.{}', 'devices': 1, 'range': (20, 900)},
+    'ThermalSensor': {'metrics': ['TemperatureReading'],
+                      'fqdd': 'iDRAC.Embedded.1#SystemBoardInletTemp{}', 'devices': 6, 'range': (18, 85)},
+    'CPUSensor': {'metrics': ['TemperatureReading'],
+                  'fqdd': 'iDRAC.Embedded.1#CPU{}Temp', 'devices': 2, 'range': (30, 95)},
+    'FanSensor': {'metrics': ['RPMReading'],
+                  'fqdd': 'Fan.Embedded.{}', 'devices': 8, 'range': (3000, 16000)},
+    'PSUMetrics': {'metrics': ['AmpsReading', 'VoltageReading', 'WattsReading'],
+                   'fqdd': 'PSU.Slot.{}', 'devices': 2, 'range': (0, 240)},
+    'MemorySensor': {'metrics': ['TemperatureReading'],
+                     'fqdd': 'DIMM.Socket.A{}', 'devices': 16, 'range': (25, 70)},
+    'GPUMetrics': {'metrics': ['BoardTemperature', 'PowerConsumption', 'GPUUtilization', 'MemoryUtilization'],
+                   'fqdd': 'Video.Slot.{}-1', 'devices': 4, 'range': (0, 300)},
+    'NICStatistics': {'metrics': ['RxBytes', 'TxBytes', 'RxUnicastPackets', 'TxUnicastPackets',
+                                  'RxBroadcastPackets', 'RxErrorPktAlignmentErrors', 'RxFalseCarrierDetection'],
+                      'fqdd': 'NIC.Integrated.1-{}-1', 'devices': 4, 'range': (0, 10 ** 9)},
+    'SystemUsage': {'metrics': ['CPUUsage', 'MemoryUsage', 'IOUsage', 'SystemUsage'],
+                    'fqdd': 'System.Embedded.{}', 'devices': 1, 'range': (0, 100)},
+    'StorageDiskSMARTData': {'metrics': ['CRCErrorCount', 'PowerOnHours', 'ReallocatedBlockCount',
+                                         'TemperatureReading'],
+                             'fqdd': 'Disk.Bay.{}:Enclosure.Internal.0-1:RAID.Integrated.1-1', 'devices': 8,
+                             'range': (0, 50000)},
+}
+
+INTERLEAVE_MODES = ['none', 'hosts', 'random']
+LAYOUTS = ['per-host', 'merged']
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Python script to generate synthetic iDRAC Telemetry Rsyslog files")
+    parser.add_argument('-o', help='Output folder for the generated Rsyslog files', required=True)
+    parser.add_argument('--hosts', help='Number of iDRACs sending reports', type=int, default=20)
+    parser.add_argument('--reports-per-host', help='Number of reporting intervals per iDRAC', type=int, default=10)
+    parser.add_argument('--report-types', help='Comma separated list of report types. Defaults to all of {}'.format(
+        ', '.join(REPORT_TYPES)), default=','.join(REPORT_TYPES))
+    parser.add_argument('--chunk-size', help='Maximum number of payload characters per Rsyslog line', type=int,
+                        default=1024)
+    parser.add_argument('--interleave', help='How the chunks of concurrently sent reports are mixed', default='hosts',
+                        choices=INTERLEAVE_MODES)
+    parser.add_argument('--layout', help='Write one Rsyslog file per iDRAC or one file for all iDRACs',
+                        default='per-host', choices=LAYOUTS)
+    parser.add_argument('--loss-rate', help='Probability of dropping a chunk', type=float, default=0.0)
+    parser.add_argument('--duplicate-rate', help='Probability of sending a chunk twice', type=float, default=0.0)
+    parser.add_argument('--reorder-rate', help='Probability of delaying a chunk by a few lines', type=float,
+                        default=0.0)
+    parser.add_argument('--index-wrap', help='Value at which the Rsyslog report index wraps around to 1', type=int,
+                        default=65535)
+    parser.add_argument('--seed', help='Random seed, the same seed and options always give the same corpus', type=int,
+                        default=0)
+    parser.add_argument('script_examples', action="store_true",
+                        help="'python GenerateRsyslogCorpus.py -o /tmp/corpus --hosts 100 --loss-rate 0.01' generates "
+                             "Rsyslog files of 100 iDRACs with 1 percent of the chunks lost under /tmp/corpus")
+    return vars(parser.parse_args(argv))
+
+
+def corpus_options(args):
+    """Returns the generator options of the parsed arguments which define the content of the corpus"""
+    keys = ['hosts', 'reports_per_host', 'report_types', 'chunk_size', 'interleave', 'layout', 'loss_rate',
+            'duplicate_rate', 'reorder_rate', 'index_wrap', 'seed']
+    return {key: args[key] for key in keys}
+
+
+def corpus_signature(options):
+    """Returns a short stable hash of the generator options, used to compare benchmark results of equal corpora"""
+    return hashlib.sha1(json.dumps(options, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def build_metric_report(report_id, sequence, timestamp, rng):
+    definition = REPORT_TYPES[report_id]
+    low, high = definition['range']
+    report_time = timestamp.strftime('%Y-%m-%dT%H:%M:%S-05:00')
+    metric_values = []
+    for device in range(1, definition['devices'] + 1):
+        fqdd = definition['fqdd'].format(device)
+        for metric_id in definition['metrics']:
+            metric_values.append({
+                "MetricId": metric_id,
+                "Timestamp": report_time,
+                "MetricValue": str(rng.randint(low, high)),
+                "MetricProperty": "/redfish/v1/Chassis/System.Embedded.1/Sensors/{}#{}".format(fqdd, metric_id),
+                "Oem": {"Dell": {"ContextID": fqdd, "Label": "{} {}".format(fqdd, metric_id),
+                                 "Source": report_id, "FQDD": fqdd}}})
+    return {
+        "@odata.type": "#MetricReport.v1_4_2.MetricReport",
+        "@odata.context": "/redfish/v1/$metadata#MetricReport.MetricReport",
+        "@odata.id": "/redfish/v1/TelemetryService/MetricReports/{}".format(report_id),
+        "Id": report_id,
+        "Name": "{} Metric Report".format(report_id),
+        "ReportSequence": str(sequence),
+        "Timestamp": report_time,
+        "MetricReportDefinition": {
+            "@odata.id": "/redfish/v1/TelemetryService/MetricReportDefinitions/{}".format(report_id)},
+        "MetricValues": metric_values,
+        "MetricValues@odata.count": len(metric_values)}
+
+
+def split_payload(payload, chunk_size):
+    """Splits the JSON payload into chunks. Chunks never start with a blank because the Rsyslog pattern of the
+    processor skips the whitespace in front of the message."""
+    chunks = []
+    start = 0
+    while start < len(payload):
+        end = min(start + chunk_size, len(payload))
+        while end < len(payload) and payload[end].isspace():
+            end += 1
+        chunks.append(payload[start:end])
+        start = end
+    return chunks
+
+
+def format_line(time_stamp, host, appname, index, chunks_count, chunk_id, chunk):
+    return "{} {} {}: #MetricReport#:{}-{}-{}:{}\n".format(
+        time_stamp.strftime('%Y-%m-%dT%H:%M:%S.%f-05:00'), host, appname, index, chunks_count, chunk_id, chunk)
+
+
+def mix(streams, interleave, rng):
+    """Merges the lines of reports which are sent at the same time.
+
+    :param streams: One list of lines per report
+    :param interleave: 'none' keeps every report contiguous, 'hosts' alternates the chunks of the reports round robin
+                       and 'random' picks the next chunk from a random report
+    """
+    if interleave == 'none':
+        return [line for stream in streams for line in stream]
+    positions = [0] * len(streams)
+    pending = [index for index, stream in enumerate(streams) if stream]
+    lines = []
+    while pending:
+        if interleave == 'random':
+            pick = rng.randrange(len(pending))
+        else:
+            pick = 0
+        stream_index = pending[pick]
+        lines.append(streams[stream_index][positions[stream_index]])
+        positions[stream_index] += 1
+        if positions[stream_index] == len(streams[stream_index]):
+            pending.pop(pick)
+        elif interleave == 'hosts':
+            pending.append(pending.pop(pick))
+    return lines
+
+
+def disturb(lines, options, rng, stats):
+    """Applies the configured chunk loss, duplication and reordering to a list of lines"""
+    output = []
+    delayed = []
+    for line in lines:
+        if rng.random() < options['loss_rate']:
+            stats['lost_chunks'] += 1
+            continue
+        copies = 2 if rng.random() < options['duplicate_rate'] else 1
+        stats['duplicated_chunks'] += copies - 1
+        for _ in range(copies):
+            if rng.random() < options['reorder_rate']:
+                stats['reordered_chunks'] += 1
+                delayed.append([rng.randint(1, 8), line])
+            else:
+                output.append(line)
+            for entry in delayed:
+                entry[0] -= 1
+            output.extend(entry[1] for entry in delayed if entry[0] <= 0)
+            delayed = [entry for entry in delayed if entry[0] > 0]
+    output.extend(entry[1] for entry in delayed)
+    return output
+
+
+def generate_corpus(output_folder, options):
+    """Generates the Rsyslog files and a manifest.json describing the expected content.
+
+    :param output_folder: Folder the files are written to, created if missing
+    :param options: Generator options as returned by corpus_options
+    :return: The manifest dictionary
+    """
+    rng = random.Random(options['seed'])
+    report_types = [name.strip() for name in options['report_types'].split(',') if name.strip()]
+    for report_id in report_types:
+        if report_id not in REPORT_TYPES:
+            raise ValueError("Unknown report type '{}'".format(report_id))
+    os.makedirs(output_folder, exist_ok=True)
+    hosts = [("10.{}.{}.{}".format(number // 65536 % 256, number // 256 % 256, number % 256),
+              "idrac-{}".format(hashlib.md5(str(number).encode()).hexdigest()[:7].upper()))
+             for number in range(1, options['hosts'] + 1)]
+    stats = {'reports': 0, 'lines': 0, 'lost_chunks': 0, 'duplicated_chunks': 0, 'reordered_chunks': 0,
+             'incomplete_reports': 0}
+    files = {}
+    next_index = {appname: rng.randint(1, options['index_wrap']) for _, appname in hosts}
+    start_time = datetime(2022, 5, 10, 12, 0, 0)
+    for interval in range(options['reports_per_host']):
+        interval_time = start_time + timedelta(minutes=interval)
+        streams = {}
+        for host, appname in hosts:
+            file_name = 'idrac-merged.log' if options['layout'] == 'merged' else '{}.log'.format(appname)
+            for report_id in report_types:
+                payload = json.dumps(build_metric_report(report_id, interval + 1, interval_time, rng),
+                                     separators=(',', ':'))
+                chunks = split_payload(payload, options['chunk_size'])
+                index = next_index[appname]
+                next_index[appname] = index % options['index_wrap'] + 1
+                line_time = interval_time + timedelta(microseconds=rng.randint(0, 999999))
+                lines = [format_line(line_time, host, appname, index, len(chunks), chunk_id, chunk)
+                         for chunk_id, chunk in enumerate(chunks, 1)]
+                lost_before = stats['lost_chunks']
+                streams.setdefault(file_name, []).append(disturb(lines, options, rng, stats))
+                stats['reports'] += 1
+                if stats['lost_chunks'] != lost_before:
+                    stats['incomplete_reports'] += 1
+        for file_name, file_streams in streams.items():
+            files.setdefault(file_name, []).extend(mix(file_streams, options['interleave'], rng))
+    for file_name, lines in files.items():
+        stats['lines'] += len(lines)
+        with open(os.path.join(output_folder, file_name), 'w') as file:
+            file.writelines(lines)
+    manifest = {'options': options, 'signature': corpus_signature(options), 'files': sorted(files),
+                'hosts': [appname for _, appname in hosts], 'report_types': report_types,
+                'expected_reports': stats['reports'] - stats['incomplete_reports'], 'stats': stats}
+    with open(os.path.join(output_folder, 'manifest.json'), 'w') as file:
+        json.dump(manifest, file, indent=2)
+    return manifest
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(message)s', stream=sys.stdout, level=logging.INFO)
+    args = parse_arguments()
+    manifest = generate_corpus(args["o"], corpus_options(args))
+    logging.info("- INFO, generated {} reports in {} lines and {} files under '{}'".format(
+        manifest['stats']['reports'], manifest['stats']['lines'], len(manifest['files']), args["o"]))
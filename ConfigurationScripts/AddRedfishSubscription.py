@@ -17,13 +17,17 @@
 #
 
 import argparse
-import json
 import logging
+import os
 import sys
 import warnings
 import requests
 import pprint
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from idrac_telemetry import json_codec
+from idrac_telemetry.redfish_cache import add_cache_arguments, cache_from_arguments
+
 warnings.filterwarnings("ignore")
 logging.getLogger().setLevel(logging.INFO)  # Change to logging.DEBUG for detailed logs
 
@@ -36,24 +40,26 @@ parser.add_argument('script_examples', action="store_true",
 parser.add_argument('-d', help='Redfish listener destination address', required=True)
 parser.add_argument('-c', help='Context ID for the subscription. Use a string to uniquely identify the subscription',
                     default='LMEpzC', required=False)
+add_cache_arguments(parser)
 
 args = vars(parser.parse_args())
 
 idrac_ip = args["ip"]
 idrac_username = args["u"]
 idrac_password = args["p"]
+redfish_cache = cache_from_arguments(args)
 
 
 def validate_telemetry_support():
     """Ensures that the targeted server supports telemetry before we take action"""
 
-    url = 'https://{}/redfish/v1/TelemetryService'.format(idrac_ip)
     headers = {'content-type': 'application/json'}
-    response = requests.get(url, headers=headers, verify=False, auth=(idrac_username, idrac_password))
+    response = redfish_cache.get(idrac_ip, '/redfish/v1/TelemetryService', (idrac_username, idrac_password),
+                                 headers=headers)
     if response.status_code != 200:
         logging.error("Script can not be executed because the Datacenter license is not installed, telemetry is not"
                       " activated or iDRAC firmware does not support Telemetry.")
-        logging.error(pprint.pformat(json.loads(response.text).get("error", {}).get("@Message.ExtendedInfo", [{}])[0].get("Message", "")))
+        logging.error(pprint.pformat(json_codec.loads(response.text).get("error", {}).get("@Message.ExtendedInfo", [{}])[0].get("Message", "")))
         sys.exit(0)
 
 
@@ -70,7 +76,7 @@ def add_subscription():
         "EventFormatType": "MetricReport"}
     url = 'https://{}/redfish/v1/EventService/Subscriptions'.format(idrac_ip)
     headers = {'content-type': 'application/json'}
-    response = requests.post(url, data=json.dumps(payload), headers=headers, verify=False,
+    response = requests.post(url, data=json_codec.dumps(payload), headers=headers, verify=False,
                              auth=(idrac_username, idrac_password))
     if response.status_code != 201:
         logging.error("FAIL, status code for reading attributes is not 200, code is: {}".format(response.status_code))
@@ -81,6 +87,7 @@ def add_subscription():
                               "instead of a protocol and an IP address?")
             logging.error("")
         sys.exit()
+    redfish_cache.invalidate(idrac_ip, '/redfish/v1/EventService/Subscriptions')
     logging.info("Pass - Successfully added a Redfish subscription to '{}' with context id '{}'".format(destination,
                                                                                                         context_id))
 
@@ -0,0 +1,114 @@
+#
+# ApplyTelemetryConfiguration.py Python script using Redfish API to apply the Telemetry attributes rendered from a
+# template with group overrides to many iDRACs concurrently.
+#
+#
+#
+# _version_ = 1.0
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+import argparse
+import logging
+import os
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from idrac_telemetry import json_codec
+from idrac_telemetry.async_redfish import add_client_arguments, client_from_arguments, run_on_hosts
+from idrac_telemetry.hosts import Host
+from idrac_telemetry.inventory import add_inventory_arguments, hosts_from_arguments
+from idrac_telemetry.telemetry_config import (CACHED, CHANGED, DEFAULT_VERIFIED_FILE, FAILED, IN_SYNC, PLANNED,
+                                              ConfigResult, VerifiedConfigurations, apply_host, load_template)
+
+warnings.filterwarnings("ignore")
+
+parser = argparse.ArgumentParser(description="Python script using Redfish to apply the Telemetry attributes rendered "
+                                 "from a template with group overrides to many iDRACs concurrently")
+parser.add_argument('-ip', help='iDRAC IP address, argument only required if configuring one iDRAC', required=False)
+parser.add_argument('-u', help='iDRAC username, argument only required if configuring one iDRAC', required=False)
+parser.add_argument('-p', help='iDRAC password, argument only required if configuring one iDRAC', required=False)
+parser.add_argument('-f', help='CSV file of iDRACs with the columns iDRAC IP, Username, Password and an optional Group '
+                    'column. If file is not located in same directory as the script, pass in the full directory path '
+                    'with the file name. Also accepts YAML inventories and folders of CSV and YAML files',
+                    required=False)
+parser.add_argument('-t', '--template', help='JSON template of the Telemetry attributes: a base export of '
+                    'ExportTelemetryConfigurationUsingScpREDFISH.py, attributes of all iDRACs and overrides per group '
+                    'and per iDRAC, see idrac_telemetry/telemetry_config.py', required=True)
+parser.add_argument('--dry-run', help='Only show the attributes which would be changed', action='store_true')
+parser.add_argument('--force', help='Read and verify the attributes of iDRACs which were verified with the same '
+                    'attributes before, to find changes made by other means', action='store_true')
+parser.add_argument('--verified-file', help='File remembering the attributes verified on every iDRAC, iDRACs '
+                    'verified with the same attributes are skipped', default=DEFAULT_VERIFIED_FILE)
+add_client_arguments(parser)
+add_inventory_arguments(parser)
+parser.add_argument('script_examples', action="store_true",
+                    help="'python ApplyTelemetryConfiguration.py -f iDRACs.csv -t telemetry.json' sets the attributes "
+                         "of telemetry.json on all iDRACs of iDRACs.csv, with the overrides of their group. "
+                         "'python ApplyTelemetryConfiguration.py -f iDRACs.csv -t telemetry.json --group 'rack*' "
+                         "--dry-run' shows the changes needed on the iDRACs of the rack groups")
+
+args = vars(parser.parse_args())
+logging.basicConfig(format='%(message)s', stream=sys.stdout, level=logging.INFO)
+
+
+def read_hosts():
+    if args["ip"] and args["u"] and args["p"]:
+        return [Host(args["ip"], args["u"], args["p"])]
+    if not args["f"]:
+        logging.error("- ERROR, pass in one iDRAC with -ip, -u and -p or a CSV file with -f")
+        sys.exit(1)
+    try:
+        return list(hosts_from_arguments(args, args["f"]))
+    except OSError:
+        logging.error("- ERROR, unable to locate file %s" % args["f"])
+        sys.exit(1)
+    except ValueError as e:
+        logging.error("- ERROR, %s" % e)
+        sys.exit(1)
+
+
+def log_results(results):
+    for result in results:
+        if result.status == FAILED:
+            logging.error("- FAIL, iDRAC {}: {}".format(result.host.ip, result.error))
+        elif result.status in (CHANGED, PLANNED):
+            logging.info("- INFO, iDRAC {}: {} {} with {}: {}".format(
+                result.host.ip, 'set' if result.status == CHANGED else 'would set', len(result.changes), result.method,
+                json_codec.dumps(result.changes, 'compact')))
+
+
+if __name__ == "__main__":
+    hosts = read_hosts()
+    try:
+        template = load_template(args["template"])
+        verified = VerifiedConfigurations(args["verified_file"] or None)
+    except (OSError, ValueError) as e:
+        logging.error("- ERROR, {}".format(e))
+        sys.exit(1)
+    started = time.monotonic()
+    results = run_on_hosts(hosts, lambda client, host: apply_host(client, host, template.render(host), verified,
+                                                                  args["force"], args["dry_run"]),
+                           client_from_arguments(args))
+    results = [ConfigResult(host, FAILED, error=str(result)) if isinstance(result, Exception) else result
+               for host, result in zip(hosts, results)]
+    if not args["dry_run"]:
+        verified.save()
+    log_results(results)
+    counts = {status: sum(result.status == status for result in results)
+              for status in (CHANGED, PLANNED, IN_SYNC, CACHED, FAILED)}
+    logging.info("- INFO, {} iDRACs in {} seconds: {} changed, {} to change, {} in sync, {} verified before, "
+                 "{} failed".format(len(results), round(time.monotonic() - started, 1), counts[CHANGED],
+                                    counts[PLANNED], counts[IN_SYNC], counts[CACHED], counts[FAILED]))
+    if counts[FAILED]:
+        sys.exit(1)
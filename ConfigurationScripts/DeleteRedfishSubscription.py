@@ -18,26 +18,45 @@
 #
 
 import argparse
-import json
 import logging
+import os
 import sys
 import warnings
 import requests
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from idrac_telemetry import json_codec
+from idrac_telemetry.bulk_delete import SUBSCRIPTIONS_URI, BulkDeleter
+from idrac_telemetry.hosts import Host
+from idrac_telemetry.inventory import add_inventory_arguments, hosts_from_arguments
+from idrac_telemetry.journal import HOST_DONE, add_journal_arguments, journal_from_arguments
+from idrac_telemetry.redfish_cache import add_cache_arguments, cache_from_arguments
+
 warnings.filterwarnings("ignore")
 logging.getLogger().setLevel(logging.INFO)  # Change to logging.DEBUG for detailed logs
 
 parser = argparse.ArgumentParser(description="Python script using Redfish to add a Redfish subscription to the iDRAC")
-parser.add_argument('-ip', help='iDRAC IP address', required=True)
-parser.add_argument('-u', help='iDRAC username', required=True)
-parser.add_argument('-p', help='iDRAC password', required=True)
+parser.add_argument('-ip', help='iDRAC IP address, argument only required if configuring one iDRAC', required=False)
+parser.add_argument('-u', help='iDRAC username, argument only required if configuring one iDRAC', required=False)
+parser.add_argument('-p', help='iDRAC password, argument only required if configuring one iDRAC', required=False)
+parser.add_argument('-f', help='Pass in csv file name to delete all subscriptions of many iDRACs with -a. NOTE: Make '
+                    'sure to use iDRACs.csv file from the repo which has the correct format. Also accepts YAML '
+                    'inventories and folders of CSV and YAML files, see --group and --shard to select iDRACs.',
+                    required=False)
 parser.add_argument('script_examples', action="store_true",
                     help="'python DeleteRedfishSubscription.py -ip 192.168.0.120 -u root -p calvin -v y' to view the subscriptions "
                          "'python DeleteRedfishSubscription.py -ip 192.168.0.120 -u root -p calvin -s e181b9a2-eaf6-11e9-94dc-f48e38cf169c' "
-                         "to delete subscription with id e181b9a2-eaf6-11e9-94dc-f48e38cf169c")
+                         "to delete subscription with id e181b9a2-eaf6-11e9-94dc-f48e38cf169c "
+                         "'python DeleteRedfishSubscription.py -f iDRACs.csv -a' to delete all subscriptions of all "
+                         "iDRACs in iDRACs.csv")
 parser.add_argument('-v', help='To view the existing subscription/s', action='store_true')
 parser.add_argument('-d', help='The subscription ID to be deleted', required=False)
 parser.add_argument('-a', help='Delete all subscriptions', action="store_true")
+parser.add_argument('--workers', help='Number of iDRACs worked on at the same time with -f', type=int, default=16)
+parser.add_argument('--per-host', help='Maximum number of concurrent DELETE requests per iDRAC', type=int, default=4)
+add_cache_arguments(parser)
+add_journal_arguments(parser)
+add_inventory_arguments(parser)
 
 args = vars(parser.parse_args())
 
@@ -45,16 +64,18 @@ idrac_ip = args["ip"]
 idrac_username = args["u"]
 idrac_password = args["p"]
 headers = {'content-type': 'application/json'}
+redfish_cache = cache_from_arguments(args)
+bulk_deleter = BulkDeleter(per_host=args["per_host"], host_workers=args["workers"])
 
 
 def validate_telemetry_support():
-    url = 'https://{}/redfish/v1/TelemetryService'.format(idrac_ip)
-    response = requests.get(url, headers=headers, verify=False, auth=(idrac_username, idrac_password))
+    response = redfish_cache.get(idrac_ip, '/redfish/v1/TelemetryService', (idrac_username, idrac_password),
+                                 headers=headers)
     if response.status_code != 200:
         logging.error("Script can not be executed because the Datacenter license is not installed, telemetry is not"
                       " activated or iDRAC firmware does not support Telemetry.")
         logging.error(
-            json.loads(response.text).get("error", {}).get("@Message.ExtendedInfo", [{}])[0].get("Message", ""))
+            json_codec.loads(response.text).get("error", {}).get("@Message.ExtendedInfo", [{}])[0].get("Message", ""))
         sys.exit(0)
 
 
@@ -65,7 +86,7 @@ def log_subscription_details(subscriptions):
         response = requests.get('https://{}{}'.format(idrac_ip, subscription.get("@odata.id", "")), headers=headers,
                                 verify=False, auth=(idrac_username, idrac_password))
         if response.status_code == 200:
-            response_date = json.loads(response.text)
+            response_date = json_codec.loads(response.text)
             subscription_ids.append(response_date.get("Id", ""))
             logging.info("Context ID: {} , Destination : {}, ID : {}".format(response_date.get("Context"),
                                                                              response_date.get("Destination"),
@@ -84,7 +105,7 @@ def view_subscriptions():
         url = 'https://{}/redfish/v1/EventService/Subscriptions'.format(idrac_ip)
         response = requests.get(url, headers=headers, verify=False, auth=(idrac_username, idrac_password))
         if response.status_code == 200:
-            response_date = json.loads(response.text)
+            response_date = json_codec.loads(response.text)
             subscriptions = response_date.get("Members")
             return log_subscription_details(subscriptions)
         else:
@@ -98,6 +119,7 @@ def delete_subscription(subscription_id):
     url = 'https://{}/redfish/v1/EventService/Subscriptions/{}'.format(idrac_ip, subscription_id)
     response = requests.delete(url, headers=headers, verify=False, auth=(idrac_username, idrac_password))
     if response.status_code == 200:
+        redfish_cache.invalidate(idrac_ip, '/redfish/v1/EventService/Subscriptions')
         logging.info("Successfully deleted subscription with ID : {}".format(subscription_id))
     else:
         logging.error("FAIL, status code for deleting subscription is not 200, code is: {}".format(response.status_code))
@@ -105,12 +127,36 @@ def delete_subscription(subscription_id):
             logging.error("FAIL, The response is: {}".format(response.text))
 
 
+def delete_all_subscriptions(hosts, journal=None):
+    """Deletes all subscriptions of the hosts concurrently and verifies they are gone, exits with 1 otherwise.
+    With a journal the result of each iDRAC is recorded and on --resume the iDRACs done before are skipped.
+    """
+    all_hosts = hosts
+    callback = None
+    if journal is not None:
+        if args["resume"]:
+            hosts = [host for host in hosts if not journal.done(host.ip)]
+        callback = lambda result: journal.record(result.host.ip, HOST_DONE, result.ok, result.error)
+    ok = True
+    for result in bulk_deleter.delete(hosts, SUBSCRIPTIONS_URI, callback=callback):
+        redfish_cache.invalidate(result.host.ip, SUBSCRIPTIONS_URI)
+        for error in result.errors:
+            logging.error("FAIL, iDRAC {}: {}".format(result.host.ip, error))
+        if result.verified:
+            logging.info("iDRAC {}: deleted {} of {} subscriptions".format(result.host.ip, len(result.deleted),
+                                                                          len(result.requested)))
+            for subscription in result.remaining:
+                logging.error("FAIL, iDRAC {}: subscription {} is still present".format(result.host.ip, subscription))
+        ok = ok and result.ok
+    if journal is not None:
+        ok = journal.log_summary([host.ip for host in all_hosts])
+        journal.close()
+    sys.exit(0 if ok else 1)
+
+
 def delete_subscriptions():
     if args["a"]:
-        args.update({'v': True})
-        subscription_ids = view_subscriptions()
-        list(map(delete_subscription, subscription_ids))
-        sys.exit()
+        delete_all_subscriptions([Host(idrac_ip, idrac_username, idrac_password)])
     elif args["d"]:
         subscription_id = args["d"]
         delete_subscription(subscription_id)
@@ -121,6 +167,24 @@ if __name__ == "__main__":
     if not (args["v"] or (args["a"] or args["d"])):
         logging.error("No valid options selected to run the script. Execute the script with -v or -d  or -a options")
         sys.exit(0)
+    if args["f"] and args["a"]:
+        try:
+            hosts = list(hosts_from_arguments(args, args["f"]))
+        except OSError:
+            logging.error("Unable to locate file {}".format(args["f"]))
+            sys.exit(1)
+        except ValueError as e:
+            logging.error(str(e))
+            sys.exit(1)
+        try:
+            journal = journal_from_arguments(args, "DeleteRedfishSubscription -a")
+        except (OSError, ValueError) as e:
+            logging.error(str(e))
+            sys.exit(1)
+        delete_all_subscriptions(hosts, journal)
+    if not (idrac_ip and idrac_username and idrac_password):
+        logging.error("Pass in -ip, -u and -p or use -f together with -a")
+        sys.exit(0)
     validate_telemetry_support()
     delete_subscriptions()
     view_subscriptions()
@@ -17,12 +17,17 @@
 #
 
 import argparse
-import csv
-import json
 import logging
+import os
 import sys
 import warnings
-import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from idrac_telemetry.bulk_delete import REPORT_DEFINITIONS_URI, BulkDeleter
+from idrac_telemetry.hosts import Host
+from idrac_telemetry.inventory import add_inventory_arguments, hosts_from_arguments
+from idrac_telemetry.journal import HOST_DONE, add_journal_arguments, journal_from_arguments
+from idrac_telemetry.redfish_cache import add_cache_arguments, cache_from_arguments
 
 warnings.filterwarnings("ignore")
 #logging.getLogger().setLevel(logging.INFO)  # Change to logging.DEBUG for detailed logs
@@ -33,12 +38,19 @@ parser.add_argument('--script-examples', action="store_true", help='Prints scrip
 parser.add_argument('-ip', help='iDRAC IP address, argument only required if configuring one iDRAC', required=False)
 parser.add_argument('-u', help='iDRAC username, argument only required if configuring one iDRAC', required=False)
 parser.add_argument('-p', help='iDRAC password, argument only required if configuring one iDRAC', required=False)
-parser.add_argument('-f', help='Pass in csv file name. If file is not located in same directory as script, pass in the full directory path with file name. NOTE: Make sure to use iDRACs.csv file from the repo which has the correct format.', required=False)
+parser.add_argument('-f', help='Pass in csv file name. If file is not located in same directory as script, pass in the full directory path with file name. NOTE: Make sure to use iDRACs.csv file from the repo which has the correct format. Also accepts YAML inventories and folders of CSV and YAML files, see --group and --shard to select iDRACs.', required=False)
 group = parser.add_mutually_exclusive_group(required=True)
 group.add_argument('-a', help='Delete all Metric Reports', action='store_true', required=False)
 group.add_argument('-n', help='Metric report name to delete. *Supports a comma delimted list', required=False)
+parser.add_argument('--workers', help='Number of iDRACs worked on at the same time', type=int, default=16)
+parser.add_argument('--per-host', help='Maximum number of concurrent DELETE requests per iDRAC', type=int, default=4)
+add_cache_arguments(parser)
+add_journal_arguments(parser)
+add_inventory_arguments(parser)
 
 args = vars(parser.parse_args())
+redfish_cache = cache_from_arguments(args)
+bulk_deleter = BulkDeleter(per_host=args["per_host"], host_workers=args["workers"])
 
 def print_examples():
     """
@@ -46,70 +58,75 @@ def print_examples():
     """
     print(
         '\n\'DeleteTelemetryReports.py -ip 192.168.0.120 -u root -p calvin -a, this example will delete all metric reports for a single iDRAC\n'
-        '\n\'DeleteTelemetryReports.py -ip 192.168.0.120 -u root -p calvin -n "PowerMetrics", this example will delete the PowerMetrics metric report for a single iDRAC\n')
+        '\n\'DeleteTelemetryReports.py -ip 192.168.0.120 -u root -p calvin -n "PowerMetrics", this example will delete the PowerMetrics metric report for a single iDRAC\n'
+        '\n\'DeleteTelemetryReports.py -f iDRACs.csv -a, this example will delete all metric reports of all iDRACs in iDRACs.csv, 16 iDRACs at a time\n')
 
-def delete_all_reports(ip, user, pwd):
-    """ Checks the current status of telemetry and creates telemetry_attributes, a list of telemetry attributes
-    """
-    global telemetry_attributes
-    # Use redfish API instead of AR
-    url = 'https://{}/redfish/v1/TelemetryService/MetricReportDefinitions'.format(ip)
-    headers = {'content-type': 'application/json'}
-    response = requests.get(url, headers=headers, verify=False, auth=(user, pwd))
-    if response.status_code != 200:
-        logging.error("- FAIL, status code for reading attributes is not 200, code is: {}".format(response.status_code))
-        sys.exit()
-    try:
-        logging.info("- INFO, successfully pulled configuration attributes")
-        configurations_dict = json.loads(response.text)
-        attributes = configurations_dict.get('Members', {})
-        telemetry_attributes = [map['@odata.id'] for map in attributes]
-        logging.debug(telemetry_attributes)
+def log_results(results):
+    """Logs the verified outcome of the bulk deletes, returns True when all report definitions are gone"""
+    ok = True
+    for result in results:
+        redfish_cache.invalidate(result.host.ip, REPORT_DEFINITIONS_URI)
+        for error in result.errors:
+            logging.error("- FAIL, iDRAC {}: {}".format(result.host.ip, error))
+        if result.verified:
+            logging.info("- INFO, iDRAC {}: deleted {} of {} metric reports".format(
+                result.host.ip, len(result.deleted), len(result.requested)))
+            for report in result.remaining:
+                logging.error("- FAIL, iDRAC {}: metric report {} is still present".format(result.host.ip, report))
+        ok = ok and result.ok
+    return ok
 
-        for report in telemetry_attributes:
-            delete_url = 'https://{}{}'.format(ip, report)
-            logging.info("- INFO, deleting metric report {}".format(report))
-            del_response = requests.delete(delete_url, headers=headers, verify=False, auth=(user, pwd))
-            if del_response.status_code != 200:
-                logging.error("- FAIL, status code for {} is not 200, code is: {}".format(report, del_response.status_code))
+def journal_callback(journal):
+    """Returns the callback recording the result of each iDRAC in the journal, None without journal"""
+    if journal is None:
+        return None
+    return lambda result: journal.record(result.host.ip, HOST_DONE, result.ok, result.error)
 
-    except Exception as e:
-        logging.error("- FAIL: detailed error message: {0}".format(e))
-        sys.exit()
+def delete_all_reports(hosts, journal=None):
+    """ Deletes all metric report definitions of the hosts and verifies they are gone
+    """
+    return log_results(bulk_deleter.delete(hosts, REPORT_DEFINITIONS_URI, callback=journal_callback(journal)))
 
-def delete_reports(ip, user, pwd, reports):
-    """ Checks the current status of telemetry and creates telemetry_attributes, a list of telemetry attributes
+def delete_reports(hosts, reports, journal=None):
+    """ Deletes the comma separated metric report definitions of the hosts and verifies they are gone
     """
-    reports_list = map(str.strip, reports.split(','))
-    for report in reports_list:
-        delete_url = 'https://{}/redfish/v1/TelemetryService/MetricReportDefinitions/{}'.format(ip, report)
-        headers = {'content-type': 'application/json'}
-        logging.info("- INFO, deleting metric report {}".format(report))
-        del_response = requests.delete(delete_url, headers=headers, verify=False, auth=(user, pwd))
-        if del_response.status_code != 200:
-            logging.error("- FAIL, status code for {} is not 200, code is: {}".format(report, del_response.status_code))
+    reports_list = [report.strip() for report in reports.split(',') if report.strip()]
+    return log_results(bulk_deleter.delete(hosts, REPORT_DEFINITIONS_URI, reports_list,
+                                           callback=journal_callback(journal)))
 
 if __name__ == "__main__":
     if args["script_examples"]:
         print_examples()
-    elif args["ip"] and args["u"] and args["p"] and args["a"]:
-        delete_all_reports(args["ip"], args["u"], args["p"])
-    elif args["ip"] and args["u"] and args["p"] and args["n"]:
-        delete_reports(args["ip"], args["u"], args["p"], args["n"])
-    elif args["f"] and (args["a"] or args["n"]):
+        sys.exit(0)
+    if args["ip"] and args["u"] and args["p"]:
+        hosts = [Host(args["ip"], args["u"], args["p"])]
+    elif args["f"]:
         try:
-            open_csv_file = open(args["f"], encoding='UTF8')
-        except:
+            hosts = list(hosts_from_arguments(args, args["f"]))
+        except OSError:
             logging.error("\n- ERROR, unable to locate file %s" % args["f"])
             sys.exit(0)
-        csv_reader = csv.reader(open_csv_file)
-        next(csv_reader)
-        for line in csv_reader:
-            logging.info("\n- Delete Telemetry report definition for iDRAC %s -\n" % (line[0]))
-            if args["a"]:
-                delete_all_reports(line[0], line[1], line[2])
-            elif args["n"]:
-                delete_reports(line[0], line[1], line[2], args["n"])
+        except ValueError as e:
+            logging.error("\n- ERROR, %s" % e)
+            sys.exit(1)
     else:
         logging.warning("- WARNING, missing or incorrect arguments passed in for executing script")
-
+        sys.exit(0)
+    try:
+        journal = journal_from_arguments(args, "DeleteTelemetryReports {}".format("-a" if args["a"] else
+                                                                                 "-n " + args["n"]))
+    except (OSError, ValueError) as e:
+        logging.error("- ERROR, {}".format(e))
+        sys.exit(1)
+    all_hosts = hosts
+    if journal is not None and args["resume"]:
+        hosts = [host for host in hosts if not journal.done(host.ip)]
+    logging.info("\n- Delete Telemetry report definitions for {} iDRACs -\n".format(len(hosts)))
+    if args["a"]:
+        ok = delete_all_reports(hosts, journal)
+    else:
+        ok = delete_reports(hosts, args["n"], journal)
+    if journal is not None:
+        ok = journal.log_summary([host.ip for host in all_hosts])
+        journal.close()
+    sys.exit(0 if ok else 1)
@@ -18,13 +18,23 @@
 #
 
 import argparse
-import csv
-import json
+import asyncio
 import logging
+import os
 import sys
 import warnings
 import requests
-from requests.exceptions import HTTPError
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from idrac_telemetry import json_codec
+from idrac_telemetry.async_redfish import RedfishConnectionError, add_client_arguments, client_from_arguments, \
+    run_on_hosts
+from idrac_telemetry.circuit_breaker import CircuitBreaker, HostUnavailable
+from idrac_telemetry.hosts import Host, request
+from idrac_telemetry.inventory import add_inventory_arguments, hosts_from_arguments
+from idrac_telemetry.journal import HOST_DONE, add_journal_arguments, journal_from_arguments
+from idrac_telemetry.rate_limiter import AdaptiveRateLimiter
+from idrac_telemetry.redfish_cache import add_cache_arguments, cache_from_arguments
 
 warnings.filterwarnings("ignore")
 #logging.getLogger().setLevel(logging.INFO)  # Change to logging.DEBUG for detailed logs
@@ -37,12 +47,20 @@ parser.add_argument('-u', help='iDRAC username, argument only required if config
 parser.add_argument('-p', help='iDRAC password, argument only required if configuring one iDRAC', required=False)
 parser.add_argument('-s', help='Pass in the report status to be set. Possible values are Enabled/Disabled', default='Enabled', choices=['Enabled', 'Disabled'], required=False)
 parser.add_argument('-ss', help='Pass in the Telemetry Service state to be set. Possible values are Enabled/Disabled', default='Enabled', choices=['Enabled', 'Disabled'], required=False)
-parser.add_argument('-f', help='Pass in csv file name. If file is not located in same directory as script, pass in the full directory path with file name. NOTE: Make sure to use iDRACs.csv file from the repo which has the correct format.', required=False)
+parser.add_argument('-f', help='Pass in csv file name. If file is not located in same directory as script, pass in the full directory path with file name. NOTE: Make sure to use iDRACs.csv file from the repo which has the correct format. Also accepts YAML inventories and folders of CSV and YAML files, see --group and --shard to select iDRACs.', required=False)
 group = parser.add_mutually_exclusive_group(required=True)
 group.add_argument('-a', help='Enable/Disable all Metric Reports', action='store_true', required=False)
 group.add_argument('-n', help='Metric report name to delete. *Supports a comma delimted list', required=False)
+add_cache_arguments(parser)
+add_client_arguments(parser)
+add_journal_arguments(parser)
+add_inventory_arguments(parser)
 
 args = vars(parser.parse_args())
+redfish_cache = cache_from_arguments(args)
+# Pace the PATCHes to the iDRAC and stop sending them once it no longer answers
+rate_limiter = AdaptiveRateLimiter()
+circuit_breaker = CircuitBreaker()
 
 def print_examples():
     """
@@ -58,32 +76,37 @@ def print_examples():
         '\n\'EnableOrDisableTelemetryReports.py -s Disabled -f C:\Python39\iDRACs.csv, this example will disable Telemetry and all metric reports for all iDRACs in CSV file.\n')
 
 def set_service_state(ip, user, pwd, service_state):
-    # Enable and disable global telemetry service
-    url = 'https://{}/redfish/v1/TelemetryService'.format(ip)
-    headers = {'content-type': 'application/json'}
-    response = requests.patch(url, data=json.dumps({"ServiceEnabled": service_state=='Enabled'}), headers=headers,
-                              verify=False, auth=(user, pwd))
+    """Enables or disables the global telemetry service, returns False when the iDRAC refused it"""
+    uri = '/redfish/v1/TelemetryService'
+    try:
+        response = request('patch', Host(ip, user, pwd), uri, rate_limiter, circuit_breaker,
+                           data=json_codec.dumps({"ServiceEnabled": service_state=='Enabled'}))
+    except (requests.RequestException, HostUnavailable) as e:
+        logging.error("- FAIL, unable to set {}: {}".format(uri, e))
+        return False
+    redfish_cache.invalidate(ip, uri, recursive=False)
     if response.status_code != 200:
-        logging.error("- FAIL, status code for reading attributes is not 200, code is: {}".format(response.status_code))
+        logging.error("- FAIL, status code for setting {} is not 200, code is: {}".format(uri, response.status_code))
         logging.debug(str(response))
-        sys.exit() 
+        return False
 
     logging.info("- INFO, successfully '{}' iDRAC Telemetry".format(service_state))
+    return True
 
 def get_attributes(ip, user, pwd):
     """ Checks the current status of telemetry and creates telemetry_attributes, a list of telemetry attributes
     """
     global telemetry_attributes
     # Use redfish API instead of AR
-    url = 'https://{}/redfish/v1/TelemetryService/MetricReportDefinitions'.format(ip)
     headers = {'content-type': 'application/json'}
-    response = requests.get(url, headers=headers, verify=False, auth=(user, pwd))
+    response = redfish_cache.get(ip, '/redfish/v1/TelemetryService/MetricReportDefinitions', (user, pwd),
+                                 headers=headers)
     if response.status_code != 200:
         logging.error("- FAIL, status code for reading attributes is not 200, code is: {}".format(response.status_code))
         sys.exit()
     try:
         logging.info("- INFO, successfully pulled configuration attributes")
-        configurations_dict = json.loads(response.text)
+        configurations_dict = json_codec.loads(response.text)
         attributes = configurations_dict.get('Members', {})
         telemetry_attributes = [map['@odata.id'] for map in attributes]
         logging.debug(telemetry_attributes)
@@ -99,48 +122,180 @@ def set_attributes_all(ip, user, pwd, service_state):
         telemetry_attributes (list): A list containing all telemetry attributes attributes 
     """
 
-    # Enable Telemetry Service before enabling metric reports
-    if service_state == 'Enabled':
-        set_service_state(ip, user, pwd, service_state)
+    # Enable Telemetry Service before enabling metric reports, reports of a disabled service are not sent
+    if service_state == 'Enabled' and not set_service_state(ip, user, pwd, service_state):
+        sys.exit(1)
 
     status_to_set = args["s"]
-    headers = {'content-type': 'application/json'}
+    host = Host(ip, user, pwd)
+    failed = []
     # Go to each metric report definition and enable or disable based on input
     for uri in telemetry_attributes:
-        url = 'https://{}{}'.format(ip,uri)
-        response = requests.patch(url, data=json.dumps({"MetricReportDefinitionEnabled": status_to_set=='Enabled'}), headers=headers,
-                              verify=False, auth=(user, pwd))
+        try:
+            response = request('patch', host, uri, rate_limiter, circuit_breaker,
+                               data=json_codec.dumps({"MetricReportDefinitionEnabled": status_to_set=='Enabled'}))
+        except (requests.RequestException, HostUnavailable) as e:
+            logging.error("- FAIL, unable to set {}: {}".format(uri, e))
+            failed.append(uri)
+            continue
+        redfish_cache.invalidate(ip, uri)
+        if response.status_code != 200:
+            logging.error("- FAIL, status code for setting {} is not 200, code is: {}".format(uri, response.status_code))
+            failed.append(uri)
     
     # Disable Telemetry Service after disabling metric reports
-    if service_state == 'Disabled':
-        set_service_state(ip, user, pwd, service_state)
+    service_failed = service_state == 'Disabled' and not set_service_state(ip, user, pwd, service_state)
 
+    if failed:
+        logging.error("- FAIL, {} of {} metric reports could not be '{}'".format(len(failed), len(telemetry_attributes),
+                                                                               status_to_set))
+    if failed or service_failed:
+        sys.exit(1)
     logging.info("- INFO, successfully '{}' iDRAC Telemetry and all supported metric reports".format(status_to_set))
 
 def set_attributes(ip, user, pwd, reports, service_state):
-    """Uses the RedFish API to set the telemetry enabled attribute to user defined status.
+    """Uses the RedFish API to set the telemetry enabled attribute of the comma separated reports to user defined
+    status.
     """
     status_to_set = args["s"]
-    headers = {'content-type': 'application/json'}
 
-    # Enable Telemetry Service before enabling metric reports
-    if service_state == 'Enabled':
-        set_service_state(ip, user, pwd, service_state)
+    # Enable Telemetry Service before enabling metric reports, reports of a disabled service are not sent
+    if service_state == 'Enabled' and not set_service_state(ip, user, pwd, service_state):
+        sys.exit(1)
 
-    reports_list = map(str.strip, reports.split(','))
+    host = Host(ip, user, pwd)
+    reports_list = [report.strip() for report in reports.split(',')]
+    failed = []
     for report in reports_list:
-        url = 'https://{}/redfish/v1/TelemetryService/MetricReportDefinitions/{}'.format(ip, report)
-        response = requests.patch(url, data=json.dumps({"MetricReportDefinitionEnabled": status_to_set=='Enabled'}), headers=headers,
-                    verify=False, auth=(user, pwd))
+        uri = '/redfish/v1/TelemetryService/MetricReportDefinitions/{}'.format(report)
+        try:
+            response = request('patch', host, uri, rate_limiter, circuit_breaker,
+                               data=json_codec.dumps({"MetricReportDefinitionEnabled": status_to_set=='Enabled'}))
+        except (requests.RequestException, HostUnavailable) as e:
+            logging.error("- FAIL, unable to set metric report {}: {}".format(report, e))
+            failed.append(report)
+            continue
+        redfish_cache.invalidate(ip, uri)
         if response.status_code != 200:
-            logging.error("- FAIL, status code for is not 200, code is: {}".format(response.status_code))
+            logging.error("- FAIL, status code for setting metric report {} is not 200, code is: {}".format(
+                report, response.status_code))
             logging.error(response.text)
+            failed.append(report)
         else:
             logging.info("- INFO, successfully '{}' metric reports {}".format(status_to_set, report))
     
+    # Disable Telemetry Service after disabling metric reports
+    service_failed = service_state == 'Disabled' and not set_service_state(ip, user, pwd, service_state)
+
+    if failed:
+        logging.error("- FAIL, {} of {} metric reports could not be '{}': {}".format(
+            len(failed), len(reports_list), status_to_set, ", ".join(failed)))
+    if failed or service_failed:
+        sys.exit(1)
+
+async def set_attributes_on_host(client, host, reports, status_to_set, service_state, journal=None):
+    """Enables or disables Telemetry and the metric reports of one iDRAC of the CSV file, all reports when reports is
+    None. Returns the list of error messages, empty when everything was set. With a journal every PATCH is a step,
+    steps which succeeded in an earlier run are skipped.
+    """
+    errors = []
+
+    async def patch(uri, payload):
+        step = "PATCH {} {}".format(uri, json_codec.dumps(payload, 'compact'))
+        if journal is not None and journal.done(host.ip, step):
+            return
+        error = None
+        try:
+            response = await client.patch(host, uri, payload)
+            # The cache removes files, which must not block the PATCHes of the other iDRACs
+            await asyncio.get_running_loop().run_in_executor(None, lambda: redfish_cache.invalidate(
+                host.ip, uri, recursive=False))
+            if response.status_code != 200:
+                error = "status code for setting {} is not 200, code is: {}".format(uri, response.status_code)
+        except (RedfishConnectionError, HostUnavailable) as e:
+            error = str(e)
+        if error:
+            errors.append(error)
+        if journal is not None:
+            journal.record(host.ip, step, not error, error)
+
+    service_uri = '/redfish/v1/TelemetryService'
+    # Enable Telemetry Service before enabling metric reports
+    if service_state == 'Enabled':
+        await patch(service_uri, {"ServiceEnabled": True})
+        if errors:
+            return errors  # reports of a disabled Telemetry Service are not sent
+    if reports is None:
+        collection_uri = '/redfish/v1/TelemetryService/MetricReportDefinitions'
+        try:
+            response = await client.get(host, collection_uri)
+            if response.status_code != 200:
+                raise RuntimeError("status code for reading attributes is not 200, code is: {}".format(
+                    response.status_code))
+            uris = [member['@odata.id'] for member in response.json().get('Members', [])]
+        except (RuntimeError, ValueError) as e:
+            if journal is not None:
+                journal.record(host.ip, "GET " + collection_uri, False, str(e))
+            return errors + [str(e)]
+        if journal is not None:
+            journal.record(host.ip, "GET " + collection_uri, True)
+    else:
+        uris = ['/redfish/v1/TelemetryService/MetricReportDefinitions/{}'.format(report.strip())
+                for report in reports.split(',')]
+    # The client limits the concurrent PATCHes per iDRAC
+    await asyncio.gather(*(patch(uri, {"MetricReportDefinitionEnabled": status_to_set == 'Enabled'}) for uri in uris))
     # Disable Telemetry Service after disabling metric reports
     if service_state == 'Disabled':
-        set_service_state(ip, user, pwd, service_state)
+        await patch(service_uri, {"ServiceEnabled": False})
+    if journal is not None and not errors:
+        journal.record(host.ip, HOST_DONE, True)
+    return errors
+
+
+def set_attributes_from_file(file_name, reports):
+    """Sets the reports of all iDRACs of a CSV file from one event loop"""
+    try:
+        hosts = list(hosts_from_arguments(args, file_name))
+    except OSError:
+        logging.error("\n- ERROR, unable to locate file %s" % file_name)
+        sys.exit(0)
+    except ValueError as e:
+        logging.error("\n- ERROR, %s" % e)
+        sys.exit(1)
+    try:
+        journal = journal_from_arguments(args, "EnableOrDisableTelemetryReports -s {} -ss {} {}".format(
+            args["s"], args["ss"], "-a" if reports is None else "-n " + reports))
+    except (OSError, ValueError) as e:
+        logging.error("- ERROR, %s" % e)
+        sys.exit(1)
+    all_hosts = hosts
+    if journal is not None and args["resume"]:
+        hosts = [host for host in hosts if not journal.done(host.ip)]
+        logging.info("- INFO, resuming, %d of %d iDRACs are already done" % (len(all_hosts) - len(hosts),
+                                                                           len(all_hosts)))
+    results = run_on_hosts(hosts, lambda client, host: set_attributes_on_host(client, host, reports, args["s"],
+                                                                            args["ss"], journal),
+                           client_from_arguments(args))
+    failed = 0
+    for host, errors in zip(hosts, results):
+        if isinstance(errors, Exception):
+            errors = [str(errors)]
+            if journal is not None:
+                journal.record(host.ip, 'run', False, errors[0])
+        if errors:
+            failed += 1
+            for error in errors:
+                logging.error("- FAIL, iDRAC %s: %s" % (host.ip, error))
+        else:
+            logging.info("- INFO, successfully '%s' iDRAC Telemetry and %s on iDRAC %s" % (
+                args["s"], "all supported metric reports" if reports is None else "metric reports " + reports,
+                host.ip))
+    logging.info("- INFO, %d of %d iDRACs set, %d failed" % (len(hosts) - failed, len(hosts), failed))
+    if journal is not None:
+        failed = not journal.log_summary([host.ip for host in all_hosts])
+        journal.close()
+    if failed:
+        sys.exit(1)
 
 if __name__ == "__main__":
     if args["script_examples"]:
@@ -151,19 +306,6 @@ if __name__ == "__main__":
     elif args["ip"] and args["u"] and args["p"] and args["s"] and args["n"]:
         set_attributes(args["ip"], args["u"], args["p"], args["n"], args["ss"])
     elif args["s"] and args["f"] and (args["a"] or args["n"]):
-        try:
-            open_csv_file = open(args["f"], encoding='UTF8')
-        except:
-            logging.error("\n- ERROR, unable to locate file %s" % args["f"])
-            sys.exit(0)
-        csv_reader = csv.reader(open_csv_file)
-        next(csv_reader)
-        for line in csv_reader:
-            logging.info("\n- %s Telemetry attributes for iDRAC %s -\n" % (args["s"], line[0]))
-            if args["a"]:
-                get_attributes(line[0], line[1], line[2])
-                set_attributes_all(line[0], line[1], line[2], args["ss"])
-            elif args["n"]:
-                set_attributes(line[0], line[1], line[2], args["n"], args["ss"])
+        set_attributes_from_file(args["f"], None if args["a"] else args["n"])
     else:
         logging.warning("- WARNING, missing or incorrect arguments passed in for executing script")
@@ -18,7 +18,6 @@
 #
 
 import argparse
-import json
 import logging
 import os
 import re
@@ -29,6 +28,9 @@ from datetime import datetime, timedelta
 
 import requests
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from idrac_telemetry import json_codec
+
 warnings.filterwarnings("ignore")
 logging.getLogger().setLevel(logging.INFO)  # Change to logging.DEBUG for detailed logs
 
@@ -57,7 +59,7 @@ def export_server_configuration_profile():
     payload = {"ExportFormat": "JSON", "ShareParameters": {"Target": "IDRAC"}, "ExportUse": 'Default',
                "IncludeInExport": "Default"}
     headers = {'content-type': 'application/json'}
-    response = requests.post(url, data=json.dumps(payload), headers=headers, verify=False,
+    response = requests.post(url, data=json_codec.dumps(payload), headers=headers, verify=False,
                              auth=(idrac_username, idrac_password))
     if response.status_code != 202:
         logging.error("FAIL, status code for SCP export is not 202, code is: {}".format(response.status_code))
@@ -79,7 +81,7 @@ def save_configurations(configurations):
         json_file_name = args["filename"]
         logging.info("Saving the Telemetry configurations as '{}' in the folder {}".format(json_file_name, os.getcwd()))
         with open(json_file_name, "w") as file:
-            file.write(json.dumps(configurations))
+            file.write(json_codec.dumps(configurations))
     except Exception as e:
         logging.exception("Unable to save the Telemetry configuration as JSON file. the Exception is {}".format(str(e)))
 
@@ -91,7 +93,7 @@ def download_scp():
         logging.error(
             "FAIL, status code while getting the SCP content is not 200, code is: {}".format(response.status_code))
         sys.exit()
-    scp_content = json.loads(response.content.decode())
+    scp_content = json_codec.loads(response.content)
     components = scp_content.get('SystemConfiguration', {}).get('Components', list(dict()))[0].get('Attributes', dict())
     telemetry_componenets = list(filter(lambda x: re.search('Telemetry', x.get('Name'), re.IGNORECASE), components))
     if not telemetry_componenets:
@@ -108,9 +110,9 @@ def loop_job_status():
         status_code = response.status_code
         if status_code != 200:
             logging.error("FAIL, Command failed to check job status, return code is {}".format(status_code))
-            logging.debug("Extended Info Message: {0}".format(response.json()))
+            logging.debug("Extended Info Message: {0}".format(json_codec.loads(response.content)))
             sys.exit()
-        data = response.json()
+        data = json_codec.loads(response.content)
         if datetime.now() > (start_time + timedelta(minutes=5)):
             logging.error("FAIL: Timeout of 5 minutes has been hit, script stopped")
             sys.exit()
@@ -18,13 +18,17 @@
 
 import argparse
 import csv
-import json
 import logging
+import os
 import sys
 import warnings
-import requests
 from urllib.parse import urlparse
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from idrac_telemetry import json_codec
+from idrac_telemetry.metric_schema import SchemaRegistry
+from idrac_telemetry.redfish_cache import add_cache_arguments, cache_from_arguments
+
 warnings.filterwarnings("ignore")
 #logging.getLogger().setLevel(logging.INFO)  # Change to logging.DEBUG for detailed logs
 logging.basicConfig(format='%(message)s', stream=sys.stdout, level=logging.INFO)
@@ -37,8 +41,13 @@ parser.add_argument('-p', help='iDRAC password, argument only required if config
 group = parser.add_mutually_exclusive_group(required=True)
 group.add_argument('-r', help='Export metric reports only', action='store_true', required=False)
 group.add_argument('-m', help='Export metric reports with metrics', action='store_true', required=False)
+parser.add_argument('--schema-folder', help='Also save the MetricIds of all reports as metric schema of the firmware '
+                    'version of the iDRAC to this folder, for --schema-folder of TelemetryRsysLogProcessor.py',
+                    required=False)
+add_cache_arguments(parser)
 
 args = vars(parser.parse_args())
+redfish_cache = cache_from_arguments(args)
 
 def print_examples():
     """
@@ -46,25 +55,27 @@ def print_examples():
     """
     print(
         '\n\'GetTelemetryReports.py -ip 192.168.0.120 -u root -p calvin -r, this example will export all metric reports for single iDRAC to GetTelemetryReports.csv\n'
-        '\n\'GetTelemetryReports.py -ip 192.168.0.120 -u root -p calvin -m, this example will export all metric reports and metrics for single iDRAC to GetTelemetryReports.csv\n')
+        '\n\'GetTelemetryReports.py -ip 192.168.0.120 -u root -p calvin -m, this example will export all metric reports and metrics for single iDRAC to GetTelemetryReports.csv\n'
+        '\n\'GetTelemetryReports.py -ip 192.168.0.120 -u root -p calvin -r --schema-folder /var/lib/idrac-telemetry/schemas, this example will also save the metric schema of the firmware version of the iDRAC\n')
 
-def get_reports(ip, user, pwd, export_reports, export_metrics):
+def get_reports(ip, user, pwd, export_reports, export_metrics, schema_folder=None):
     """ Checks the current status of telemetry and creates telemetry_attributes, a list of telemetry attributes
     """
     global telemetry_attributes
     output = []
     # Use redfish API instead of AR
-    url = 'https://{}/redfish/v1/TelemetryService/MetricReportDefinitions'.format(ip)
     headers = {'content-type': 'application/json'}
-    response = requests.get(url, headers=headers, verify=False, auth=(user, pwd))
+    response = redfish_cache.get(ip, '/redfish/v1/TelemetryService/MetricReportDefinitions', (user, pwd),
+                                 headers=headers)
     if response.status_code != 200:
         logging.error("- FAIL, status code for reading attributes is not 200, code is: {}".format(response.status_code))
         sys.exit()
     try:
         logging.info("- INFO, successfully pulled configuration attributes")
-        configurations_dict = json.loads(response.text)
+        configurations_dict = json_codec.loads(response.text)
         attributes = configurations_dict.get('Members', {})
         telemetry_attributes = [map['@odata.id'] for map in attributes]
+        definitions = {}
         for report in telemetry_attributes:
             row = []
             report_name = urlparse(report).path.split('/')[-1]
@@ -72,16 +83,16 @@ def get_reports(ip, user, pwd, export_reports, export_metrics):
                 row.append(report_name)
                 output.append(row)
             #logging.info(row)
-            if export_metrics:
-                url_detail = 'https://{}{}'.format(ip, report)
-                response_detail = requests.get(url_detail, headers=headers, verify=False, auth=(user, pwd))
+            if export_metrics or schema_folder:
+                response_detail = redfish_cache.get(ip, report, (user, pwd), headers=headers)
                 if response_detail.status_code != 200:
                     logging.error("- FAIL, status code for reading attributes is not 200, code is: {}".format(response_detail.status_code))
                     sys.exit()
                 try:
-                    response_detail_json = json.loads(response_detail.text)
+                    response_detail_json = json_codec.loads(response_detail.text)
                     metrics = response_detail_json.get('Metrics', {})
-                    for metric in metrics:
+                    definitions[report_name] = [metric.get('MetricId') for metric in metrics if metric.get('MetricId')]
+                    for metric in metrics if export_metrics else []:
                         row_detail = []
                         row_detail.append(report_name)
                         row_detail.append(metric.get('MetricId'))
@@ -92,6 +103,8 @@ def get_reports(ip, user, pwd, export_reports, export_metrics):
                     logging.error("- FAIL: detailed error message: {0}".format(e))
                     sys.exit()
 
+        if schema_folder:
+            save_schema(ip, user, pwd, definitions, schema_folder)
         logging.info(output)
         with open('GetTelemetryReports.csv', mode='w', newline='') as csv_file:
             csv_writer = csv.writer(csv_file, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
@@ -103,11 +116,32 @@ def get_reports(ip, user, pwd, export_reports, export_metrics):
         logging.error("- FAIL: detailed error message: {0}".format(e))
         sys.exit()
 
+def save_schema(ip, user, pwd, definitions, schema_folder):
+    """ Saves the MetricIds of the reports as metric schema of the firmware version of the iDRAC, for its IP address
+    and the host name its Rsyslog messages are tagged with
+    """
+    headers = {'content-type': 'application/json'}
+    # Revalidated on every run, the firmware version changes with an update
+    response = redfish_cache.get(ip, '/redfish/v1/Managers/iDRAC.Embedded.1', (user, pwd), ttl=0, headers=headers)
+    if response.status_code != 200:
+        logging.error("- FAIL, status code for reading the firmware version is not 200, code is: {}".format(
+            response.status_code))
+        sys.exit()
+    firmware = json_codec.loads(response.text).get('FirmwareVersion')
+    hosts = [ip]
+    response = redfish_cache.get(ip, '/redfish/v1/Managers/iDRAC.Embedded.1/EthernetInterfaces/NIC.1', (user, pwd),
+                                 headers=headers)
+    if response.status_code == 200 and json_codec.loads(response.text).get('HostName'):
+        hosts.append(json_codec.loads(response.text)['HostName'])
+    schema = SchemaRegistry(schema_folder).snapshot(hosts, firmware, definitions)
+    logging.info("- INFO, saved metric schema {} of {} reports for {}".format(schema.id, len(definitions),
+                                                                             ", ".join(hosts)))
+
 if __name__ == "__main__":
     if args["script_examples"]:
         print_examples()
     elif args["ip"] and args["u"] and args["p"]:
-        get_reports(args["ip"], args["u"], args["p"], args["r"], args["m"])
+        get_reports(args["ip"], args["u"], args["p"], args["r"], args["m"], args["schema_folder"])
     else:
         logging.warning("- WARNING, missing or incorrect arguments passed in for executing script")
 
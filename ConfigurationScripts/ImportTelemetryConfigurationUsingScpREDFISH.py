@@ -18,7 +18,6 @@
 #
 
 import argparse
-import json
 import logging
 import os
 import re
@@ -29,6 +28,9 @@ from datetime import datetime, timedelta
 
 import requests
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from idrac_telemetry import json_codec
+
 warnings.filterwarnings("ignore")
 logging.getLogger().setLevel(logging.INFO)  # Change to logging.DEBUG for detailed logs
 
@@ -58,7 +60,7 @@ def load_telemetry_configurations():
         json_file_name = args["filename"]
         logging.info("Saving the Telemetry configurations as '{}' in the folder {}".format(json_file_name, os.getcwd()))
         with open(json_file_name, "r") as file:
-            data = json.load(file)
+            data = json_codec.loads(file.read())
     except Exception as e:
         logging.exception("Unable to save the Telemetry configuration as JSON file. the Exception is {}".format(str(e)))
         sys.exit()
@@ -69,9 +71,9 @@ def load_telemetry_configurations():
 def import_server_configuration_profile():
     global job_id
     url = 'https://%s/redfish/v1/Managers/iDRAC.Embedded.1/Actions/Oem/EID_674_Manager.ImportSystemConfiguration' % idrac_ip
-    payload = {"ImportBuffer": json.dumps(configuration_profile), "ShareParameters": {"Target": "IDRAC"}}
+    payload = {"ImportBuffer": json_codec.dumps(configuration_profile), "ShareParameters": {"Target": "IDRAC"}}
     headers = {'content-type': 'application/json'}
-    response = requests.post(url, data=json.dumps(payload), headers=headers, verify=False,
+    response = requests.post(url, data=json_codec.dumps(payload), headers=headers, verify=False,
                              auth=(idrac_username, idrac_password))
     if response.status_code != 202:
         logging.error("FAIL, status code for SCP import is not 202, code is: {}".format(response.status_code))
@@ -96,9 +98,9 @@ def loop_job_status():
         status_code = response.status_code
         if status_code != 200:
             logging.error("FAIL, Command failed to check job status, return code is {}".format(status_code))
-            logging.debug("Extended Info Message: {0}".format(response.json()))
+            logging.debug("Extended Info Message: {0}".format(json_codec.loads(response.content)))
             sys.exit()
-        data = response.json()
+        data = json_codec.loads(response.content)
         if datetime.now() > (start_time + timedelta(minutes=5)):
             logging.error("FAIL: Timeout of 5 minutes has been hit, script stopped")
             sys.exit()
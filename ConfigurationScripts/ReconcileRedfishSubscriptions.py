@@ -0,0 +1,126 @@
+#
+# ReconcileRedfishSubscriptions.py Python script using Redfish API to converge the Redfish subscriptions of many
+# iDRACs to a desired state.
+#
+#
+#
+# _version_ = 1.0
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+import argparse
+import logging
+import os
+import sys
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from idrac_telemetry import json_codec
+from idrac_telemetry.inventory import add_inventory_arguments, hosts_from_arguments
+from idrac_telemetry.subscriptions import ALL_GROUPS, SubscriptionReconciler
+
+warnings.filterwarnings("ignore")
+
+parser = argparse.ArgumentParser(description="Python script using Redfish to converge the Redfish subscriptions of "
+                                 "many iDRACs to a desired state")
+parser.add_argument('-f', help='CSV file of iDRACs with the columns iDRAC IP, Username, Password and an optional Group '
+                    'column. If file is not located in same directory as the script, pass in the full directory path '
+                    'with the file name. Also accepts YAML inventories and folders of CSV and YAML files',
+                    required=True)
+parser.add_argument('-s', help='JSON file with the desired subscriptions of each group, for example {"default": '
+                    '[{"Destination": "https://192.168.0.145", "Context": "LMEpzC"}]}, the subscriptions of "*" apply to the '
+                    'groups without their own. Protocol, SubscriptionType, EventTypes and EventFormatType default to a '
+                    'MetricReport push subscription', required=False)
+parser.add_argument('-d', help='Redfish listener destination address of the desired subscription of all iDRACs, '
+                    'instead of -s', required=False)
+parser.add_argument('-c', help='Context ID of the desired subscription given with -d', default='LMEpzC',
+                    required=False)
+parser.add_argument('--keep-unmanaged', help='Only add missing subscriptions, do not delete push subscriptions which '
+                    'are not desired', action='store_true')
+parser.add_argument('--dry-run', help='Only show the subscriptions which would be added and deleted',
+                    action='store_true')
+parser.add_argument('--workers', help='Number of iDRACs worked on at the same time', type=int, default=32)
+parser.add_argument('--timeout', help='Timeout in seconds of each Redfish request', type=int, default=30)
+parser.add_argument('--max-passes', help='Maximum number of passes applying changes', type=int, default=3)
+add_inventory_arguments(parser)
+parser.add_argument('script_examples', action="store_true",
+                    help="'python ReconcileRedfishSubscriptions.py -f iDRACs.csv -d https://192.168.0.145 -c LMEpzC' "
+                         "points all iDRACs of iDRACs.csv to the listener 192.168.0.145 and removes their other "
+                         "subscriptions. 'python ReconcileRedfishSubscriptions.py -f iDRACs.csv -s desired.json "
+                         "--dry-run' shows the changes needed to reach the subscriptions of desired.json")
+
+args = vars(parser.parse_args())
+logging.basicConfig(format='%(message)s', stream=sys.stdout, level=logging.INFO)
+
+
+def read_desired_groups():
+    if args["s"]:
+        try:
+            with open(args["s"], 'rb') as file:
+                groups = json_codec.loads(file.read())
+        except OSError as e:
+            logging.error("- ERROR, unable to read file {}: {}".format(args["s"], e))
+            sys.exit(1)
+        except ValueError as e:
+            logging.error("- ERROR, file {} is not valid JSON: {}".format(args["s"], e))
+            sys.exit(1)
+        if not isinstance(groups, dict) or not all(
+                isinstance(subscriptions, list) and all(isinstance(subscription, dict) for subscription in subscriptions)
+                for subscriptions in groups.values()):
+            logging.error("- ERROR, file {} must hold an object mapping each group to a list of subscription "
+                          "objects".format(args["s"]))
+            sys.exit(1)
+        return groups
+    if args["d"]:
+        return {ALL_GROUPS: [{"Destination": args["d"], "Context": args["c"]}]}
+    logging.error("- ERROR, pass in the desired subscriptions with -s or -d")
+    sys.exit(1)
+
+
+def log_plans(plans):
+    for plan in plans:
+        if plan.error:
+            logging.error("- FAIL, iDRAC {}: {}".format(plan.host.ip, plan.error))
+            continue
+        for subscription in plan.delete:
+            logging.info("- INFO, iDRAC {}: delete subscription {} to '{}' with context id '{}'".format(
+                plan.host.ip, subscription.get("Id"), subscription.get("Destination"), subscription.get("Context")))
+        for subscription in plan.add:
+            logging.info("- INFO, iDRAC {}: add subscription to '{}' with context id '{}'".format(
+                plan.host.ip, subscription["Destination"], subscription.get("Context")))
+
+
+if __name__ == "__main__":
+    try:
+        hosts = list(hosts_from_arguments(args, args["f"]))
+    except OSError:
+        logging.error("- ERROR, unable to locate file %s" % args["f"])
+        sys.exit(1)
+    except ValueError as e:
+        logging.error("- ERROR, %s" % e)
+        sys.exit(1)
+    try:
+        reconciler = SubscriptionReconciler(read_desired_groups(), workers=args["workers"],
+                                            delete_unmanaged=not args["keep_unmanaged"], timeout=args["timeout"],
+                                            max_passes=args["max_passes"])
+        plans = reconciler.reconcile(hosts, dry_run=args["dry_run"])
+    except ValueError as e:
+        logging.error("- ERROR, {}".format(e))
+        sys.exit(1)
+    log_plans(plans)
+    in_sync = sum(plan.in_sync for plan in plans)
+    if args["dry_run"]:
+        logging.info("- INFO, {} of {} iDRACs are in sync".format(in_sync, len(plans)))
+    elif in_sync == len(plans):
+        logging.info("- PASS, the subscriptions of all {} iDRACs are in sync".format(len(plans)))
+    else:
+        logging.error("- FAIL, {} of {} iDRACs did not converge".format(len(plans) - in_sync, len(plans)))
+        sys.exit(1)
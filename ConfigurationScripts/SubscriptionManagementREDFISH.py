@@ -20,17 +20,25 @@
 
 
 import argparse
-import json
+import asyncio
 import logging
 import os
 import platform
-import re
 import requests
 import sys
 import time
 import warnings
 from pprint import pprint
-from pprint import pformat
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from idrac_telemetry import json_codec
+from idrac_telemetry.async_redfish import AsyncRedfishClient
+from idrac_telemetry.hosts import Host
+from idrac_telemetry.ingest_queue import ReportPipeline, add_queue_arguments, queue_from_arguments
+from idrac_telemetry.metric_schema import add_schema_arguments, schemas_from_arguments
+from idrac_telemetry.publisher import add_publisher_arguments, publisher_from_arguments
+from idrac_telemetry.redfish_cache import add_cache_arguments, cache_from_arguments
+from idrac_telemetry.sse_collector import add_sse_arguments, collector_from_arguments
 
 warnings.filterwarnings("ignore")
 
@@ -62,7 +70,13 @@ parser.add_argument('--message-id', '-M', help='Pass in MessageID for sending te
                     required=False, dest='message_id')
 parser.add_argument('--delete', help='Pass in complete service subscription URI to delete. Execute -s argument if '
                     'needed to get subscription URIs', required=False)
+add_cache_arguments(parser)
+add_queue_arguments(parser)
+add_publisher_arguments(parser)
+add_schema_arguments(parser)
+add_sse_arguments(parser)
 args = vars(parser.parse_args())
+redfish_cache = cache_from_arguments(args)
 logging.basicConfig(format='%(message)s', stream=sys.stdout, level=logging.INFO)            
 
 def get_event_service_properties(idrac_ip: str, idrac_username: str, idrac_password: str):
@@ -116,7 +130,7 @@ def get_event_service_properties(idrac_ip: str, idrac_username: str, idrac_passw
     else:
         logging.error("- ERROR, GET request failed to get subscription details, status code %s returned" % response.status_code)
         sys.exit(0)
-    pprint(response.json())
+    pprint(json_codec.loads(response.content))
 
 
 def get_event_service_subscriptions(idrac_ip: str, idrac_username: str, idrac_password: str, subscription_detail: str):
@@ -132,7 +146,7 @@ def get_event_service_subscriptions(idrac_ip: str, idrac_username: str, idrac_pa
 
     response = requests.get('https://%s/redfish/v1/EventService/Subscriptions' % idrac_ip, verify=False,
                             auth=(idrac_username, idrac_password))
-    data = response.json()
+    data = json_codec.loads(response.content)
     if response.status_code != 200:
         logging.error("- ERROR, GET request failed to get subscription details, status code %s returned" % response.status_code)
         sys.exit(0)    
@@ -149,7 +163,7 @@ def get_event_service_subscriptions(idrac_ip: str, idrac_username: str, idrac_pa
                 logging.error("- ERROR, GET request failed to get subscription details, status code %s returned" % response.status_code)
                 sys.exit(0) 
             logging.info("- Detailed information for subscription %s\n" % subscription['@odata.id'])
-            pprint(response.json())
+            pprint(json_codec.loads(response.content))
             print("\n")
 
 
@@ -189,7 +203,7 @@ def scp_set_idrac_attribute(idrac_ip: str, idrac_username: str, idrac_password:
         "ImportBuffer": "<SystemConfiguration><Component FQDD=\"iDRAC.Embedded.1\"><Attribute Name=\"IPMILan.1#AlertEnable\">Enabled</Attribute></Component></SystemConfiguration>",
         "ShareParameters": {"Target": "All"}}
     headers = {'content-type': 'application/json'}
-    response = requests.post(url, data=json.dumps(payload), headers=headers, verify=False, auth=(idrac_username, idrac_password))
+    response = requests.post(url, data=json_codec.dumps(payload), headers=headers, verify=False, auth=(idrac_username, idrac_password))
     response_output = response.__dict__
     try:
         job_id = response_output["headers"]["Location"].split("/")[-1]
@@ -199,7 +213,7 @@ def scp_set_idrac_attribute(idrac_ip: str, idrac_username: str, idrac_password:
     logging.info("- PASS, job ID %s successfully created" % job_id)
     while True:
         response = requests.get('https://%s/redfish/v1/TaskService/Tasks/%s' % (idrac_ip, job_id), auth=(idrac_username, idrac_password), verify=False)
-        data = response.json()
+        data = json_codec.loads(response.content)
         message_string = data["Messages"]
         final_message_string = str(message_string)
         if response.status_code == 202 or response.status_code == 200:
@@ -246,8 +260,9 @@ def get_set_ipmi_alert_idrac_setting(idrac_ip: str, idrac_username: str, idrac_p
     :param idrac_password: Password of the target iDRAC
     """
 
-    response = requests.get('https://%s/redfish/v1/Managers/iDRAC.Embedded.1/Attributes' % idrac_ip, verify=False, auth=(idrac_username, idrac_password))
-    data = response.json()
+    attributes_uri = '/redfish/v1/Managers/iDRAC.Embedded.1/Attributes'
+    response = redfish_cache.get(idrac_ip, attributes_uri, (idrac_username, idrac_password))
+    data = json_codec.loads(response.content)
     if response.status_code != 200:
             logging.error("- ERROR, GET command failed to get iDRAC attributes, status code %s returned" % status_code)
             sys.exit(0)
@@ -269,16 +284,16 @@ def get_set_ipmi_alert_idrac_setting(idrac_ip: str, idrac_username: str, idrac_p
             payload = {"Attributes": {"IPMILan.1.AlertEnable": "Enabled"}}
             headers = {'content-type': 'application/json'}
             url = 'https://%s/redfish/v1/Managers/iDRAC.Embedded.1/Attributes' % idrac_ip
-            response = requests.patch(url, data=json.dumps(payload), headers=headers, verify=False, auth=(idrac_username, idrac_password))
+            response = requests.patch(url, data=json_codec.dumps(payload), headers=headers, verify=False, auth=(idrac_username, idrac_password))
+            redfish_cache.invalidate(idrac_ip, attributes_uri)
             status_code = response.status_code
             if status_code == 200:
                 logging.info("- PASS, PATCH command succeeded and set iDRAC attribute \"IPMILan.1.AlertEnable\" to enabled")
             else:
                 logging.error("FAIL. PATCH command failed to set iDRAC attribute \"IPMILan.1.AlertEnable\" to enabled")
                 sys.exit(0)
-            response = requests.get('https://%s/redfish/v1/Managers/iDRAC.Embedded.1/Attributes' % idrac_ip,
-                                    verify=False, auth=(idrac_username, idrac_password))
-            data = response.json()
+            response = redfish_cache.get(idrac_ip, attributes_uri, (idrac_username, idrac_password))
+            data = json_codec.loads(response.content)
             attributes_dict = data['Attributes']
             if attributes_dict["IPMILan.1.AlertEnable"] == "Enabled":
                 logging.info("- PASS, iDRAC attribute \"IPMILan.1.AlertEnable\" successfully set to Enabled")
@@ -311,7 +326,7 @@ def create_post_subscription(idrac_ip: str, idrac_username: str, idrac_password:
     headers = {'content-type': 'application/json'}
     payload = {"Destination": destination_url, "EventTypes": [event_type], "Context": "root", "Protocol": "Redfish",
                "EventFormatType": format_type}
-    response = requests.post(url, data=json.dumps(payload), headers=headers, verify=False,
+    response = requests.post(url, data=json_codec.dumps(payload), headers=headers, verify=False,
                              auth=(idrac_username, idrac_password))
     if response.__dict__["status_code"] == 201:
         logging.info("- PASS, POST command passed to create new subscription")
@@ -338,19 +353,39 @@ def launch_sse_subscription(idrac_ip: str, idrac_username: str, idrac_password:
             os.system("gnome-terminal --command=\"bash -c 'python3 SubscriptionManagementREDFISH.py -ip %s -u %s -p %s --create-sse-subscription; $SHELL'\"" % (idrac_ip, idrac_username, idrac_password))
 def create_sse_subscription(idrac_ip: str, idrac_username: str, idrac_password: str):
     """
-    Creates an SSE subscription to the iDRAC. It will print all output to console in the foreground.
+    Creates an SSE subscription to the iDRAC. It will print all output to console in the foreground, or publish the
+    reports to a broker with --publish. A broken stream is opened again, resuming from the last event received.
 
     :param idrac_ip: IP address of the target iDRAC
     :param idrac_username: Username of the target iDRAC
     :param idrac_password: Password of the target iDRAC
     """
+    try:
+        publisher = publisher_from_arguments(args, schemas_from_arguments(args))
+    except (RuntimeError, ValueError, OSError) as e:
+        logging.error("- FAIL, %s" % e)
+        sys.exit(1)
     print("\n- INFO, starting SSE client, this may take a few seconds")
-    messages = SSEClient("https://%s/redfish/v1/SSE?$filter=EventFormatType eq MetricReport" % idrac_ip,
-                         headers={'content-type': 'application/json'},
-                         verify=False,
-                         auth=(idrac_username, idrac_password))
-    for sse_event in messages:
-        pprint(sse_event.data)
+    # Reports are printed by a separate thread, a slow console fills the bounded queue instead of stalling the
+    # SSE connection. A full queue with the block policy only pauses the reading of the stream, not the event loop
+    if publisher is None:
+        sink = lambda report_id, data: pprint(data.decode('utf-8'))
+    else:
+        sink = lambda report_id, data: publisher.publish(idrac_ip, data)
+    pipeline = ReportPipeline(queue_from_arguments(args), sink, stats_interval=args["queue_stats_interval"])
+
+    async def collect():
+        async with AsyncRedfishClient() as client:
+            collector = collector_from_arguments(args, client,
+                                                 lambda host, report_id, data: pipeline.submit_async(report_id, data))
+            await collector.run([Host(idrac_ip, idrac_username, idrac_password)])
+
+    try:
+        asyncio.run(collect())
+    finally:
+        pipeline.close()
+        if publisher is not None:
+            publisher.close()
 
 
 
@@ -371,7 +406,7 @@ def submit_test_event(idrac_ip: str, idrac_username: str, idrac_password: str, d
                "MessageId": message_id}
     url = "https://%s/redfish/v1/EventService/Actions/EventService.SubmitTestEvent" % idrac_ip
     headers = {'content-type': 'application/json'}
-    response = requests.post(url, data=json.dumps(payload), headers=headers, verify=False,
+    response = requests.post(url, data=json_codec.dumps(payload), headers=headers, verify=False,
                              auth=(idrac_username, idrac_password))
     if response.__dict__["status_code"] == 204:
         logging.info("\n- PASS, POST command succeeded, status code %s returned, event type \"%s\" successfully sent to " 
@@ -403,9 +438,9 @@ if not args["script_examples"]:
 
 if args["create_sse_subscription"] or args["launch_sse_subscription"]:
     try:
-        from sseclient import SSEClient
+        import aiohttp
     except ModuleNotFoundError:
-        logging.warning("\n- WARNING, to use the SSE functionality you need the library sseclient. Install it with `pip install sseclient and execute script again `")
+        logging.warning("\n- WARNING, to use the SSE functionality you need the library aiohttp. Install it with `pip install aiohttp and execute script again `")
         sys.exit(0)
 
 
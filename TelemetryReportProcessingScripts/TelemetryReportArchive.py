@@ -0,0 +1,133 @@
+#
+# TelemetryReportArchive.py Python script to create, list and extract compressed archives of Telemetry reports.
+#
+#
+#
+# _version_ = 1.0
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+import argparse
+import glob
+import logging
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from idrac_telemetry import json_codec
+from idrac_telemetry.archive import ArchiveReader, ArchiveWriter, parse_timestamp
+from idrac_telemetry.metric_schema import add_schema_arguments, schemas_from_arguments
+
+logger = logging.getLogger('TelemetryReportArchive')
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Python script to create, list and extract compressed archives of "
+                                                 "Telemetry reports")
+    parser.add_argument('-a', help='Archive folder', required=True)
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument('--create-from', help='Add the JSON reports of a folder written by '
+                        'TelemetryRsysLogProcessor.py (<folder>/<iDRAC>/<report>.json) to the archive', required=False)
+    action.add_argument('--list', help='List the archived blocks matching the filters', action='store_true')
+    action.add_argument('--extract', help='Write the archived reports matching the filters as JSON files to this '
+                        'folder, in the layout of TelemetryRsysLogProcessor.py', required=False)
+    parser.add_argument('--report-id', help='Comma separated list of report Ids, for example PowerMetrics,CPUSensor',
+                        required=False)
+    parser.add_argument('--host', help='Comma separated list of iDRAC names', required=False)
+    parser.add_argument('--start', help='Only reports with a Timestamp at or after this ISO time, for example '
+                        '2022-05-10T12:00:00-05:00', required=False)
+    parser.add_argument('--end', help='Only reports with a Timestamp at or before this ISO time', required=False)
+    parser.add_argument('--block-reports', help='Number of reports per compressed block', type=int, default=256)
+    add_schema_arguments(parser)
+    parser.add_argument('script_examples', action="store_true",
+                        help="'python TelemetryReportArchive.py -a /tmp/archive --create-from /tmp/Rsyslogs' archives "
+                             "the reports saved under /tmp/Rsyslogs. 'python TelemetryReportArchive.py -a /tmp/archive "
+                             "--extract /tmp/power --report-id PowerMetrics --start 2022-05-10T00:00:00-05:00 --end "
+                             "2022-05-11T00:00:00-05:00' extracts the PowerMetrics reports of one day")
+    return vars(parser.parse_args(argv))
+
+
+def split_list(value):
+    return [item.strip() for item in value.split(',') if item.strip()] if value else None
+
+
+def parse_time_argument(value, name):
+    if value is None:
+        return None
+    seconds = parse_timestamp(value)
+    if seconds is None:
+        logger.error("- ERROR, {} '{}' is not an ISO time like 2022-05-10T12:00:00-05:00".format(name, value))
+        sys.exit(1)
+    return seconds
+
+
+def create_archive(archive_folder, source_folder, block_reports, schemas=None):
+    writer = ArchiveWriter(archive_folder, block_reports=block_reports, flush_interval=float('inf'), schemas=schemas)
+    for idrac_folder in sorted(glob.glob(os.path.join(source_folder, '*'))):
+        if not os.path.isdir(idrac_folder):
+            continue
+        for file_name in sorted(glob.glob(os.path.join(idrac_folder, '*.json'))):
+            try:
+                with open(file_name, 'rb') as file:
+                    writer.add(os.path.basename(idrac_folder), json_codec.loads(file.read()))
+            except (OSError, ValueError) as e:
+                logger.error("- ERROR, skipping '{}': {}".format(file_name, e))
+    writer.close()
+    statistics = writer.statistics
+    logger.info("- INFO, archived {} reports in {} blocks, {} bytes compressed to {} bytes ({:.1f}x)".format(
+        statistics['reports'], statistics['blocks'], statistics['raw_bytes'], statistics['compressed_bytes'],
+        statistics['raw_bytes'] / max(statistics['compressed_bytes'], 1)))
+
+
+def list_blocks(reader, filters):
+    total = 0
+    for entry in reader.blocks(**filters):
+        total += entry['count']
+        logger.info("{} offset {} {} bytes ({} raw): {} reports of {} from {} to {}".format(
+            entry['id'], entry['offset'], entry['length'], entry['raw_length'], entry['count'],
+            ", ".join(entry['hosts']), format_time(entry['start']), format_time(entry['end'])))
+    logger.info("- INFO, {} reports in the matching blocks".format(total))
+
+
+def extract_reports(reader, filters, output_folder):
+    extracted = 0
+    for host, report in reader.reports(**filters):
+        report_folder = os.path.join(output_folder, host)
+        os.makedirs(report_folder, exist_ok=True)
+        file_name = "_".join([report.get('Id', 'UnknownId'), report.get('ReportSequence', '00000'),
+                              report.get('Timestamp', '00000').replace(":", "-")]) + ".json"
+        with open(os.path.join(report_folder, file_name), 'w') as file:
+            file.write(json_codec.dumps(report))
+        extracted += 1
+    logger.info("- INFO, extracted {} reports to '{}'".format(extracted, output_folder))
+
+
+def format_time(seconds):
+    return datetime.fromtimestamp(seconds).astimezone().isoformat() if seconds is not None else '-'
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(message)s', stream=sys.stdout, level=logging.INFO)
+    args = parse_arguments()
+    source_folder = args["create_from"] or args["a"]
+    if not os.path.isdir(source_folder):
+        logger.error("- ERROR, folder '{}' does not exist".format(source_folder))
+        sys.exit(1)
+    if args["create_from"]:
+        create_archive(args["a"], args["create_from"], args["block_reports"], schemas_from_arguments(args))
+        sys.exit(0)
+    filters = {'report_ids': split_list(args["report_id"]), 'hosts': split_list(args["host"]),
+               'start': parse_time_argument(args["start"], '--start'), 'end': parse_time_argument(args["end"], '--end')}
+    archive_reader = ArchiveReader(args["a"])
+    if args["list"]:
+        list_blocks(archive_reader, filters)
+    else:
+        extract_reports(archive_reader, filters, args["extract"])
@@ -0,0 +1,128 @@
+#
+# TelemetryReportQuery.py Python script to query the MetricValues of saved Telemetry reports and archives through an
+# index by iDRAC, report Id, MetricId and time.
+#
+#
+#
+# _version_ = 1.0
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+import argparse
+import csv
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from idrac_telemetry import json_codec
+from idrac_telemetry.archive import parse_timestamp
+from idrac_telemetry.report_index import ReportIndex
+
+logger = logging.getLogger('TelemetryReportQuery')
+
+COLUMNS = ['host', 'report_id', 'timestamp', 'metric_id', 'context', 'value']
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Python script to query the MetricValues of saved Telemetry reports "
+                                                 "and archives. The index is updated with the new reports before "
+                                                 "each query")
+    parser.add_argument('-i', help='Index database file, created if needed', required=True)
+    parser.add_argument('-d', help='Comma separated list of report folders written by TelemetryRsysLogProcessor.py '
+                        '(<folder>/<iDRAC>/<report>.json)', required=False)
+    parser.add_argument('-a', help='Comma separated list of archive folders written by TelemetryReportArchive.py or '
+                        'TelemetryRsysLogProcessor.py --archive-folder', required=False)
+    parser.add_argument('--no-update', help='Query the index as it is, without looking for new reports',
+                        action='store_true')
+    parser.add_argument('--report-id', help='Comma separated list of report Ids, for example PowerMetrics,GPUMetrics',
+                        required=False)
+    parser.add_argument('--host', help='Comma separated list of iDRAC names', required=False)
+    parser.add_argument('--metric-id', help='Comma separated list of MetricIds, for example TemperatureReading',
+                        required=False)
+    parser.add_argument('--context', help='Only values whose ContextID or FQDD contains this text, for example '
+                        'Video.Slot.7', required=False)
+    parser.add_argument('--start', help='Only values with a Timestamp at or after this ISO time, for example '
+                        '2022-05-10T12:00:00-05:00', required=False)
+    parser.add_argument('--end', help='Only values with a Timestamp at or before this ISO time', required=False)
+    parser.add_argument('--format', help='Output format, default is csv', choices=['csv', 'jsonl'], default='csv')
+    parser.add_argument('--limit', help='Stop after this number of values', type=int, default=0)
+    parser.add_argument('--stats', help='Only print the number of indexed files, blocks, iDRACs and MetricIds',
+                        action='store_true')
+    parser.add_argument('script_examples', action="store_true",
+                        help="'python TelemetryReportQuery.py -i /tmp/reports.db -d /tmp/Rsyslogs --report-id "
+                             "GPUMetrics --metric-id TemperatureReading --host idrac-1679091 --start "
+                             "2022-05-10T00:00:00-05:00 --end 2022-05-11T00:00:00-05:00' prints the GPU temperatures of "
+                             "one iDRAC for one day. 'python TelemetryReportQuery.py -i /tmp/reports.db -a /tmp/archive "
+                             "--stats' indexes an archive and prints what it holds")
+    return vars(parser.parse_args(argv))
+
+
+def split_list(value):
+    return [item.strip() for item in value.split(',') if item.strip()] if value else None
+
+
+def parse_time_argument(value, name):
+    if value is None:
+        return None
+    seconds = parse_timestamp(value)
+    if seconds is None:
+        logger.error("- ERROR, {} '{}' is not an ISO time like 2022-05-10T12:00:00-05:00".format(name, value))
+        sys.exit(1)
+    return seconds
+
+
+def write_values(values, output_format, limit, output=sys.stdout):
+    """Writes the values as they are found, returns the number written"""
+    count = 0
+    if output_format == 'csv':
+        writer = csv.writer(output, lineterminator='\n')
+        writer.writerow(COLUMNS)
+    for value in values:
+        if output_format == 'csv':
+            writer.writerow(value)
+        else:
+            output.write(json_codec.dumps(dict(zip(COLUMNS, value)), 'compact') + '\n')
+        count += 1
+        if count == limit:
+            break
+    output.flush()
+    return count
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(message)s', stream=sys.stderr, level=logging.INFO)
+    args = parse_arguments()
+    index = ReportIndex(args["i"])
+    if not args["no_update"]:
+        started = time.monotonic()
+        try:
+            added = index.update(split_list(args["d"]) or (), split_list(args["a"]) or ())
+        except ValueError as e:
+            logger.error("- ERROR, {}".format(e))
+            sys.exit(1)
+        logger.info("- INFO, indexed {} new report files and blocks in {:.2f} seconds".format(
+            added, time.monotonic() - started))
+    if args["stats"]:
+        logger.info("- INFO, index holds {}".format(", ".join(
+            "{} {}".format(count, name) for name, count in sorted(index.statistics().items()))))
+        sys.exit(0)
+    started = time.monotonic()
+    try:
+        written = write_values(index.values(report_ids=split_list(args["report_id"]), hosts=split_list(args["host"]),
+                                            metric_ids=split_list(args["metric_id"]),
+                                            start=parse_time_argument(args["start"], '--start'),
+                                            end=parse_time_argument(args["end"], '--end'), context=args["context"]),
+                               args["format"], args["limit"])
+    except BrokenPipeError:  # output piped to head
+        sys.exit(0)
+    logger.info("- INFO, {} values in {:.3f} seconds".format(written, time.monotonic() - started))
+    index.close()
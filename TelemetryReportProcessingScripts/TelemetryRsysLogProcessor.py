@@ -17,43 +17,284 @@
 #
 import argparse
 import glob
-import json
 import logging
 import os
+import re
 import sys
 import threading
 import time
+from collections import OrderedDict
 from datetime import datetime
 from logging import handlers
 from pyparsing import *
 
-parser = argparse.ArgumentParser(description="Python script to reconstruct the Telemetry reports from Rsyslogfiles.")
-parser.add_argument('-s', help='Folder path to Rsyslog files. Example \'/var/log/**/*.log\'', required=True)
-parser.add_argument('-d', help='Destination folder where the JSON reports files to be saved.', default=os.getcwd(),
-                    required=False)
-parser.add_argument('script_examples', action="store_true",
-                    help="'python TelemetryRsysLogProcessor.py -s /var/log/**/*.log -d /tmp/Rsyslogs/' to process the Rsyslogfiles "
-                         "'from /var/log/**/ folder and save them under /tmp/Rsyslogs/'. The script will continue to execute and process all new messages.' "
-                         "Kill the scriot to stop processing. The log files will be rotated every day.")
-args = vars(parser.parse_args())
-
-LOG_PATH = os.path.join(os.getcwd(), '{}_{}.txt'.format('MultiThreadRsyslogProcessor_log',
-                                                        (datetime.now().strftime('%Y-%m-%d_%H-%M-%S'))))
-file_handler = logging.handlers.TimedRotatingFileHandler(filename=LOG_PATH, when='d', interval=1, backupCount=0,
-                                                         encoding=None, delay=False, utc=False, atTime=None)
-stdout_handler = logging.StreamHandler(sys.stdout)
-handlers = [file_handler, stdout_handler]
-logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s - %(message)s',
-                    handlers=handlers)  # set logging level to DEBUG to have complete processing logs
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from idrac_telemetry.aggregates import add_aggregate_arguments, aggregator_from_arguments
+from idrac_telemetry.analytics import add_analytics_arguments, detector_from_arguments
+from idrac_telemetry.archive import ArchiveWriter, parse_timestamp
+from idrac_telemetry.json_codec import FORMATS, LIBRARIES, JsonCodec
+from idrac_telemetry.metric_schema import add_schema_arguments, schemas_from_arguments
+from idrac_telemetry.profiling import add_profile_arguments, profiler_from_arguments
+from idrac_telemetry.publisher import add_publisher_arguments, publisher_from_arguments
+from idrac_telemetry.sequence_tracker import SequenceTracker
+from idrac_telemetry.spool import Spool
+
 logger = logging.getLogger('RsysLogProcessor')
 
-rsyslog_path = args["s"]
-destination_folder = args["d"]
+READERS = ['bytes', 'text']
+# Seconds the spool sink and the publisher get to finish once the processor is stopped
+STOP_TIMEOUT = 30
+RSYSLOG_HEADER = re.compile(rb'(\d+-\d+-\d+T\d+:\d+:\d+\.\d+[-+]\d+:\d+)\s+([A-Za-z0-9.-]+)\s+([A-Za-z0-9-]+):\s*'
+                            rb'#[A-Za-z]+#:(\d+)-(\d+)-(\d+):\s*')
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Python script to reconstruct the Telemetry reports from Rsyslogfiles.")
+    parser.add_argument('-s', help='Folder path to Rsyslog files. Example \'/var/log/**/*.log\'', required=True)
+    parser.add_argument('-d', help='Destination folder where the JSON reports files to be saved.', default=os.getcwd(),
+                        required=False)
+    parser.add_argument('--report-timeout', help='Seconds after which a report with missing chunks is dropped',
+                        type=int, default=300)
+    parser.add_argument('--reader', help='Read the Rsyslog files as raw bytes in large blocks or line by line as text '
+                        'with the pyparsing pattern', default='bytes', choices=READERS)
+    parser.add_argument('--json-library', help='JSON library used to decode and encode the reports, auto uses orjson '
+                        'or ujson when installed', default='auto', choices=LIBRARIES)
+    parser.add_argument('--json-format', help='Format of the saved JSON reports. default is the format written by the '
+                        'json module, compact drops the blanks and is faster to write', default='default',
+                        choices=FORMATS)
+    parser.add_argument('--spool-folder', help='Append the reconstructed reports to a write-ahead spool in this folder '
+                        'and save them from there, reports which were not saved yet survive a crash or a full disk',
+                        required=False)
+    parser.add_argument('--spool-fsync-interval', help='Seconds after which reports appended to the spool are '
+                        'written to disk with fsync', type=float, default=1.0)
+    parser.add_argument('--archive-folder', help='Save the reports to a compressed archive in this folder instead of '
+                        'one JSON file per report, see TelemetryReportArchive.py', required=False)
+    parser.add_argument('--sequence-state', help='File the ReportSequence of every iDRAC and report is kept in, to '
+                        'detect lost and duplicated reports across restarts. Duplicates are not saved',
+                        required=False)
+    parser.add_argument('--no-sequence-tracking', help='Do not check the ReportSequence of the reports',
+                        action='store_true')
+    add_analytics_arguments(parser)
+    add_aggregate_arguments(parser)
+    add_publisher_arguments(parser)
+    add_schema_arguments(parser)
+    add_profile_arguments(parser)
+    parser.add_argument('script_examples', action="store_true",
+                        help="'python TelemetryRsysLogProcessor.py -s /var/log/**/*.log -d /tmp/Rsyslogs/' to process the Rsyslogfiles "
+                             "'from /var/log/**/ folder and save them under /tmp/Rsyslogs/'. The script will continue to execute and process all new messages.' "
+                             "Kill the scriot to stop processing. The log files will be rotated every day.")
+    return vars(parser.parse_args(argv))
+
+
+def configure_logging():
+    log_path = os.path.join(os.getcwd(), '{}_{}.txt'.format('MultiThreadRsyslogProcessor_log',
+                                                            (datetime.now().strftime('%Y-%m-%d_%H-%M-%S'))))
+    file_handler = handlers.TimedRotatingFileHandler(filename=log_path, when='d', interval=1, backupCount=0,
+                                                     encoding=None, delay=False, utc=False, atTime=None)
+    stdout_handler = logging.StreamHandler(sys.stdout)
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s - %(message)s',
+                        handlers=[file_handler, stdout_handler])  # set logging level to DEBUG to have complete processing logs
+
+
+class RsyslogChunk(object):
+    """Header fields and payload of one Rsyslog line. The host and iDRAC names repeat on every line and are interned,
+    all chunks and pending reports of an iDRAC share one copy of them."""
+    __slots__ = ('time_stamp', 'host_name', 'idrac_name', 'index', 'chunks_count', 'chunk_id', 'message')
+
+    def __init__(self, time_stamp, host_name, idrac_name, index, chunks_count, chunk_id, message):
+        self.time_stamp = time_stamp
+        self.host_name = sys.intern(host_name)
+        self.idrac_name = sys.intern(idrac_name)
+        self.index = index
+        self.chunks_count = chunks_count
+        self.chunk_id = chunk_id
+        self.message = message
+
+
+class PendingReport(object):
+    __slots__ = ('chunks', 'chunks_count', 'time_stamp', 'updated')
+
+    def __init__(self, chunks_count, time_stamp, updated):
+        self.chunks = {}
+        self.chunks_count = chunks_count
+        self.time_stamp = time_stamp
+        self.updated = updated
+
+
+def seconds_between(first_time_stamp, second_time_stamp):
+    """Returns the absolute number of seconds between two Rsyslog time stamps, None if one can't be parsed"""
+    if first_time_stamp == second_time_stamp:
+        return 0
+    try:
+        return abs((datetime.fromisoformat(first_time_stamp) - datetime.fromisoformat(second_time_stamp)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class TelemetryReportAssembler(object):
+    """Reassembles Telemetry reports from their Rsyslog chunks.
+
+    Reports are keyed by (host name, iDRAC name, report index) so the chunks of reports sent by many iDRACs can be
+    interleaved in one Rsyslog file, and chunks of a report may arrive out of order or more than once. An iDRAC reuses
+    its report indexes once they wrap around, a chunk whose Rsyslog time stamp is more than epoch_window seconds away
+    from the report it matches starts a new report epoch and the stale one is dropped. Every chunk is handled in
+    constant time, the pending reports are kept in least recently updated order so expired ones are evicted from the
+    front. The assembler is thread safe so one instance can be shared by the threads following rotated files.
+    """
+
+    def __init__(self, timeout=300, epoch_window=60, max_pending=100000, completed_history=100000):
+        """
+        :param timeout: Seconds after which a report with missing chunks is dropped
+        :param epoch_window: Maximum seconds between the Rsyslog time stamps of chunks of the same report
+        :param max_pending: Maximum number of incomplete reports kept, the least recently updated ones are dropped
+        :param completed_history: Number of completed report keys remembered to drop late duplicate chunks
+        """
+        self.timeout = timeout
+        self.epoch_window = epoch_window
+        self.max_pending = max_pending
+        self.completed_history = completed_history
+        self.statistics = {'chunks': 0, 'completed': 0, 'duplicates': 0, 'expired': 0, 'superseded': 0}
+        self._pending = OrderedDict()
+        self._completed = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add_chunk(self, host_name, idrac_name, index, chunks_count, chunk_id, message, time_stamp):
+        """Adds a chunk and returns the payload of the report if the chunk completed it, None otherwise"""
+        key = (host_name, idrac_name, index)
+        now = time.monotonic()
+        with self._lock:
+            self.statistics['chunks'] += 1
+            self._expire(now)
+            pending = self._pending.get(key)
+            if pending is not None and not self._same_epoch(pending.time_stamp, time_stamp, pending.chunks_count,
+                                                            chunks_count):
+                logger.warning("Dropping incomplete report index {} of {} {}, the index was reused".format(
+                    index, host_name, idrac_name))
+                self.statistics['superseded'] += 1
+                del self._pending[key]
+                pending = None
+            if pending is None:
+                completed = self._completed.get(key)
+                if completed is not None and self._same_epoch(completed[0], time_stamp, completed[1], chunks_count):
+                    self.statistics['duplicates'] += 1
+                    return None
+                pending = self._pending[key] = PendingReport(chunks_count, time_stamp, now)
+            elif chunk_id in pending.chunks:
+                self.statistics['duplicates'] += 1
+                return None
+            else:
+                pending.updated = now
+                self._pending.move_to_end(key)
+            pending.chunks[chunk_id] = message
+            if len(pending.chunks) < pending.chunks_count:
+                return None
+            del self._pending[key]
+            self._completed[key] = (pending.time_stamp, pending.chunks_count)
+            if len(self._completed) > self.completed_history:
+                self._completed.popitem(last=False)
+            self.statistics['completed'] += 1
+        return "".join(pending.chunks[chunk] for chunk in sorted(pending.chunks))
+
+    def pending_count(self):
+        return len(self._pending)
+
+    def _same_epoch(self, first_time_stamp, second_time_stamp, first_chunks_count, second_chunks_count):
+        if first_chunks_count != second_chunks_count:
+            return False
+        seconds = seconds_between(first_time_stamp, second_time_stamp)
+        return seconds is not None and seconds <= self.epoch_window
+
+    def _expire(self, now):
+        while self._pending:
+            key, pending = next(iter(self._pending.items()))
+            if now - pending.updated <= self.timeout and len(self._pending) < self.max_pending:
+                break
+            logger.warning("Dropping incomplete report index {} of {} {}, received {} of {} chunks".format(
+                key[2], key[0], key[1], len(pending.chunks), pending.chunks_count))
+            self.statistics['expired'] += 1
+            del self._pending[key]
+
+
+class RsyslogFileReader(object):
+    """Reads the complete lines of a Rsyslog file as raw bytes in large blocks.
+
+    Lines are returned as memoryview slices of the block they were read in, so splitting a block into lines copies
+    nothing. A line is only valid until the next one is requested.
+    """
+
+    def __init__(self, filename, block_size=1048576, from_end=False):
+        self.filename = filename
+        self.block_size = block_size
+        self.file = open(filename, 'rb', buffering=0)
+        self.offset = os.fstat(self.file.fileno()).st_size if from_end else 0
+        self.file.seek(self.offset)
+        self._partial = b''
+
+    def read_lines(self, final=False):
+        """Yields the lines available up to the current end of the file, without the line break.
+
+        :param final: Also yield a last line which is not terminated by a line break yet
+        """
+        while True:
+            block = self.file.read(self.block_size)
+            if not block:
+                break
+            self.offset += len(block)
+            data = self._partial + block if self._partial else block
+            view = memoryview(data)
+            start = 0
+            end = data.find(b'\n')
+            while end >= 0:
+                yield view[start:end]
+                start = end + 1
+                end = data.find(b'\n', start)
+            self._partial = data[start:]
+        if final and self._partial:
+            line, self._partial = self._partial, b''
+            yield memoryview(line)
+
+    def reopen_if_rotated(self):
+        """Starts over from the beginning if the file was replaced or truncated, returns True if it was"""
+        try:
+            file_stat = os.stat(self.filename)
+        except OSError:
+            return False
+        open_stat = os.fstat(self.file.fileno())
+        if (file_stat.st_ino, file_stat.st_dev) == (open_stat.st_ino, open_stat.st_dev) and \
+                file_stat.st_size >= self.offset:
+            return False
+        self.file.close()
+        self.file = open(self.filename, 'rb', buffering=0)
+        self.offset = 0
+        self._partial = b''
+        return True
+
+    def close(self):
+        self.file.close()
 
 
 class TelemetryRsyslogParser(object):
-    def __init__(self):
-        self.__pattern = self.generate_Rsyslog_message_pattern()
+    def __init__(self, destination_folder=None, assembler=None, reader='bytes', block_size=1048576,
+                 json_library='auto', json_format='default', spool=None, sequence_tracker=None, archive=None,
+                 analytics=None, aggregator=None, publisher=None):
+        self.destination_folder = destination_folder or os.getcwd()
+        self.analytics = analytics
+        self.aggregator = aggregator
+        self.publisher = publisher
+        self.spool = spool
+        self.archive = archive
+        self._spool_position = None
+        self._acknowledged = time.monotonic()
+        self._failed_batches = 0
+        self.stopped = threading.Event()
+        self.sequence_tracker = sequence_tracker
+        self.assembler = assembler or TelemetryReportAssembler()
+        self.reader = reader
+        self.block_size = block_size
+        self.json = JsonCodec(json_library)
+        self.json_format = json_format
+        if reader == 'text':
+            self.__pattern = self.generate_Rsyslog_message_pattern()
 
     def generate_Rsyslog_message_pattern(self):
         ints = Word(nums)
@@ -67,32 +308,82 @@ class TelemetryRsyslogParser(object):
         return timestamp + hostname + appname + context + message
 
     def parse(self, line):
-        payload = {}
+        """Parses a Rsyslog line read as text with the pyparsing pattern, returns a RsyslogChunk or None"""
         try:
             parsed = self.__pattern.parseString(line)
-            payload["time_stamp"] = parsed[0]
-            payload["host_name"] = parsed[1]
-            payload["idrac_name"] = parsed[2]
-            payload["index"] = parsed[4]
-            payload["chunks_count"] = parsed[6]
-            payload["chunkId"] = parsed[8]
-            payload["message"] = parsed[9]
+            return RsyslogChunk(parsed[0], parsed[1], parsed[2], int(parsed[4]), int(parsed[6]), int(parsed[8]),
+                                parsed[9])
         except:
             logger.exception("Unable to parse line '{}'".format(line))
-        return payload
+        return None
+
+    def parse_bytes(self, line):
+        """Parses a Rsyslog line read as bytes, returns a RsyslogChunk or None. Only the header is matched, the
+        message payload is decoded once."""
+        match = RSYSLOG_HEADER.match(line)
+        if match is None:
+            logger.debug("Unable to parse line '{}'".format(str(line, 'utf-8', 'replace')))
+            return None
+        time_stamp, host_name, idrac_name, index, chunks_count, chunk_id = match.groups()
+        try:
+            message = str(line[match.end():], 'utf-8')
+        except UnicodeDecodeError as e:
+            # A corrupted byte must not stop the follower of the file, the report fails its JSON check if it matters
+            logger.warning("Replacing invalid UTF-8 in chunk {} of report {} of iDRAC {}: {}".format(
+                int(chunk_id), int(index), idrac_name.decode(), e))
+            message = str(line[match.end():], 'utf-8', 'replace')
+        return RsyslogChunk(time_stamp.decode(), host_name.decode(), idrac_name.decode(), int(index),
+                            int(chunks_count), int(chunk_id), message)
 
-    def save_telemetry_report(self, idrac_name, report, report_index):
+    def save_telemetry_report(self, idrac_name, report, report_index, chunk=None):
         try:
-            telemetry_report = json.loads("".join(report))
+            telemetry_report = self.json.loads("".join(report))
+            if self.is_duplicate(idrac_name, telemetry_report):
+                return False
             self.write_telemetry_report_json(idrac_name, telemetry_report, report_index)
+            self.record_sequence(idrac_name, telemetry_report)
+            self.analyze(idrac_name, telemetry_report, chunk)
             return True
         except Exception as e:
             logger.exception(str(e))
             return False
 
+    def is_duplicate(self, idrac_name, report):
+        """Checks the ReportSequence of a report against the ones saved before, duplicates are dropped"""
+        if self.sequence_tracker is None:
+            return False
+        report_id, sequence, timestamp = report.get('Id', 'UnknownId'), report.get('ReportSequence'), \
+            report.get('Timestamp')
+        if self.sequence_tracker.is_duplicate(idrac_name, report_id, sequence, timestamp):
+            self.sequence_tracker.observe(idrac_name, report_id, sequence, timestamp)  # counts the duplicate
+            logger.info("Dropping duplicate report {} {} of iDRAC {}".format(report_id, sequence, idrac_name))
+            return True
+        return False
+
+    def record_sequence(self, idrac_name, report):
+        """Records the ReportSequence of a saved report, gaps are logged by the tracker"""
+        if self.sequence_tracker is not None:
+            self.sequence_tracker.observe(idrac_name, report.get('Id', 'UnknownId'), report.get('ReportSequence'),
+                                          report.get('Timestamp'))
+
+    def analyze(self, idrac_name, report, chunk=None):
+        """Hands a saved report to the anomaly detector, which checks it with the next tick, to the fleet aggregator
+        and to the publisher. chunk is the RsyslogChunk which completed the report, its time stamp aligns the report
+        Timestamp with the other iDRACs."""
+        if self.analytics is not None:
+            self.analytics.observe(idrac_name, report)
+        if self.aggregator is not None:
+            self.aggregator.observe(idrac_name, report, parse_timestamp(chunk.time_stamp) if chunk else None,
+                                    chunk.host_name if chunk else None)
+        if self.publisher is not None:
+            self.publisher.publish(idrac_name, report)
+
     def write_telemetry_report_json(self, idrac_name, report, report_index):
+        if self.archive is not None:
+            self.archive.add(idrac_name, report)
+            return
         id = report.get('Id', 'UnknownId')
-        report_folder = os.path.join(destination_folder, idrac_name)
+        report_folder = os.path.join(self.destination_folder, idrac_name)
         report_sequence = report.get('ReportSequence', '00000')
         report_timestamp = report.get('Timestamp', '00000')
         file_name = str("_".join([id, report_sequence, report_timestamp.replace(":", "-")])) + ".json"
@@ -100,69 +391,287 @@ class TelemetryRsyslogParser(object):
             os.makedirs(report_folder)
         logging.debug("Saving the Telemetry report {} for iDRAC {}".format(file_name, idrac_name))
         with open(os.path.join(report_folder, file_name), "w") as file:
-            file.write(json.dumps(report))
+            file.write(self.json.dumps(report, self.json_format))
+
+    def process_line(self, line):
+        """Adds one Rsyslog line to the pending reports and saves the report once all its chunks arrived.
+
+        :param line: Raw Rsyslog line, a str for the text reader or a bytes-like object for the bytes reader
+        :return: True if the line completed and saved a report
+        """
+        return self.process_chunk(self.parse(line) if self.reader == 'text' else self.parse_bytes(line))
+
+    def process_chunk(self, chunk):
+        """Adds the RsyslogChunk of one Rsyslog line to the pending reports, see process_line"""
+        if chunk is None:
+            return False  # ignore any lines not matching the pattern
+        idrac_name = chunk.idrac_name
+        current_report_index = chunk.index
+        logger.debug("Processing Time stamp {}  and Index: {}".format(chunk.time_stamp, current_report_index))
+        raw_report = self.assembler.add_chunk(chunk.host_name, idrac_name, current_report_index, chunk.chunks_count,
+                                              chunk.chunk_id, chunk.message, chunk.time_stamp)
+        if raw_report and self.spool is not None:
+            self.spool.append(idrac_name, raw_report.encode('utf-8'))
+            return True
+        if raw_report and self.save_telemetry_report(idrac_name, [raw_report], current_report_index, chunk):
+            logger.debug("Finished processing Index: {} of idrac {}".format(current_report_index, idrac_name))
+            return True
+        return False
+
+    def drain_spool(self, spool_reader, max_records=1000):
+        """Saves the reports appended to the spool since the last call and acknowledges them.
+
+        A report which is not valid JSON is logged and skipped. When saving fails with an OSError, like a full disk,
+        nothing after the last saved report is acknowledged and the reports are read again by the next call.
+
+        :return: Number of reports saved
+        """
+        saved_reports = 0
+        last_position = None
+        failed = False
+        for position, idrac_name, data in spool_reader.read(max_records):
+            try:
+                report = self.json.loads(data)
+                if not self.is_duplicate(idrac_name, report):
+                    self.write_telemetry_report_json(idrac_name, report, None)
+                    self.record_sequence(idrac_name, report)
+                    self.analyze(idrac_name, report)
+                    saved_reports += 1
+            except ValueError as e:
+                logger.error("Skipping spooled report of iDRAC {} which is not valid JSON: {}".format(idrac_name, e))
+            except OSError as e:
+                logger.error("Unable to save spooled report of iDRAC {}, retrying: {}".format(idrac_name, e))
+                failed = True
+                break
+            last_position = position
+        if last_position is not None:
+            self._spool_position = last_position
+        # Reports collected for an archive block or a publisher batch are only acknowledged once they are written
+        if self._spool_position is not None and \
+                (failed or time.monotonic() - self._acknowledged >= self.acknowledge_interval):
+            self.acknowledge(spool_reader)
+        if failed:
+            spool_reader.rewind()
+        return saved_reports
+
+    @property
+    def acknowledge_interval(self):
+        """Seconds between two acknowledgements of the spool, the pace the archive blocks are written and the
+        publisher is flushed at"""
+        intervals = []
+        if self.archive is not None:
+            intervals.append(self.archive.flush_interval)
+        if self.publisher is not None:
+            intervals.append(self.publisher.linger)
+        return max(intervals, default=0)
+
+    def acknowledge(self, spool_reader):
+        """Writes the collected archive blocks and waits until the broker took the published batches, then saves the
+        ReportSequence state and acknowledges the spooled reports. Reports read again after a crash were either
+        stored and published, or are not dropped as duplicates. Returns False and acknowledges nothing when the
+        publisher dropped batches."""
+        if self.archive is not None:
+            self.archive.flush()
+        self._acknowledged = time.monotonic()
+        if self.publisher is not None:
+            if self.publisher.closed or not self.publisher.flush() or \
+                    self.publisher.statistics['failed_batches'] > self._failed_batches:
+                self._failed_batches = self.publisher.statistics['failed_batches']
+                logger.error("Not acknowledging the spooled reports, the publisher dropped batches")
+                return False
+        if self._spool_position is not None:
+            if self.sequence_tracker is not None:
+                self.sequence_tracker.save()
+            spool_reader.ack(self._spool_position)
+            self._spool_position = None
+        return True
+
+    def run_spool_sink(self, spool_reader):
+        """Saves the spooled reports at the pace of the destination folder until stopped is set, used as thread
+        target"""
+        while not self.stopped.is_set():
+            if not self.drain_spool(spool_reader):
+                self.stopped.wait(0.5)
+        if self._spool_position is not None:
+            self.acknowledge(spool_reader)
+
+    def close(self, timeout=None):
+        """Writes the collected archive blocks, saves the ReportSequence state and sends the pending records of the
+        publisher, within timeout seconds, after the spool sink stopped. With a spool the state was saved by the
+        sink along with its acknowledgements."""
+        if self.archive is not None:
+            self.archive.close()
+        if self.sequence_tracker is not None and self.spool is None:
+            self.sequence_tracker.save()
+        if self.publisher is not None:
+            self.publisher.close(timeout)
+
+    def process_file(self, filename):
+        """Processes the current content of a Rsyslog file from the beginning and returns without following it.
+
+        :param filename: Path of the Rsyslog file
+        :return: Number of reports saved
+        """
+        saved_reports = 0
+        for chunk in self.read_file(filename):
+            if self.process_chunk(chunk):
+                saved_reports += 1
+        return saved_reports
+
+    def read_file(self, filename):
+        """Yields the RsyslogChunk of every line of a Rsyslog file, None for lines which do not match, from the
+        beginning to the current end"""
+        if self.reader == 'text':
+            with open(filename, 'r') as file:
+                for line in file:
+                    yield self.parse(line)
+            return
+        reader = RsyslogFileReader(filename, self.block_size)
+        try:
+            for line in reader.read_lines(final=True):
+                yield self.parse_bytes(line)
+        finally:
+            reader.close()
+
+    def follow_Rsyslog_file(self, filename):
+        """Processes the lines appended to a Rsyslog file until stopped is set, reading them as raw bytes in large
+        blocks"""
+        reader = RsyslogFileReader(filename, self.block_size, from_end=True)
+        try:
+            while not self.stopped.is_set():
+                lines = 0
+                for line in reader.read_lines():
+                    self.process_chunk(self.parse_bytes(line))
+                    lines += 1
+                if not lines:
+                    self.stopped.wait(1)
+                    if reader.reopen_if_rotated():
+                        logger.info("File '{}' was rotated or truncated, reading it from the beginning".format(
+                            filename))
+        finally:
+            reader.close()
 
     def monitor_Rsyslog_files(self, filename):
+        if self.reader == 'bytes':
+            return self.follow_Rsyslog_file(filename)
         file = open(filename, 'r')
         st_results = os.stat(filename)
         st_size = st_results[6]
         file_modified_time = time.time()
         file.seek(st_size)
-        currently_processing_index = -1
-        reports_dict = {}
-        raw_report = []
-        while 1:
+        while not self.stopped.is_set():
             where = file.tell()
             line = file.readline()
             if not line:
-                time.sleep(1)
+                self.stopped.wait(1)
                 file.seek(where)
                 if time.time() - file_modified_time > 60:
                     file.close()
                     file = open(filename, 'r')
             else:
                 file_modified_time = time.time()
-                fields = self.parse(line)
-                if not fields:
-                    continue  # ignore any lines not matching the pattern
-                idrac_name = fields.get("idrac_name")
-                current_report_index = int(fields.get('index', -1))
-                time_stamp = fields.get("time_stamp")
-                chunk_id = int(fields.get("chunkId", 0))
-                chunks_count = int(fields.get("chunks_count", 1))
-                raw_report = [] if currently_processing_index != current_report_index else raw_report
-                logger.debug("Processing Time stamp {}  and Index: {}".format(time_stamp, current_report_index))
-                if idrac_name not in reports_dict:
-                    reports_dict.update({idrac_name: dict()})
-                current_report_message = reports_dict[idrac_name].get(current_report_index, dict())
-                current_report_message.update({chunk_id: fields.get("message", '')})
-                reports_dict[idrac_name][current_report_index] = current_report_message
-                if len(reports_dict[idrac_name][current_report_index]) == int(chunks_count):
-                    for chunk_ids in sorted(reports_dict[idrac_name][current_report_index].keys()):
-                        raw_report.append(reports_dict[idrac_name][current_report_index][chunk_ids])
-                if raw_report and self.save_telemetry_report(idrac_name, raw_report, current_report_index):
-                    logger.debug("Finished processing Index: {} of idrac {}".format(current_report_index, idrac_name))
-                    del reports_dict[idrac_name][current_report_index]
+                self.process_line(line)
                 time.sleep(0.001)
+        file.close()
 
 
 if __name__ == "__main__":
-    parser = TelemetryRsyslogParser()
+    args = parse_arguments()
+    configure_logging()
+    rsyslog_path = args["s"]
+    spool = Spool(args["spool_folder"], fsync_interval=args["spool_fsync_interval"]) if args["spool_folder"] else None
+    try:
+        detector = detector_from_arguments(args)
+        aggregator = aggregator_from_arguments(args)
+        schemas = schemas_from_arguments(args)
+        # With a spool a batch the broker does not take is retried, the spool keeps its reports meanwhile
+        publisher = publisher_from_arguments(args, schemas, retries=None if spool is not None else 5)
+    except (RuntimeError, ValueError, OSError) as e:
+        logger.error(str(e))
+        sys.exit(1)
+    # With a spool the archive blocks are written and the publisher is flushed by the spool sink, which saves the
+    # ReportSequence state and acknowledges the reports once they are stored
+    acknowledged_by_sink = spool is not None and (args["archive_folder"] or publisher is not None)
+    parser = TelemetryRsyslogParser(args["d"], TelemetryReportAssembler(timeout=args["report_timeout"]), args["reader"],
+                                    json_library=args["json_library"], json_format=args["json_format"], spool=spool,
+                                    sequence_tracker=None if args["no_sequence_tracking"] else
+                                    SequenceTracker(args["sequence_state"],
+                                                    save_interval=None if acknowledged_by_sink else 30),
+                                    archive=ArchiveWriter(args["archive_folder"], schemas=schemas,
+                                                          background_flush=not acknowledged_by_sink)
+                                    if args["archive_folder"] else None,
+                                    analytics=detector, aggregator=aggregator, publisher=publisher)
+    profiler = profiler_from_arguments(args)
+    if profiler is not None:
+        profiler.instrument(parser, 'parse' if args["reader"] == 'text' else 'parse_bytes', 'parse')
+        profiler.instrument(parser.assembler, 'add_chunk', 'reassemble')
+        profiler.instrument(parser.json, 'loads', 'decode')
+        profiler.instrument(parser.json, 'dumps', 'encode')
+        profiler.instrument(parser, 'write_telemetry_report_json', 'write')
+        profiler.instrument(parser, 'analyze', 'analyze and publish')
+        if spool is not None:
+            profiler.instrument(spool, 'append', 'spool')
+        profiler.start()
     threads = list()
-    monitoring_log_files = []
-    while True:
-        rsys_logs = glob.glob(rsyslog_path, recursive=True)
-        idrac_rsyslogs = list(filter(lambda x: ('idrac' in str(x).lower() and str(x).endswith('.log')), rsys_logs))
-        for log_file in idrac_rsyslogs:
-            try:
-                if log_file in monitoring_log_files:
-                    continue
-                logger.info(("Processing file '{}'".format(log_file)).center(100, '*'))
-                x = threading.Thread(target=parser.monitor_Rsyslog_files, args=(log_file,), name=log_file)
-                threads.append(x)
-                x.start()
-                monitoring_log_files.append(log_file)
-            except Exception as e:
-                if log_file in monitoring_log_files: monitoring_log_files.remove(log_file)
-                logger.error("Error occurred while processing '{}'  and error is {}".format(log_file, e))
-        time.sleep(2)
+    last_statistics = last_published = time.monotonic()
+    if spool is not None:
+        # A daemon, the sink may wait for a broker which is down, its reports are saved again after the restart
+        sink = threading.Thread(target=parser.run_spool_sink, args=(spool.reader('json-files'),), name='spool-sink',
+                                daemon=True)
+        threads.append(sink)
+        sink.start()
+    if detector is not None:
+        analytics = threading.Thread(target=detector.run, kwargs={'stopped': parser.stopped}, name='analytics')
+        threads.append(analytics)
+        analytics.start()
+    if aggregator is not None:
+        aggregates = threading.Thread(target=aggregator.run, kwargs={'stopped': parser.stopped}, name='aggregates')
+        threads.append(aggregates)
+        aggregates.start()
+    try:
+        monitoring_log_files = []
+        while True:
+            rsys_logs = glob.glob(rsyslog_path, recursive=True)
+            idrac_rsyslogs = list(filter(lambda x: ('idrac' in str(x).lower() and str(x).endswith('.log')), rsys_logs))
+            for log_file in idrac_rsyslogs:
+                try:
+                    if log_file in monitoring_log_files:
+                        continue
+                    logger.info(("Processing file '{}'".format(log_file)).center(100, '*'))
+                    x = threading.Thread(target=parser.monitor_Rsyslog_files, args=(log_file,), name=log_file)
+                    threads.append(x)
+                    x.start()
+                    monitoring_log_files.append(log_file)
+                except Exception as e:
+                    if log_file in monitoring_log_files: monitoring_log_files.remove(log_file)
+                    logger.error("Error occurred while processing '{}'  and error is {}".format(log_file, e))
+            if parser.sequence_tracker is not None and time.monotonic() - last_statistics >= 300:
+                last_statistics = time.monotonic()
+                totals = parser.sequence_tracker.totals()
+                logger.info("ReportSequence of {} reports of {} iDRAC report types: {} missing, {} duplicates, "
+                            "{} restarts, loss rate {:.3%}".format(totals['received'], totals['keys'],
+                                                                  totals['missing'], totals['duplicates'],
+                                                                  totals['resets'], totals['loss_rate']))
+            if publisher is not None and time.monotonic() - last_published >= 300:
+                last_published = time.monotonic()
+                statistics = publisher.statistics
+                logger.info("Published {} records in {} batches, {} acknowledged, {} retries, {} failed batches, "
+                            "compressed {} to {} bytes".format(statistics['records'], statistics['batches'],
+                                                               statistics['acked_records'], statistics['retries'],
+                                                               statistics['failed_batches'], statistics['raw_bytes'],
+                                                               statistics['compressed_bytes']))
+            time.sleep(2)
+    finally:
+        # The followers, the spool sink, the anomaly check and the aggregates stop before their sinks are closed
+        parser.stopped.set()
+        deadline = time.monotonic() + STOP_TIMEOUT
+        for thread in threads:
+            thread.join(max(deadline - time.monotonic(), 0) if thread.daemon else None)
+            if thread.is_alive():
+                logger.warning("The spool sink did not stop within {} seconds, the reports it did not acknowledge are "
+                               "saved again after the restart".format(STOP_TIMEOUT))
+        parser.close(max(deadline - time.monotonic(), 0))
+        if spool is not None:
+            spool.close()
+        if profiler is not None:
+            profiler.stop()
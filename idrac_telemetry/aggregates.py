@@ -0,0 +1,296 @@
+#
+# aggregates.py Fleet and group aggregates of MetricValues in time slots aligned across iDRACs.
+#
+#
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+import fnmatch
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+from idrac_telemetry.analytics import JsonLinesSink
+from idrac_telemetry.archive import parse_timestamp
+from idrac_telemetry.metric_values import MetricValueArray, Vocabulary
+
+FUNCTIONS = ['sum', 'avg', 'max', 'min', 'count']
+DEFAULT_AGGREGATES = 'sum:SystemInputPower,max:TemperatureReading@*Inlet*'
+FLEET = 'fleet'
+
+logger = logging.getLogger(__name__)
+
+
+def parse_aggregates(text):
+    """Parses comma separated aggregates like 'sum:SystemInputPower,max:TemperatureReading@*Inlet*' into a list of
+    (name, function, MetricId pattern, context pattern). The context pattern after @ is optional.
+
+    :raises ValueError: Unknown function or missing MetricId
+    """
+    aggregates = []
+    for name in (name.strip() for name in text.split(',')):
+        if not name:
+            continue
+        function, _, selector = name.partition(':')
+        metric_pattern, _, context_pattern = selector.partition('@')
+        if function not in FUNCTIONS or not metric_pattern:
+            raise ValueError("'{}' is not an aggregate like sum:SystemInputPower, possible functions are {}".format(
+                name, ', '.join(FUNCTIONS)))
+        aggregates.append((name, function, metric_pattern, context_pattern or '*'))
+    return aggregates
+
+
+def add_aggregate_arguments(parser):
+    """Adds the fleet aggregate options to an argparse parser"""
+    parser.add_argument('--aggregate-file', help='Append fleet and group aggregates of the MetricValues to this JSON '
+                        'lines file, one line per aggregate, group and time slot', required=False)
+    parser.add_argument('--aggregate', help='Comma separated aggregates FUNCTION:METRICID[@CONTEXT], functions are '
+                        '{}, MetricId and context may be patterns'.format(', '.join(FUNCTIONS)),
+                        default=DEFAULT_AGGREGATES)
+    parser.add_argument('--aggregate-slot', help='Seconds per time slot', type=int, default=60)
+    parser.add_argument('--aggregate-lateness', help='Seconds a slot stays open for late reports after reports of a '
+                        'later time arrived', type=int, default=120)
+    parser.add_argument('--aggregate-groups', help='Inventory with the group of every iDRAC, CSV or YAML file or '
+                        'folder as taken by -f of the configuration scripts. Aggregates are computed for every group '
+                        'in addition to the whole fleet', required=False)
+
+
+def aggregator_from_arguments(args):
+    """Returns the FleetAggregator of the options of add_aggregate_arguments, None when no aggregates are computed
+
+    :raises ValueError: Invalid aggregate or inventory
+    :raises OSError: The inventory can not be read
+    """
+    if not args["aggregate_file"]:
+        return None
+    groups = None
+    if args["aggregate_groups"]:
+        from idrac_telemetry.inventory import iter_hosts
+        groups = {host.ip: host.group for host in iter_hosts(args["aggregate_groups"].split(','))}
+    return FleetAggregator(args["aggregate"], slot_seconds=args["aggregate_slot"], lateness=args["aggregate_lateness"],
+                           groups=groups, sink=JsonLinesSink(args["aggregate_file"]))
+
+
+def format_time(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc).isoformat()
+
+
+class SlotSeries(object):
+    """Values of one iDRAC, aggregate and context in one time slot"""
+    __slots__ = ('total', 'count', 'maximum', 'minimum')
+
+    def __init__(self, value):
+        self.total = self.maximum = self.minimum = value
+        self.count = 1
+
+    def add(self, value):
+        self.total += value
+        self.count += 1
+        if value > self.maximum:
+            self.maximum = value
+        elif value < self.minimum:
+            self.minimum = value
+
+
+class FleetAggregator(object):
+    """Aggregates MetricValues of many iDRACs in time slots and emits the aggregates of a slot once it is closed.
+
+    The clocks of the iDRACs differ from each other. The time a report was received by Rsyslog is taken as common
+    clock: the offset between it and the report Timestamp is tracked per iDRAC as moving average, and every
+    MetricValue Timestamp is shifted by the offset of its iDRAC before it is put in a slot. Reports without receive
+    time, like spooled ones, use the last offset of their iDRAC.
+
+    Slots close by event time: the watermark is the latest aligned time seen minus lateness, a slot whose end is
+    before the watermark is closed and its aggregates are emitted. Values of closed slots are counted as late and
+    dropped. A slot is also closed when no report arrived for lateness seconds.
+
+    Within a slot the values of an iDRAC and context are averaged first, so an iDRAC sending a report twice per slot
+    is not counted twice. 'sum' and 'avg' sum and average these per iDRAC averages, 'max' and 'min' use the single
+    values and 'count' is the number of iDRAC and context series.
+    """
+
+    def __init__(self, aggregates=DEFAULT_AGGREGATES, slot_seconds=60, lateness=120, groups=None, sink=None,
+                 alpha=0.1):
+        """
+        :param aggregates: Aggregates as taken by parse_aggregates
+        :param slot_seconds: Length of a time slot
+        :param lateness: Seconds a slot stays open after later values arrived
+        :param groups: Dictionary of iDRAC address or name to group, aggregates are also emitted per group
+        :param sink: JsonLinesSink receiving the aggregates, they are logged when None
+        :param alpha: Weight of a new measurement in the moving average of the clock offset of an iDRAC
+        :raises ValueError: Invalid aggregates
+        """
+        self.aggregates = parse_aggregates(aggregates)
+        if not self.aggregates:
+            raise ValueError("No aggregates given")
+        self.slot_seconds = slot_seconds
+        self.lateness = lateness
+        self.groups = groups or {}
+        self.sink = sink
+        self.alpha = alpha
+        self.statistics = {'values': 0, 'late': 0, 'slots': 0, 'records': 0}
+        self.metric_ids = Vocabulary()
+        self.contexts = Vocabulary()
+        self._offsets = {}
+        self._host_groups = {}
+        self._matches = {}
+        self._slots = {}
+        self._closed_slot = None
+        self._latest = None
+        self._observed = time.monotonic()
+        self._lock = threading.Lock()
+
+    def selected(self, metric_id):
+        return any(fnmatch.fnmatchcase(metric_id, metric_pattern) for _, _, metric_pattern, _ in self.aggregates)
+
+    def _aggregates_of(self, metric_number, context_number):
+        """Indexes of the aggregates a MetricId and context contribute to"""
+        key = (metric_number, context_number)
+        matches = self._matches.get(key)
+        if matches is None:
+            metric_id, context = self.metric_ids.names[metric_number], self.contexts.names[context_number]
+            matches = self._matches[key] = [index for index, (_, _, metric_pattern, context_pattern) in
+                                            enumerate(self.aggregates)
+                                            if fnmatch.fnmatchcase(metric_id, metric_pattern) and
+                                            fnmatch.fnmatchcase(context, context_pattern)]
+        return matches
+
+    def offset(self, host):
+        """Seconds added to the Timestamps of an iDRAC to align them, 0 while unknown"""
+        return self._offsets.get(host, 0.0)
+
+    def observe(self, host, report, received=None, address=None):
+        """Adds the MetricValues of a report and emits the aggregates of the slots closed by them
+
+        :param host: iDRAC name
+        :param report: Report dictionary
+        :param received: Seconds since the epoch the report was received, for example the Rsyslog time stamp
+        :param address: Address of the iDRAC, to find its group when it is not listed by name
+        """
+        report_time = parse_timestamp(report.get('Timestamp'))
+        metric_values = MetricValueArray.from_report(report, self.metric_ids, self.contexts, self.selected)
+        with self._lock:
+            self._observed = time.monotonic()
+            if received is not None and report_time is not None:
+                measured = received - report_time
+                offset = self._offsets.get(host)
+                self._offsets[host] = measured if offset is None else offset + self.alpha * (measured - offset)
+            if host not in self._host_groups:
+                self._host_groups[host] = self.groups.get(address) or self.groups.get(host)
+            offset = self._offsets.get(host, 0.0)
+            for metric_number, context_number, timestamp, value in zip(
+                    metric_values.metric_numbers, metric_values.context_numbers, metric_values.timestamps,
+                    metric_values.values):
+                if value != value:  # NaN, not a number
+                    continue
+                if timestamp != timestamp:
+                    if report_time is None:
+                        continue
+                    timestamp = report_time
+                aligned = timestamp + offset
+                slot = int(aligned // self.slot_seconds)
+                if self._closed_slot is not None and slot <= self._closed_slot:
+                    self.statistics['late'] += 1
+                    continue
+                self.statistics['values'] += 1
+                if self._latest is None or aligned > self._latest:
+                    self._latest = aligned
+                series = self._slots.setdefault(slot, {})
+                for aggregate in self._aggregates_of(metric_number, context_number):
+                    key = (aggregate, host, context_number)
+                    values = series.get(key)
+                    if values is None:
+                        series[key] = SlotSeries(value)
+                    else:
+                        values.add(value)
+            records = self._close((self._latest - self.lateness) // self.slot_seconds - 1
+                                  if self._latest is not None else None)
+        self._emit(records)
+
+    def advance(self):
+        """Closes all slots once no report arrived for lateness seconds, returns the emitted aggregates"""
+        with self._lock:
+            if not self._slots or time.monotonic() - self._observed < self.lateness:
+                return []
+            records = self._close(max(self._slots))
+        self._emit(records)
+        return records
+
+    def flush(self):
+        """Closes all open slots, returns the emitted aggregates"""
+        with self._lock:
+            records = self._close(max(self._slots)) if self._slots else []
+        self._emit(records)
+        return records
+
+    def _close(self, last_slot):
+        """Closes the slots up to and including last_slot, returns their aggregates"""
+        records = []
+        if last_slot is None:
+            return records
+        for slot in sorted(slot for slot in self._slots if slot <= last_slot):
+            records.extend(self._aggregate(slot, self._slots.pop(slot)))
+            self.statistics['slots'] += 1
+        if self._closed_slot is None or last_slot > self._closed_slot:
+            self._closed_slot = int(last_slot)
+        return records
+
+    def _aggregate(self, slot, series):
+        """Returns the aggregate records of the series of a closed slot, per aggregate for the fleet and each group"""
+        members = {}
+        for (aggregate, host, _), values in series.items():
+            members.setdefault((aggregate, FLEET), []).append((host, values))
+            group = self._host_groups.get(host)
+            if group is not None:
+                members.setdefault((aggregate, group), []).append((host, values))
+        start = slot * self.slot_seconds
+        records = []
+        for (aggregate, group), entries in sorted(members.items(), key=lambda item: (item[0][0], item[0][1] != FLEET,
+                                                                                     item[0][1])):
+            name, function, _, _ = self.aggregates[aggregate]
+            if function == 'sum':
+                value = sum(values.total / values.count for _, values in entries)
+            elif function == 'avg':
+                value = sum(values.total / values.count for _, values in entries) / len(entries)
+            elif function == 'max':
+                value = max(values.maximum for _, values in entries)
+            elif function == 'min':
+                value = min(values.minimum for _, values in entries)
+            else:
+                value = len(entries)
+            records.append({'start': format_time(start), 'end': format_time(start + self.slot_seconds),
+                            'group': group, 'aggregate': name, 'value': round(value, 3),
+                            'hosts': len({host for host, _ in entries}), 'series': len(entries)})
+        return records
+
+    def _emit(self, records):
+        if not records:
+            return
+        self.statistics['records'] += len(records)
+        if self.sink is not None:
+            self.sink.write(records)
+            return
+        for record in records:
+            logger.info("{} {} of {} iDRACs from {} to {}: {}".format(record['group'], record['aggregate'],
+                                                                     record['hosts'], record['start'], record['end'],
+                                                                     record['value']))
+
+    def run(self, interval=1.0, stopped=None):
+        """Closes the slots of a stream which stopped until the threading.Event stopped is set, used as thread
+        target"""
+        stopped = stopped or threading.Event()
+        while not stopped.is_set():
+            try:
+                self.advance()
+            except Exception as e:
+                logger.exception("Closing the aggregate slots failed: {}".format(e))
+            stopped.wait(interval)
@@ -0,0 +1,296 @@
+#
+# analytics.py Anomaly flags on the power and thermal MetricValues of reconstructed Telemetry reports.
+#
+#
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+import fnmatch
+import logging
+import threading
+import time
+from array import array
+from datetime import datetime, timezone
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from idrac_telemetry import json_codec
+from idrac_telemetry.metric_values import MetricValueArray, Vocabulary
+
+METHODS = ['zscore', 'ewma']
+# Temperatures and power readings like SystemInputPower, TotalCPUPower or the PowerConsumption of GPUs
+DEFAULT_METRICS = '*Temperature*,*Temp,*Power,PowerConsumption'
+
+logger = logging.getLogger(__name__)
+
+
+def add_analytics_arguments(parser):
+    """Adds the anomaly detection options to an argparse parser"""
+    parser.add_argument('--anomaly-file', help='Check the power and thermal MetricValues of the reports for anomalies '
+                        'and append the flagged values to this JSON lines file, needs the numpy package',
+                        required=False)
+    parser.add_argument('--anomaly-method', help='zscore compares a value with the mean and standard deviation of '
+                        'the last --anomaly-window values of its series, ewma with exponentially weighted ones',
+                        default='zscore', choices=METHODS)
+    parser.add_argument('--anomaly-window', help='Number of values kept per iDRAC and metric', type=int, default=60)
+    parser.add_argument('--anomaly-threshold', help='Number of standard deviations a value must be away from the '
+                        'usual ones to be flagged', type=float, default=4.0)
+    parser.add_argument('--anomaly-metrics', help='Comma separated MetricIds or patterns checked for anomalies',
+                        default=DEFAULT_METRICS)
+
+
+def detector_from_arguments(args):
+    """Returns the AnomalyDetector of the options of add_analytics_arguments, None when no anomalies are checked
+
+    :raises RuntimeError: numpy is not installed
+    """
+    if not args["anomaly_file"]:
+        return None
+    return AnomalyDetector(method=args["anomaly_method"], window=args["anomaly_window"],
+                           threshold=args["anomaly_threshold"], metrics=args["anomaly_metrics"],
+                           sink=JsonLinesSink(args["anomaly_file"]))
+
+
+def format_timestamp(seconds):
+    """Returns seconds since the epoch as ISO time in UTC, None for NaN"""
+    if seconds != seconds:
+        return None
+    return datetime.fromtimestamp(float(seconds), timezone.utc).isoformat()
+
+
+class JsonLinesSink(object):
+    """Appends dictionaries, like the flagged values or the fleet aggregates, as JSON lines to a file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'ab')
+
+    def write(self, entries):
+        for entry in entries:
+            self._file.write(json_codec.dumps_bytes(entry, 'compact') + b'\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class AnomalyDetector(object):
+    """Flags MetricValues which are far from the recent values of the same iDRAC, metric and context.
+
+    Every series gets a row of preallocated NumPy arrays: a ring buffer of the last window values for 'zscore', the
+    exponentially weighted mean and variance for 'ewma'. observe only collects the values of a report, tick checks
+    all values collected since the last tick at once, so the cost per tick is a few array operations over all iDRACs
+    instead of Python code per value. A value is flagged when it is more than threshold standard deviations and more
+    than tolerance away from the mean of its series, once the series has min_samples values.
+    """
+
+    def __init__(self, method='zscore', window=60, threshold=4.0, alpha=0.1, min_samples=20, tolerance=1.0,
+                 metrics=DEFAULT_METRICS, sink=None, capacity=4096):
+        """
+        :param method: 'zscore' or 'ewma'
+        :param window: Number of values kept per series by 'zscore'
+        :param threshold: Number of standard deviations a value must be away from the mean to be flagged
+        :param alpha: Weight of a new value in the mean and variance of 'ewma'
+        :param min_samples: Number of values of a series before its values are checked
+        :param tolerance: Smallest absolute deviation which is flagged, a series which barely changes is otherwise
+                          flagged on its first small step
+        :param metrics: Comma separated MetricIds or fnmatch patterns of the checked MetricValues
+        :param sink: JsonLinesSink receiving the flagged values, they are logged one by one when None
+        :param capacity: Number of series the arrays are allocated for, they grow when more are seen
+        :raises RuntimeError: numpy is not installed
+        :raises ValueError: Unknown method
+        """
+        if numpy is None:
+            raise RuntimeError("Anomaly detection needs the numpy package, install it with 'pip install numpy'")
+        if method not in METHODS:
+            raise ValueError("Unknown anomaly method '{}', possible values are {}".format(method, ', '.join(METHODS)))
+        self.method = method
+        self.window = window
+        self.threshold = threshold
+        self.alpha = alpha
+        self.min_samples = max(min_samples, 2)
+        self.tolerance = tolerance
+        self.patterns = [pattern.strip() for pattern in metrics.split(',') if pattern.strip()]
+        self.sink = sink
+        self.statistics = {'values': 0, 'skipped': 0, 'ticks': 0, 'anomalies': 0}
+        self.metric_ids = Vocabulary()
+        self.contexts = Vocabulary()
+        self._selected = {}
+        self._rows = {}
+        self._keys = []
+        self._allocate(capacity)
+        self._lock = threading.Lock()
+        self._start_tick()
+
+    def _start_tick(self):
+        # The values collected for the next tick, all reports share one array, sources has the pending report of
+        # every value
+        self._pending = MetricValueArray(self.metric_ids, self.contexts)
+        self._pending_reports = []
+        self._pending_sources = array('I')
+
+    def _allocate(self, capacity):
+        """Allocates the arrays for capacity series, keeping the values of the existing ones"""
+        arrays = {'_count': numpy.zeros(capacity, dtype=numpy.int64)}
+        if self.method == 'zscore':
+            arrays['_values'] = numpy.zeros((capacity, self.window), dtype=numpy.float64)
+        else:
+            arrays['_mean'] = numpy.zeros(capacity, dtype=numpy.float64)
+            arrays['_variance'] = numpy.zeros(capacity, dtype=numpy.float64)
+        for name, array in arrays.items():
+            current = getattr(self, name, None)
+            if current is not None:
+                array[:len(current)] = current
+            setattr(self, name, array)
+        self.capacity = capacity
+
+    def series_count(self):
+        return len(self._keys)
+
+    def selected(self, metric_id):
+        selected = self._selected.get(metric_id)
+        if selected is None:
+            selected = self._selected[metric_id] = any(fnmatch.fnmatchcase(metric_id, pattern)
+                                                       for pattern in self.patterns)
+        return selected
+
+    def observe(self, host, report):
+        """Collects the selected MetricValues of a report for the next tick"""
+        with self._lock:
+            count = self._pending.extend(report, self.selected)
+            if count:
+                self._pending_sources.extend(array('I', [len(self._pending_reports)]) * count)
+                self._pending_reports.append((host, report.get('Id', 'UnknownId')))
+
+    def tick(self):
+        """Checks the values collected since the last tick and adds them to their series. Values which are not
+        numbers are skipped.
+
+        :return: List of the anomalies found, dictionaries as written to the sink
+        """
+        with self._lock:
+            pending, reports, sources = self._pending, self._pending_reports, self._pending_sources
+            self._start_tick()
+            rows, values, timestamps, sources = self._collect(pending, reports, sources)
+            if not rows:
+                return []
+            rows = numpy.array(rows, dtype=numpy.int64)
+            if len(self._keys) > self.capacity:
+                capacity = self.capacity
+                while capacity < len(self._keys):
+                    capacity *= 2
+                self._allocate(capacity)
+            keys = self._keys
+            check = self._zscore if self.method == 'zscore' else self._ewma
+            anomalies = []
+            # A series with several values in one tick gets them one round after the other, in arrival order
+            order = numpy.argsort(rows, kind='stable')
+            sorted_rows = rows[order]
+            first = numpy.searchsorted(sorted_rows, sorted_rows, side='left')
+            rounds = numpy.empty(len(rows), dtype=numpy.int64)
+            rounds[order] = numpy.arange(len(rows)) - first
+            for round_number in range(int(rounds.max()) + 1):
+                indexes = numpy.flatnonzero(rounds == round_number)
+                flagged, means, deviations = check(rows[indexes], values[indexes])
+                for position in numpy.flatnonzero(flagged):
+                    index = indexes[position]
+                    host, metric_number, context_number = keys[rows[index]]
+                    mean, deviation = float(means[position]), float(deviations[position])
+                    anomalies.append({'host': host, 'report_id': reports[sources[index]][1],
+                                      'metric_id': self.metric_ids.names[metric_number],
+                                      'context': self.contexts.names[context_number],
+                                      'timestamp': format_timestamp(timestamps[index]), 'value': float(values[index]),
+                                      'mean': round(mean, 3), 'std': round(deviation, 3),
+                                      'score': round((float(values[index]) - mean) / deviation, 2)
+                                      if deviation else None, 'method': self.method})
+            self.statistics['values'] += len(rows)
+            self.statistics['ticks'] += 1
+            self.statistics['anomalies'] += len(anomalies)
+        if not anomalies:
+            return anomalies
+        if self.sink is not None:
+            self.sink.write(anomalies)
+            logger.warning("{} anomalies on {} iDRACs, see '{}'".format(
+                len(anomalies), len({anomaly['host'] for anomaly in anomalies}), self.sink.path))
+            return anomalies
+        for anomaly in anomalies:
+            logger.warning("Anomaly of {} {} {} on iDRAC {} at {}: {} while the mean is {} and the standard deviation "
+                           "{}".format(anomaly['report_id'], anomaly['metric_id'], anomaly['context'],
+                                       anomaly['host'], anomaly['timestamp'], anomaly['value'], anomaly['mean'],
+                                       anomaly['std']))
+        return anomalies
+
+    def _collect(self, pending, reports, sources):
+        """Returns the series rows, values, timestamps and report of the pending values which are numbers, new series
+        get a row"""
+        values = numpy.frombuffer(pending.values, dtype=numpy.float64)
+        valid = numpy.flatnonzero(~numpy.isnan(values))
+        self.statistics['skipped'] += len(values) - len(valid)
+        sources = numpy.frombuffer(sources, dtype=sources.typecode)[valid]
+        metric_numbers = numpy.frombuffer(pending.metric_numbers, dtype=pending.metric_numbers.typecode)[valid]
+        context_numbers = numpy.frombuffer(pending.context_numbers, dtype=pending.context_numbers.typecode)[valid]
+        rows = []
+        for source, metric_number, context_number in zip(sources.tolist(), metric_numbers.tolist(),
+                                                         context_numbers.tolist()):
+            key = (reports[source][0], metric_number, context_number)
+            row = self._rows.get(key)
+            if row is None:
+                row = self._rows[key] = len(self._keys)
+                self._keys.append(key)
+            rows.append(row)
+        return rows, values[valid], numpy.frombuffer(pending.timestamps, dtype=numpy.float64)[valid], sources
+
+    def _flag(self, values, means, deviations, counts):
+        distance = numpy.abs(values - means)
+        return (counts >= self.min_samples) & (distance > self.threshold * deviations) & (distance > self.tolerance)
+
+    def _zscore(self, rows, values):
+        """Checks the values against the ring buffer of their series and appends them, each row appears once"""
+        counts = self._count[rows]
+        filled = numpy.minimum(counts, self.window)
+        windows = self._values[rows]
+        # Slots are filled from the start of the row, the unfilled ones are masked out
+        mask = numpy.arange(self.window) < filled[:, None]
+        means = (windows * mask).sum(axis=1) / numpy.maximum(filled, 1)
+        # Sample standard deviation, the population one is too small for the few values of a young series
+        deviations = numpy.sqrt((((windows - means[:, None]) * mask) ** 2).sum(axis=1) / numpy.maximum(filled - 1, 1))
+        flagged = self._flag(values, means, deviations, counts)
+        self._values[rows, counts % self.window] = values
+        self._count[rows] = counts + 1
+        return flagged, means, deviations
+
+    def _ewma(self, rows, values):
+        """Checks the values against the weighted mean and variance of their series and updates them"""
+        counts = self._count[rows]
+        means = numpy.where(counts == 0, values, self._mean[rows])
+        variances = self._variance[rows]
+        deviations = numpy.sqrt(variances)
+        flagged = self._flag(values, means, deviations, counts)
+        differences = values - means
+        self._mean[rows] = means + self.alpha * differences
+        self._variance[rows] = (1 - self.alpha) * (variances + self.alpha * differences ** 2)
+        self._count[rows] = counts + 1
+        return flagged, means, deviations
+
+    def run(self, interval=1.0, stopped=None):
+        """Checks the collected values every interval seconds until the threading.Event stopped is set, used as
+        thread target"""
+        stopped = stopped or threading.Event()
+        while not stopped.is_set():
+            started = time.monotonic()
+            try:
+                self.tick()
+            except Exception as e:
+                logger.exception("Anomaly check failed: {}".format(e))
+            stopped.wait(max(interval - (time.monotonic() - started), 0.05))
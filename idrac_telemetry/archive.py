@@ -0,0 +1,271 @@
+#
+# archive.py Compressed on-disk archive of Telemetry reports with a block index for random access.
+#
+#
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+import glob
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+from datetime import datetime
+
+from idrac_telemetry import json_codec
+
+BLOCKS_SUFFIX = '.blocks'
+INDEX_SUFFIX = '.idx'
+DICTIONARY_SUFFIX = '.dict'
+
+# zlib can only use the last 32 KB of a preset dictionary
+DICTIONARY_SIZE = 32768
+
+logger = logging.getLogger(__name__)
+
+
+def parse_timestamp(value):
+    """Converts a Redfish timestamp like 2022-05-10T12:00:00-05:00 to seconds since the epoch, None if invalid"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def safe_file_name(report_id):
+    return re.sub(r'[^A-Za-z0-9._-]', '_', report_id)
+
+
+class ArchiveWriter(object):
+    """Appends reports to an archive folder, one set of files per report Id.
+
+    Reports are collected per report Id and written as a compressed block once block_reports are collected or the
+    block is older than flush_interval seconds, checked by add and by a background thread while no reports arrive.
+    A block is the JSON lines of its [host, report] items compressed with
+    zlib and a preset dictionary. The dictionary of a report Id is taken from its first reports, which share the
+    MetricIds, properties and labels of all later ones, so even small blocks compress well.
+
+    Per report Id the archive folder holds:
+
+    - <id>.dict, the preset dictionary
+    - <id>.blocks, the compressed blocks one after the other
+    - <id>.idx, one JSON line per block with its offset, length, number of reports, hosts and time range. A line is
+      written after its block, an interrupted write leaves a block without index line which is never read
+    - <schema>.schema, the metric schemas the reports are encoded against when a SchemaRegistry is given
+    """
+
+    def __init__(self, folder, block_reports=256, flush_interval=60, level=6, schemas=None, background_flush=True):
+        """
+        :param folder: Archive folder, created if needed
+        :param block_reports: Number of reports per block
+        :param flush_interval: Seconds after which a block which is not full is written
+        :param background_flush: Write blocks older than flush_interval from a background thread, False leaves it
+                                 to callers which flush themselves, for example once the reports are acknowledged
+        :param level: zlib compression level
+        :param schemas: SchemaRegistry, reports are stored encoded against the schema of their iDRAC, see
+                        metric_schema.encode_report. ArchiveReader decodes them.
+        """
+        self.folder = folder
+        self.block_reports = block_reports
+        self.flush_interval = flush_interval
+        self.level = level
+        self.schemas = schemas
+        if schemas is not None:
+            # metric_schema imports this module through metric_values
+            from idrac_telemetry.metric_schema import SchemaRegistry, encode_report
+            self._encode_report = encode_report
+            self._archived_schemas = SchemaRegistry(folder)
+        self.statistics = {'reports': 0, 'blocks': 0, 'raw_bytes': 0, 'compressed_bytes': 0}
+        self._pending = {}
+        self._dictionaries = {}
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        self._closed = threading.Event()
+        self._flusher = None
+        if background_flush and 0 < flush_interval < float('inf'):
+            self._flusher = threading.Thread(target=self._flush_periodically, name='archive-flush', daemon=True)
+            self._flusher.start()
+
+    def add(self, host, report):
+        """Adds a report, given as dictionary, received from the iDRAC host"""
+        report_id = report.get('Id', 'UnknownId')
+        if self.schemas is not None:
+            schema = self.schemas.schema_for(host)
+            if schema is not None:
+                self._archived_schemas.add(schema)
+            line = json_codec.dumps_bytes([host, self._encode_report(report, schema)], 'compact') + b'\n'
+        else:
+            line = json_codec.dumps_bytes([host, report], 'compact') + b'\n'
+        with self._lock:
+            pending = self._pending.get(report_id)
+            if pending is None:
+                pending = self._pending[report_id] = {'lines': [], 'hosts': set(), 'start': None, 'end': None,
+                                                      'created': time.monotonic()}
+            pending['lines'].append(line)
+            pending['hosts'].add(host)
+            report_time = parse_timestamp(report.get('Timestamp'))
+            if report_time is not None:
+                pending['start'] = report_time if pending['start'] is None else min(pending['start'], report_time)
+                pending['end'] = report_time if pending['end'] is None else max(pending['end'], report_time)
+            self.statistics['reports'] += 1
+            if len(pending['lines']) >= self.block_reports or \
+                    time.monotonic() - pending['created'] >= self.flush_interval:
+                self._write_block(report_id)
+
+    def flush(self):
+        """Writes the blocks of all report Ids, also the ones which are not full"""
+        with self._lock:
+            for report_id in list(self._pending):
+                self._write_block(report_id)
+
+    def close(self):
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+
+    def _flush_periodically(self):
+        while not self._closed.wait(min(self.flush_interval, 1)):
+            with self._lock:
+                for report_id, pending in list(self._pending.items()):
+                    if time.monotonic() - pending['created'] >= self.flush_interval:
+                        try:
+                            self._write_block(report_id)
+                        except OSError as e:
+                            logger.error("Unable to write the archive block of {}, retrying: {}".format(report_id, e))
+
+    def _dictionary(self, report_id, lines):
+        dictionary = self._dictionaries.get(report_id)
+        if dictionary is None:
+            path = os.path.join(self.folder, safe_file_name(report_id) + DICTIONARY_SUFFIX)
+            if os.path.exists(path):
+                with open(path, 'rb') as file:
+                    dictionary = file.read()
+            else:
+                # The most common content goes to the end of the dictionary, zlib finds near matches cheaper
+                dictionary = b''.join(lines)[-DICTIONARY_SIZE:]
+                with open(path, 'wb') as file:
+                    file.write(dictionary)
+            self._dictionaries[report_id] = dictionary
+        return dictionary
+
+    def _write_block(self, report_id):
+        pending = self._pending[report_id]
+        raw = b''.join(pending['lines'])
+        compressor = zlib.compressobj(self.level, zdict=self._dictionary(report_id, pending['lines']))
+        block = compressor.compress(raw) + compressor.flush()
+        base_name = os.path.join(self.folder, safe_file_name(report_id))
+        with open(base_name + BLOCKS_SUFFIX, 'ab') as file:
+            offset = file.tell()
+            file.write(block)
+        entry = {'id': report_id, 'offset': offset, 'length': len(block), 'raw_length': len(raw),
+                 'count': len(pending['lines']), 'hosts': sorted(pending['hosts']),
+                 'start': pending['start'], 'end': pending['end']}
+        with open(base_name + INDEX_SUFFIX, 'ab') as file:
+            file.write(json_codec.dumps_bytes(entry, 'compact') + b'\n')
+        del self._pending[report_id]
+        self.statistics['blocks'] += 1
+        self.statistics['raw_bytes'] += len(raw)
+        self.statistics['compressed_bytes'] += len(block)
+
+
+class ArchiveReader(object):
+    """Reads an archive written by ArchiveWriter. Only the blocks matching a query are decompressed."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self._dictionaries = {}
+        self._schemas = None
+
+    def report_ids(self):
+        ids = set()
+        for path in glob.glob(os.path.join(self.folder, '*' + INDEX_SUFFIX)):
+            for entry in self._index(path):
+                ids.add(entry['id'])
+                break
+        return sorted(ids)
+
+    def blocks(self, report_ids=None, hosts=None, start=None, end=None):
+        """Yields the index entries of the blocks which may contain reports matching the filters.
+
+        :param report_ids: Report Ids to include, all when None
+        :param hosts: Hosts to include, all when None
+        :param start: Seconds since the epoch, blocks ending before are skipped
+        :param end: Seconds since the epoch, blocks starting after are skipped
+        """
+        if report_ids is None:
+            paths = sorted(glob.glob(os.path.join(self.folder, '*' + INDEX_SUFFIX)))
+        else:
+            paths = [os.path.join(self.folder, safe_file_name(report_id) + INDEX_SUFFIX) for report_id in report_ids]
+        host_filter = set(hosts) if hosts else None
+        for path in paths:
+            for entry in self._index(path):
+                if report_ids is not None and entry['id'] not in report_ids:
+                    continue
+                if host_filter is not None and host_filter.isdisjoint(entry['hosts']):
+                    continue
+                if start is not None and entry['end'] is not None and entry['end'] < start:
+                    continue
+                if end is not None and entry['start'] is not None and entry['start'] > end:
+                    continue
+                yield entry
+
+    def read_block(self, entry):
+        """Returns the (host, report) items of a block"""
+        base_name = os.path.join(self.folder, safe_file_name(entry['id']))
+        with open(base_name + BLOCKS_SUFFIX, 'rb') as file:
+            file.seek(entry['offset'])
+            block = file.read(entry['length'])
+        decompressor = zlib.decompressobj(zdict=self._dictionary(entry['id']))
+        raw = decompressor.decompress(block) + decompressor.flush()
+        items = [json_codec.loads(line) for line in raw.splitlines()]
+        if any('$schema' in report for _, report in items):
+            from idrac_telemetry.metric_schema import SchemaRegistry, decode_report
+            if self._schemas is None:
+                self._schemas = SchemaRegistry(self.folder)
+            items = [[host, decode_report(report, self._schemas)] for host, report in items]
+        return items
+
+    def reports(self, report_ids=None, hosts=None, start=None, end=None):
+        """Yields (host, report) of the reports matching the filters, see blocks"""
+        host_filter = set(hosts) if hosts else None
+        for entry in self.blocks(report_ids, hosts, start, end):
+            for host, report in self.read_block(entry):
+                if host_filter is not None and host not in host_filter:
+                    continue
+                if start is not None or end is not None:
+                    report_time = parse_timestamp(report.get('Timestamp'))
+                    if report_time is None or (start is not None and report_time < start) or \
+                            (end is not None and report_time > end):
+                        continue
+                yield host, report
+
+    def _dictionary(self, report_id):
+        if report_id not in self._dictionaries:
+            with open(os.path.join(self.folder, safe_file_name(report_id) + DICTIONARY_SUFFIX), 'rb') as file:
+                self._dictionaries[report_id] = file.read()
+        return self._dictionaries[report_id]
+
+    @staticmethod
+    def _index(path):
+        try:
+            with open(path, 'rb') as file:
+                for line in file:
+                    try:
+                        yield json_codec.loads(line)
+                    except ValueError:  # line cut short by an interrupted write
+                        logger.warning("Ignoring incomplete index line in '{}'".format(path))
+        except FileNotFoundError:
+            return
@@ -0,0 +1,323 @@
+#
+# async_redfish.py asyncio Redfish client to work on many iDRACs from one event loop.
+#
+#
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+import asyncio
+import logging
+import time
+
+# aiohttp takes a fifth of a second to import, it is imported once the first client is created
+aiohttp = None
+
+from idrac_telemetry import json_codec
+from idrac_telemetry.circuit_breaker import CircuitBreaker, HostUnavailable
+from idrac_telemetry.hosts import HEADERS
+from idrac_telemetry.rate_limiter import BUSY_STATUS_CODES, AdaptiveRateLimiter, retry_after_seconds
+
+SSE_URI = '/redfish/v1/SSE?$filter=EventFormatType eq MetricReport'
+
+# TaskState values of a finished Redfish task
+FINISHED_TASK_STATES = ('Completed', 'Exception', 'Killed', 'Cancelled')
+
+logger = logging.getLogger(__name__)
+
+
+def add_client_arguments(parser):
+    """Adds the options of the asyncio Redfish client to an argparse parser"""
+    parser.add_argument('--per-host', help='Maximum number of concurrent requests per iDRAC', type=int, default=4)
+    parser.add_argument('--max-requests', help='Maximum number of concurrent requests over all iDRACs', type=int,
+                        default=256)
+    parser.add_argument('--connect-timeout', help='Seconds to wait for the connection to an iDRAC', type=float,
+                        default=10)
+    parser.add_argument('--read-timeout', help='Seconds to wait for data from an iDRAC', type=float, default=60)
+
+
+def client_from_arguments(args):
+    """Returns the AsyncRedfishClient configured by the options of add_client_arguments"""
+    return AsyncRedfishClient(per_host=args["per_host"], max_requests=args["max_requests"],
+                              connect_timeout=args["connect_timeout"], read_timeout=args["read_timeout"])
+
+
+class RedfishConnectionError(RuntimeError):
+    """The iDRAC could not be reached or did not answer in time"""
+
+
+class RedfishResponse(object):
+    """Status code, headers and body of a completed request"""
+
+    __slots__ = ('status_code', 'headers', 'content')
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', 'replace')
+
+    def json(self):
+        return json_codec.loads(self.content)
+
+
+class SseEvent(object):
+    """One server-sent event"""
+
+    __slots__ = ('id', 'event', 'data')
+
+    def __init__(self, event_id, event, data):
+        self.id = event_id
+        self.event = event
+        self.data = data
+
+
+def _import_aiohttp():
+    global aiohttp
+    if aiohttp is None:
+        try:
+            import aiohttp as module
+        except ImportError:
+            raise RuntimeError("The asyncio Redfish client needs the aiohttp package, install it with "
+                               "'pip install aiohttp'")
+        aiohttp = module
+
+
+class AsyncRedfishClient(object):
+    """asyncio Redfish client for the hosts of idrac_telemetry.hosts.
+
+    An iDRAC only serves a few requests at the same time, so at most per_host requests are sent to a host at once
+    and at most max_requests over all hosts; further requests wait for a free slot. Every connection carries one
+    request at a time and is reused for the next request to the same host. Requests which can not connect within
+    connect_timeout or get no data for read_timeout seconds fail with RedfishConnectionError. Hosts failing several
+    requests in a row are parked by a CircuitBreaker, their requests fail with HostUnavailable without being sent
+    until a probe request succeeds again. The requests per second of each host are paced by an AdaptiveRateLimiter,
+    requests answered with 503 or 429 are sent again up to retries times once the limiter lowered the rate.
+
+    Use it as async context manager:
+
+        async with AsyncRedfishClient() as client:
+            response = await client.get(host, '/redfish/v1/TelemetryService')
+    """
+
+    def __init__(self, per_host=4, max_requests=256, connect_timeout=10, read_timeout=60, breaker=None, limiter=None,
+                 retries=3):
+        """
+        :param per_host: Maximum number of concurrent requests per host
+        :param max_requests: Maximum number of concurrent requests over all hosts
+        :param connect_timeout: Seconds to wait for a connection
+        :param read_timeout: Seconds to wait for data of a response
+        :param breaker: CircuitBreaker shared with other clients, a new one by default
+        :param limiter: AdaptiveRateLimiter shared with other clients, a new one by default
+        :param retries: Number of times a request answered with 503 or 429 is sent again
+        """
+        _import_aiohttp()
+        self.per_host = per_host
+        self.max_requests = max_requests
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.limiter = limiter if limiter is not None else AdaptiveRateLimiter()
+        self.retries = retries
+        self.statistics = {'requests': 0, 'failed': 0, 'rejected': 0, 'retried': 0}
+        self._session = None
+        self._slots = None
+        self._host_slots = {}
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def open(self):
+        # Connection counts are limited by the semaphores, the connector keeps idle connections for reuse
+        connector = aiohttp.TCPConnector(ssl=False, limit=0, limit_per_host=0, keepalive_timeout=30)
+        self._session = aiohttp.ClientSession(connector=connector, headers=HEADERS, read_bufsize=2 ** 20,
+                                              timeout=aiohttp.ClientTimeout(total=None,
+                                                                            sock_connect=self.connect_timeout,
+                                                                            sock_read=self.read_timeout))
+        self._slots = asyncio.Semaphore(self.max_requests)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def request(self, method, host, uri, payload=None, timeout=None):
+        """Sends a request and reads the whole response.
+
+        :param method: 'GET', 'PATCH', 'POST' or 'DELETE'
+        :param host: The Host
+        :param uri: URI starting with /redfish
+        :param payload: Dictionary sent as JSON body
+        :param timeout: Read timeout in seconds replacing read_timeout for this request
+        :return: RedfishResponse, for every status code, a 503 or 429 one once the retries are used up
+        :raises RedfishConnectionError: The host could not be reached or did not answer in time
+        :raises HostUnavailable: The host is parked by the circuit breaker
+        """
+        data = json_codec.dumps_bytes(payload) if payload is not None else None
+        for attempt in range(self.retries + 1):
+            response = await self._send(method, host, uri, data, timeout)
+            if response.status_code not in BUSY_STATUS_CODES or attempt == self.retries:
+                return response
+            self.statistics['retried'] += 1
+            logger.debug("iDRAC {} answered {} {} with {}, retrying".format(host.ip, method, uri,
+                                                                           response.status_code))
+        return response
+
+    async def _send(self, method, host, uri, data, timeout):
+        host_slots = self._host_slots.get(host.ip)
+        if host_slots is None:
+            host_slots = self._host_slots[host.ip] = asyncio.Semaphore(self.per_host)
+        async with host_slots:
+            if self.breaker.is_parked(host.ip):
+                self.statistics['rejected'] += 1
+                raise HostUnavailable("iDRAC {} is parked after failed requests".format(host.ip))
+            # Only the requests holding a slot of the host wait for its rate, not every queued one
+            await self.limiter.acquire_async(host.ip)
+            async with self._slots:
+                return await self._send_now(method, host, uri, data, timeout)
+
+    async def _send_now(self, method, host, uri, data, timeout):
+        if not self.breaker.allow(host.ip):
+            self.statistics['rejected'] += 1
+            raise HostUnavailable("iDRAC {} is parked after failed requests".format(host.ip))
+        self.statistics['requests'] += 1
+        options = {}
+        if timeout is not None:
+            options['timeout'] = aiohttp.ClientTimeout(total=None, sock_connect=self.connect_timeout,
+                                                       sock_read=timeout)
+        started = time.monotonic()
+        try:
+            async with self._session.request(method, host.url(uri), data=data, auth=self._auth(host),
+                                             **options) as response:
+                content = await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.statistics['failed'] += 1
+            self.limiter.record(host.ip, time.monotonic() - started)
+            self.breaker.record_failure(host.ip)
+            raise RedfishConnectionError("{} {} on iDRAC {} failed: {}".format(
+                method, uri, host.ip, str(e) or type(e).__name__)) from e
+        self.limiter.record(host.ip, time.monotonic() - started, response.status,
+                            retry_after_seconds(response.headers))
+        # A busy iDRAC still answers, only missing answers count against the host
+        self.breaker.record_success(host.ip)
+        return RedfishResponse(response.status, response.headers, content)
+
+    async def get(self, host, uri, **kwargs):
+        return await self.request('GET', host, uri, **kwargs)
+
+    async def patch(self, host, uri, payload, **kwargs):
+        return await self.request('PATCH', host, uri, payload, **kwargs)
+
+    async def post(self, host, uri, payload, **kwargs):
+        return await self.request('POST', host, uri, payload, **kwargs)
+
+    async def delete(self, host, uri, **kwargs):
+        return await self.request('DELETE', host, uri, **kwargs)
+
+    async def wait_for_task(self, host, task_uri, interval=5, timeout=3600):
+        """Polls a Redfish task or job until it is finished.
+
+        :param task_uri: URI of the task, for example the Location header of the request which started it
+        :param interval: Seconds between two polls
+        :param timeout: Seconds after which waiting is given up
+        :return: The task resource as dictionary
+        :raises RuntimeError: The task could not be read or did not finish within timeout
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            response = await self.get(host, task_uri)
+            if response.status_code not in (200, 202):
+                raise RuntimeError("status code for reading task {} is not 200, code is: {}".format(
+                    task_uri, response.status_code))
+            task = response.json()
+            if task.get('TaskState') in FINISHED_TASK_STATES or task.get('JobState') in ('Completed', 'Failed'):
+                return task
+            if time.monotonic() >= deadline:
+                raise RuntimeError("task {} on iDRAC {} did not finish within {} seconds, state is {}".format(
+                    task_uri, host.ip, timeout, task.get('TaskState') or task.get('JobState')))
+            await asyncio.sleep(interval)
+
+    async def events(self, host, uri=SSE_URI, read_timeout=None, last_event_id=None):
+        """Yields the SseEvents of a server-sent event stream until the iDRAC closes it.
+
+        The stream holds one connection to the host which does not count against per_host.
+
+        :param read_timeout: Seconds without data after which the stream is considered dead, no limit when None
+        :param last_event_id: Id of the last event received before, sent as Last-Event-ID so an iDRAC supporting it
+                              resends the events which were missed
+        :raises RedfishConnectionError: The stream could not be opened or broke
+        """
+        if not self.breaker.allow(host.ip):
+            raise HostUnavailable("iDRAC {} is parked after failed requests".format(host.ip))
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.connect_timeout, sock_read=read_timeout)
+        headers = {'Accept': 'text/event-stream'}
+        if last_event_id is not None:
+            headers['Last-Event-ID'] = last_event_id
+        try:
+            async with self._session.get(host.url(uri), auth=self._auth(host), timeout=timeout,
+                                         headers=headers) as response:
+                if response.status != 200:
+                    self.breaker.record_success(host.ip)
+                    raise RuntimeError("status code for opening the SSE stream of iDRAC {} is not 200, code is: "
+                                       "{}".format(host.ip, response.status))
+                self.breaker.record_success(host.ip)
+                event_id, event, data = None, None, []
+                async for line in response.content:
+                    line = line.rstrip(b'\r\n').decode('utf-8', 'replace')
+                    if not line:
+                        if data:
+                            yield SseEvent(event_id, event, '\n'.join(data))
+                        event, data = None, []
+                        continue
+                    if line.startswith(':'):  # comment, used as keep alive
+                        continue
+                    field, _, value = line.partition(':')
+                    if value.startswith(' '):
+                        value = value[1:]
+                    if field == 'data':
+                        data.append(value)
+                    elif field == 'id':
+                        event_id = value
+                    elif field == 'event':
+                        event = value
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.breaker.record_failure(host.ip)
+            raise RedfishConnectionError("SSE stream of iDRAC {} failed: {}".format(
+                host.ip, str(e) or type(e).__name__)) from e
+
+    async def run(self, hosts, operation):
+        """Runs operation(client, host) for all hosts concurrently.
+
+        :return: The results in the order of the hosts, the exception instead of the result for hosts where the
+                 operation raised one
+        """
+        return await asyncio.gather(*(operation(self, host) for host in hosts), return_exceptions=True)
+
+    @staticmethod
+    def _auth(host):
+        return aiohttp.BasicAuth(host.username, host.password)
+
+
+def run_on_hosts(hosts, operation, client=None):
+    """Runs operation(client, host) for all hosts in a new event loop, see AsyncRedfishClient.run
+
+    :param client: AsyncRedfishClient which is not opened yet, one with default settings when None
+    """
+    async def run():
+        async with (client if client is not None else AsyncRedfishClient()) as opened_client:
+            return await opened_client.run(hosts, operation)
+    return asyncio.run(run())
@@ -0,0 +1,160 @@
+#
+# bulk_delete.py Deletes the members of Redfish collections on many iDRACs concurrently and verifies the result.
+#
+#
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from idrac_telemetry import json_codec
+from idrac_telemetry.circuit_breaker import CircuitBreaker, HostUnavailable
+from idrac_telemetry.hosts import request
+from idrac_telemetry.rate_limiter import AdaptiveRateLimiter
+
+SUBSCRIPTIONS_URI = '/redfish/v1/EventService/Subscriptions'
+REPORT_DEFINITIONS_URI = '/redfish/v1/TelemetryService/MetricReportDefinitions'
+
+logger = logging.getLogger(__name__)
+
+
+class DeleteResult(object):
+    """Outcome of a bulk delete on one iDRAC.
+
+    deleted are the member URIs which are gone according to the verification read, remaining the ones still in the
+    collection and errors the messages of failed requests. verified is False when the verification read failed.
+    """
+
+    __slots__ = ('host', 'requested', 'deleted', 'remaining', 'errors', 'verified')
+
+    def __init__(self, host, requested):
+        self.host = host
+        self.requested = requested
+        self.deleted = []
+        self.remaining = []
+        self.errors = []
+        self.verified = False
+
+    @property
+    def ok(self):
+        return self.verified and not self.remaining
+
+    @property
+    def error(self):
+        """The errors and remaining members as one message, None when ok"""
+        if self.ok:
+            return None
+        messages = list(self.errors)
+        if self.remaining:
+            messages.append("{} of {} members are still present".format(len(self.remaining), len(self.requested)))
+        return "; ".join(messages) or "verification failed"
+
+
+def member_uris(collection):
+    return [member['@odata.id'].rstrip('/') for member in collection.get('Members', [])]
+
+
+class BulkDeleter(object):
+    """Deletes collection members of many iDRACs concurrently.
+
+    Up to host_workers iDRACs are worked on at the same time and up to per_host DELETEs are in flight per iDRAC.
+    The requests of each iDRAC are paced by an AdaptiveRateLimiter which slows down on 503, 429 and slow answers,
+    DELETEs answered with 503 or 429 are retried, honouring Retry-After. iDRACs which stop answering are parked by a
+    CircuitBreaker and their remaining DELETEs fail right away. After the DELETEs of an iDRAC the collection is read
+    once to confirm which members are gone.
+    """
+
+    def __init__(self, per_host=4, host_workers=16, retries=5, timeout=30, limiter=None, breaker=None):
+        """
+        :param per_host: Maximum number of concurrent DELETEs per iDRAC
+        :param host_workers: Number of iDRACs worked on at the same time
+        :param retries: Number of times a DELETE answered with 503 or 429 is retried
+        :param timeout: Timeout in seconds of each request
+        :param limiter: AdaptiveRateLimiter, a new one by default
+        :param breaker: CircuitBreaker, a new one by default
+        """
+        self.per_host = per_host
+        self.host_workers = host_workers
+        self.retries = retries
+        self.timeout = timeout
+        self.limiter = limiter if limiter is not None else AdaptiveRateLimiter()
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+
+    def read_collection(self, host, collection_uri):
+        response = self._request('get', host, collection_uri)
+        if response.status_code != 200:
+            raise RuntimeError("status code for reading {} is not 200, code is: {}".format(
+                collection_uri, response.status_code))
+        return member_uris(json_codec.loads(response.content))
+
+    def delete_members(self, host, collection_uri, members=None):
+        """Deletes members of a collection on one iDRAC.
+
+        :param host: The Host
+        :param collection_uri: URI of the collection, for example REPORT_DEFINITIONS_URI
+        :param members: Member URIs or Ids to delete, all members when None
+        :return: DeleteResult
+        """
+        collection_uri = collection_uri.rstrip('/')
+        if members is None:
+            try:
+                members = self.read_collection(host, collection_uri)
+            except (requests.RequestException, RuntimeError, ValueError) as e:
+                result = DeleteResult(host, [])
+                result.errors.append(str(e))
+                return result
+        requested = [member.rstrip('/') if member.startswith('/') else '{}/{}'.format(collection_uri, member)
+                     for member in members]
+        result = DeleteResult(host, requested)
+        if requested:
+            with ThreadPoolExecutor(max_workers=self.per_host) as executor:
+                for error in executor.map(lambda uri: self._delete(host, uri), requested):
+                    if error:
+                        result.errors.append(error)
+        try:
+            current = set(self.read_collection(host, collection_uri))
+        except (requests.RequestException, RuntimeError, ValueError) as e:
+            result.errors.append("verification failed: {}".format(e))
+            return result
+        result.verified = True
+        for uri in requested:
+            (result.remaining if uri in current else result.deleted).append(uri)
+        return result
+
+    def delete(self, hosts, collection_uri, members=None, callback=None):
+        """Runs delete_members on all hosts concurrently and returns the DeleteResults in the order of the hosts
+
+        :param callback: Called with each DeleteResult as soon as its host is done, from the worker thread
+        """
+        def delete_host(host):
+            result = self.delete_members(host, collection_uri, members)
+            if callback is not None:
+                callback(result)
+            return result
+
+        with ThreadPoolExecutor(max_workers=self.host_workers) as executor:
+            return list(executor.map(delete_host, hosts))
+
+    def _delete(self, host, uri):
+        """Deletes one member, returns None on success and an error message otherwise"""
+        try:
+            response = self._request('delete', host, uri)
+        except (requests.RequestException, HostUnavailable) as e:
+            return "{}: {}".format(uri, e)
+        if response.status_code in (200, 202, 204, 404):
+            return None
+        return "status code for deleting {} is not 200, code is: {}".format(uri, response.status_code)
+
+    def _request(self, method, host, uri):
+        return request(method, host, uri, self.limiter, self.breaker, self.retries, self.timeout)
@@ -0,0 +1,121 @@
+#
+# circuit_breaker.py Parks iDRACs whose requests keep failing and lets single probe requests through later.
+#
+#
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+import logging
+import threading
+import time
+
+# States of a host
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+logger = logging.getLogger(__name__)
+
+
+class HostUnavailable(RuntimeError):
+    """The circuit of the iDRAC is open, the request was not sent"""
+
+
+class BreakerState(object):
+    __slots__ = ('state', 'failures', 'opened_at', 'park_seconds', 'probing')
+
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.park_seconds = 0.0
+        self.probing = False
+
+
+class CircuitBreaker(object):
+    """Circuit breaker per host.
+
+    A host is closed, requests go through, until failure_threshold requests in a row failed. It is then open for
+    reset_timeout seconds and requests fail right away instead of waiting for timeouts of a dead iDRAC. After that one
+    probe request is let through (half-open): success closes the host again, failure opens it for twice as long, up to
+    max_reset_timeout. The breaker only keeps state, it is safe to use from threads and from an event loop.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, max_reset_timeout=600):
+        """
+        :param failure_threshold: Number of failed requests in a row which open a host
+        :param reset_timeout: Seconds a host stays open before it is probed
+        :param max_reset_timeout: Upper limit of the doubled open time of a host whose probes fail
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def allow(self, host):
+        """Returns True if a request to host may be sent now. Every allowed request must be followed by
+        record_success or record_failure."""
+        with self._lock:
+            state = self._states.get(host)
+            if state is None or state.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if state.state == OPEN and now - state.opened_at >= state.park_seconds:
+                state.state = HALF_OPEN
+            # A probe which never reported back, for example because it was cancelled, is replaced by a new one
+            if state.state == HALF_OPEN and (not state.probing or now - state.opened_at >= state.park_seconds):
+                state.probing = True
+                state.opened_at = now
+                return True
+            return False
+
+    def is_parked(self, host):
+        """Returns True if requests to host are refused for now, without taking the probe of a half-open host"""
+        with self._lock:
+            state = self._states.get(host)
+            return state is not None and state.state == OPEN and \
+                time.monotonic() - state.opened_at < state.park_seconds
+
+    def record_success(self, host):
+        with self._lock:
+            state = self._states.get(host)
+            if state is None:
+                return
+            if state.state != CLOSED:
+                logger.info("iDRAC {} answers again, closing its circuit".format(host))
+            del self._states[host]
+
+    def record_failure(self, host):
+        with self._lock:
+            state = self._states.setdefault(host, BreakerState())
+            state.failures += 1
+            if state.state == HALF_OPEN:
+                state.park_seconds = min(state.park_seconds * 2, self.max_reset_timeout)
+            elif state.state == CLOSED and state.failures >= self.failure_threshold:
+                state.park_seconds = self.reset_timeout
+            else:
+                return
+            logger.warning("iDRAC {} failed {} requests in a row, parking it for {:.0f} seconds".format(
+                host, state.failures, state.park_seconds))
+            state.state = OPEN
+            state.opened_at = time.monotonic()
+            state.probing = False
+
+    def state(self, host):
+        with self._lock:
+            state = self._states.get(host)
+            return state.state if state is not None else CLOSED
+
+    def open_hosts(self):
+        """Hosts which are open or half-open"""
+        with self._lock:
+            return sorted(host for host, state in self._states.items() if state.state != CLOSED)
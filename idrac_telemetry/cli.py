@@ -0,0 +1,164 @@
+#
+# cli.py Single idrac-telemetry command running the configuration and report processing scripts as subcommands.
+#
+#
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+import argparse
+import logging
+import os
+import shlex
+import sys
+
+from idrac_telemetry.profiling import add_profile_arguments, profiler_from_arguments
+
+PROG = 'idrac-telemetry'
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+# Subcommand to the script it runs and its description. Only the script of the subcommand is loaded, so a subcommand
+# only pays for the imports it needs.
+COMMANDS = {
+    'enable': ('ConfigurationScripts/EnableOrDisableTelemetryReports.py',
+               'Enable or disable Telemetry and all metric reports'),
+    'delete': ('ConfigurationScripts/DeleteTelemetryReports.py', 'Delete metric report definitions'),
+    'reports': ('ConfigurationScripts/GetTelemetryReports.py', 'Export the metric report definitions to a CSV file'),
+    'subscribe': ('ConfigurationScripts/AddRedfishSubscription.py', 'Add a Redfish subscription'),
+    'unsubscribe': ('ConfigurationScripts/DeleteRedfishSubscription.py', 'Delete Redfish subscriptions'),
+    'subscriptions': ('ConfigurationScripts/SubscriptionManagementREDFISH.py',
+                      'Get, create, delete or listen to Redfish subscriptions and events'),
+    'reconcile': ('ConfigurationScripts/ReconcileRedfishSubscriptions.py',
+                  'Converge the Redfish subscriptions of many iDRACs'),
+    'export': ('ConfigurationScripts/ExportTelemetryConfigurationUsingScpREDFISH.py',
+               'Export the Telemetry configuration with SCP'),
+    'import': ('ConfigurationScripts/ImportTelemetryConfigurationUsingScpREDFISH.py',
+               'Import a Telemetry configuration with SCP'),
+    'apply': ('ConfigurationScripts/ApplyTelemetryConfiguration.py',
+              'Apply the Telemetry attributes of a template with group overrides to many iDRACs'),
+    'process': ('TelemetryReportProcessingScripts/TelemetryRsysLogProcessor.py',
+                'Extract the Telemetry reports of Rsyslog files'),
+    'archive': ('TelemetryReportProcessingScripts/TelemetryReportArchive.py',
+                'Write or read compressed report archives'),
+    'query': ('TelemetryReportProcessingScripts/TelemetryReportQuery.py',
+              'Query saved reports and archives through an index'),
+}
+
+logger = logging.getLogger(__name__)
+
+# Compiled scripts, a batch runs a script many times
+_code = {}
+
+
+def run(command, arguments):
+    """Runs the script of a subcommand in this process as if it was started with the arguments.
+
+    :param command: Name of the subcommand, see COMMANDS
+    :param arguments: List of command line arguments of the script
+    :return: Exit status of the script, 0 when it succeeded
+    """
+    path = os.path.normpath(os.path.join(ROOT, COMMANDS[command][0]))
+    if path not in _code:
+        with open(path, 'rb') as file:
+            _code[path] = compile(file.read(), path, 'exec')
+    saved_argv, saved_path = sys.argv, list(sys.path)
+    sys.argv = ['{} {}'.format(PROG, command)] + list(arguments)
+    try:
+        exec(_code[path], {'__name__': '__main__', '__file__': path, '__package__': None, '__cached__': None})
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    finally:
+        sys.argv, sys.path[:] = saved_argv, saved_path
+    return 0
+
+
+def run_batch(file, stop_on_error=False):
+    """Runs one subcommand per line of a file, for example 'enable -ip 192.168.0.120 -u root -p calvin -a'.
+    Empty lines and lines starting with # are skipped.
+
+    :return: Number of failed commands
+    """
+    failed = total = 0
+    for number, line in enumerate(file, 1):
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+        total += 1
+        try:
+            words = shlex.split(line)
+        except ValueError as e:
+            logger.error("- FAIL, line {}: {}".format(number, e))
+            failed += 1
+            continue
+        if words[0] not in COMMANDS:
+            logger.error("- FAIL, line {}: unknown command '{}'".format(number, words[0]))
+            status = 2
+        else:
+            try:
+                status = run(words[0], words[1:])
+            except Exception as e:
+                logger.exception("- FAIL, line {}: {}".format(number, e))
+                status = 1
+            if status:
+                logger.error("- FAIL, line {}: '{}' exited with status {}".format(number, line.strip(), status))
+        if status:
+            failed += 1
+            if stop_on_error:
+                break
+    logger.info("- INFO, {} of {} commands succeeded".format(total - failed, total))
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog=PROG, description="Run the iDRAC Telemetry scripts as subcommands of one "
+                                     "command. 'batch' runs the subcommands of many lines read from standard input "
+                                     "in a single process.",
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog="commands:\n" + "\n".join("  {:<15}{}".format(name, description)
+                                                                      for name, (_, description) in COMMANDS.items())
+                                     + "\n  {:<15}{}".format('batch', 'Run one command per line of standard input')
+                                     + "\n\nRun '{} <command> -h' for the options of a command. The profiling "
+                                     "options go in front of the command, for example '{} --profile enable.prof "
+                                     "--timing enable -f iDRACs.csv -a'.".format(PROG, PROG))
+    add_profile_arguments(parser)
+    parser.add_argument('command', help='Command to run', choices=sorted(COMMANDS) + ['batch'], metavar='command')
+    parser.add_argument('arguments', help='Options of the command', nargs=argparse.REMAINDER)
+    args = vars(parser.parse_args(argv))
+    profiler = profiler_from_arguments(args)
+    if profiler is None:
+        return run_command(args)
+    logging.basicConfig(format='%(message)s', stream=sys.stdout, level=logging.INFO)
+    profiler.start()
+    try:
+        return run_command(args)
+    finally:
+        profiler.stop()
+
+
+def run_command(args):
+    if args["command"] != 'batch':
+        return run(args["command"], args["arguments"])
+
+    batch_parser = argparse.ArgumentParser(prog='{} batch'.format(PROG),
+                                           description="Run one command per line, for example 'enable -ip "
+                                           "192.168.0.120 -u root -p calvin -a'. The modules are imported once for "
+                                           "all lines.")
+    batch_parser.add_argument('-i', help='File with the commands, default is standard input', required=False)
+    batch_parser.add_argument('--stop-on-error', help='Stop at the first command which fails', action='store_true')
+    batch_args = vars(batch_parser.parse_args(args["arguments"]))
+    logging.basicConfig(format='%(message)s', stream=sys.stdout, level=logging.INFO)
+    if batch_args["i"]:
+        with open(batch_args["i"], encoding='utf-8') as file:
+            failed = run_batch(file, batch_args["stop_on_error"])
+    else:
+        failed = run_batch(sys.stdin, batch_args["stop_on_error"])
+    return 1 if failed else 0
@@ -0,0 +1,156 @@
+#
+# hosts.py iDRAC hosts with their credentials and the HTTP sessions used to talk to them.
+#
+#
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+import logging
+import os
+import threading
+import time
+
+import requests
+
+from idrac_telemetry.circuit_breaker import HostUnavailable
+from idrac_telemetry.rate_limiter import BUSY_STATUS_CODES, retry_after_seconds
+
+HEADERS = {'content-type': 'application/json'}
+
+# Environment variables of the credentials of hosts which have none of their own
+USERNAME_VARIABLE = 'IDRAC_USERNAME'
+PASSWORD_VARIABLE = 'IDRAC_PASSWORD'
+
+_sessions = threading.local()
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_credential(value, variable, username=None):
+    """Returns the credential a reference stands for.
+
+    'env:NAME' is the value of the environment variable NAME, 'keyring:SERVICE' the password of username stored for
+    SERVICE in the system keyring (needs the keyring package), an empty value the environment variable variable and
+    any other value the value itself.
+
+    :raises ValueError: The environment variable or keyring entry does not exist
+    """
+    if not value:
+        return os.environ.get(variable, '')
+    if value.startswith('env:'):
+        if value[4:] not in os.environ:
+            raise ValueError("environment variable {} is not set".format(value[4:]))
+        return os.environ[value[4:]]
+    if value.startswith('keyring:'):
+        try:
+            import keyring
+        except ImportError:
+            raise ValueError("'{}' needs the keyring package, install it with 'pip install keyring'".format(value))
+        secret = keyring.get_password(value[8:], username)
+        if secret is None:
+            raise ValueError("no password of {} for {} in the keyring".format(username, value[8:]))
+        return secret
+    return value
+
+
+class Host(object):
+    """An iDRAC with its credentials and the group it belongs to.
+
+    The credentials can be references like 'env:IDRAC_PASSWORD', see resolve_credential. They are only resolved
+    when they are used, hosts which are filtered out or never contacted cost no environment or keyring lookup.
+    """
+
+    __slots__ = ('ip', 'group', '_username', '_password', '_resolved')
+
+    def __init__(self, ip, username, password, group='default'):
+        self.ip = ip
+        self.group = group
+        self._username = username
+        self._password = password
+        self._resolved = False
+
+    def _resolve(self):
+        if not self._resolved:
+            self._username = resolve_credential(self._username, USERNAME_VARIABLE)
+            self._password = resolve_credential(self._password, PASSWORD_VARIABLE, self._username)
+            self._resolved = True
+
+    @property
+    def username(self):
+        self._resolve()
+        return self._username
+
+    @property
+    def password(self):
+        self._resolve()
+        return self._password
+
+    @property
+    def auth(self):
+        self._resolve()
+        return self._username, self._password
+
+    def url(self, uri):
+        return 'https://{}{}'.format(self.ip, uri)
+
+
+def session():
+    """requests.Session of the calling thread, connections to an iDRAC are reused between requests"""
+    if not hasattr(_sessions, 'session'):
+        _sessions.session = requests.Session()
+        _sessions.session.verify = False
+        _sessions.session.headers.update(HEADERS)
+    return _sessions.session
+
+
+def request(method, host, uri, limiter=None, breaker=None, retries=3, timeout=30, **kwargs):
+    """Sends a request with the session of the calling thread, paced and guarded per iDRAC.
+
+    :param method: 'get', 'patch', 'post' or 'delete'
+    :param host: The Host
+    :param uri: URI starting with /redfish
+    :param limiter: AdaptiveRateLimiter pacing the requests to the iDRAC, not paced when None
+    :param breaker: CircuitBreaker parking the iDRAC after failed connections, not guarded when None
+    :param retries: Number of times a request answered with 503 or 429 is sent again
+    :param timeout: Timeout in seconds of each request
+    :param kwargs: Further arguments of requests, for example data
+    :return: requests.Response, a 503 or 429 one once the retries are used up
+    :raises requests.RequestException: The iDRAC could not be reached or did not answer in time
+    :raises HostUnavailable: The iDRAC is parked by breaker
+    """
+    for attempt in range(retries + 1):
+        if breaker is not None and breaker.is_parked(host.ip):
+            raise HostUnavailable("iDRAC {} is parked after failed requests".format(host.ip))
+        if limiter is not None:
+            limiter.acquire(host.ip)
+        if breaker is not None and not breaker.allow(host.ip):
+            raise HostUnavailable("iDRAC {} is parked after failed requests".format(host.ip))
+        started = time.monotonic()
+        try:
+            response = session().request(method, host.url(uri), auth=host.auth, timeout=timeout, **kwargs)
+        except requests.RequestException:
+            if limiter is not None:
+                limiter.record(host.ip, time.monotonic() - started)
+            if breaker is not None:
+                breaker.record_failure(host.ip)
+            raise
+        if limiter is not None:
+            limiter.record(host.ip, time.monotonic() - started, response.status_code,
+                           retry_after_seconds(response.headers))
+        if breaker is not None:
+            breaker.record_success(host.ip)
+        if response.status_code not in BUSY_STATUS_CODES or attempt == retries:
+            return response
+        if limiter is None:
+            time.sleep(retry_after_seconds(response.headers) or 2 ** attempt)
+        logger.debug("iDRAC {} answered {} {} with {}, retrying".format(host.ip, method.upper(), uri,
+                                                                       response.status_code))
+    return response
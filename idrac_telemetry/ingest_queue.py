@@ -0,0 +1,307 @@
+#
+# ingest_queue.py Bounded queue between the ingestion of Telemetry reports (SSE, POST, Rsyslog) and slow sinks.
+#
+#
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+import asyncio
+import logging
+import os
+import re
+import struct
+import threading
+import time
+from collections import deque
+
+POLICIES = ['block', 'drop-oldest', 'sample']
+
+# Record header of the spill file: length of the report type and of the payload
+_SPILL_HEADER = struct.Struct('>HI')
+
+# Read bytes after which a spill file is compacted, also the size of the blocks moved by a compaction
+_SPILL_COMPACT_BYTES = 1 << 20
+
+# Id of a MetricReport, MetricValues only contain MetricId
+_REPORT_ID = re.compile(rb'"Id"\s*:\s*"([^"]+)"')
+
+logger = logging.getLogger(__name__)
+
+
+def metric_report_id(payload):
+    """Returns the Id of the MetricReport in payload without decoding the JSON, 'unknown' if there is none"""
+    match = _REPORT_ID.search(payload)
+    return match.group(1).decode('utf-8', 'replace') if match else 'unknown'
+
+
+def parse_sample_rates(value):
+    """Parses 'CPUSensor=10,NICStatistics=5' into {'CPUSensor': 10, 'NICStatistics': 5}, '*' sets the default"""
+    rates = {}
+    for item in (value or '').split(','):
+        if not item.strip():
+            continue
+        report_type, _, rate = item.partition('=')
+        rates[report_type.strip()] = int(rate)
+    return rates
+
+
+def add_queue_arguments(parser):
+    """Adds the queue options shared by the collectors to an argparse parser"""
+    parser.add_argument('--queue-size', help='Maximum number of reports held in memory between receiving and '
+                        'processing them', type=int, default=1000)
+    parser.add_argument('--queue-policy', help='What happens when the queue is full: block the receiver, drop the '
+                        'oldest report or sample reports by type. Possible values are {}'.format(', '.join(POLICIES)),
+                        choices=POLICIES, default='block')
+    parser.add_argument('--sample-rates', help="Keep one of N reports of a type while sampling, for example "
+                        "'*=10,PowerMetrics=1' keeps all PowerMetrics and one of ten other reports",
+                        default='*=10')
+    parser.add_argument('--spill-folder', help='Write reports to this folder instead of applying the queue policy '
+                        'when the queue is full, they are processed once the queue drained', required=False)
+    parser.add_argument('--queue-stats-interval', help='Seconds between queue depth log lines, 0 disables them',
+                        type=int, default=60)
+
+
+def queue_from_arguments(args):
+    """Returns the BoundedReportQueue configured by the options of add_queue_arguments"""
+    return BoundedReportQueue(args["queue_size"], args["queue_policy"], parse_sample_rates(args["sample_rates"]),
+                              args["spill_folder"])
+
+
+class SpillFile(object):
+    """FIFO of reports in a file, appended at the end and read from the front. Emptied files are truncated, and once
+    more than half of a file was read the unread reports are moved to its front, so a file which never empties under
+    sustained overload does not grow beyond twice its unread reports."""
+
+    def __init__(self, folder):
+        os.makedirs(folder, exist_ok=True)
+        self.path = os.path.join(folder, 'spill-{}.bin'.format(os.getpid()))
+        self.file = open(self.path, 'w+b')
+        self.read_offset = 0
+        self.count = 0
+        self.size = 0
+
+    def append(self, report_type, payload):
+        encoded_type = report_type.encode('utf-8')
+        self.file.seek(0, os.SEEK_END)
+        self.file.write(_SPILL_HEADER.pack(len(encoded_type), len(payload)) + encoded_type + payload)
+        self.count += 1
+        self.size = self.file.tell()
+
+    def pop(self):
+        self.file.flush()
+        self.file.seek(self.read_offset)
+        type_length, payload_length = _SPILL_HEADER.unpack(self.file.read(_SPILL_HEADER.size))
+        report_type = self.file.read(type_length).decode('utf-8')
+        payload = self.file.read(payload_length)
+        self.read_offset = self.file.tell()
+        self.count -= 1
+        if self.count == 0:
+            self.file.truncate(0)
+            self.read_offset = self.size = 0
+        elif self.read_offset >= _SPILL_COMPACT_BYTES and self.read_offset * 2 >= self.size:
+            self._compact()
+        return report_type, payload
+
+    def _compact(self):
+        """Moves the unread reports to the front of the file and truncates it"""
+        written = 0
+        while self.read_offset + written < self.size:
+            self.file.seek(self.read_offset + written)
+            block = self.file.read(_SPILL_COMPACT_BYTES)
+            self.file.seek(written)
+            self.file.write(block)
+            written += len(block)
+        self.file.truncate(written)
+        self.read_offset, self.size = 0, written
+
+    def close(self):
+        self.file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class BoundedReportQueue(object):
+    """Thread-safe bounded FIFO of (report type, payload) items.
+
+    When the queue holds maxsize items, put applies the policy:
+
+    - 'block' waits until a consumer took an item, the receiver slows down instead of the collector growing
+    - 'drop-oldest' discards the oldest queued item, the freshest data is kept
+    - 'sample' keeps one of N reports of a type from the moment the queue is three quarters full, N comes from
+      sample_rates ('*' is the default rate). A kept report still replaces the oldest one when the queue is full
+
+    With a spill_folder, items which do not fit are appended to a spill file instead and given to the consumers once
+    the memory queue drained. Payloads must be bytes to be spilled. Items keep their order in all cases.
+    """
+
+    def __init__(self, maxsize=1000, policy='block', sample_rates=None, spill_folder=None):
+        """
+        :param maxsize: Maximum number of items held in memory
+        :param policy: One of POLICIES
+        :param sample_rates: Dictionary of report type to N for the 'sample' policy
+        :param spill_folder: Folder of the spill file, no spilling when None
+        """
+        if policy not in POLICIES:
+            raise ValueError("Unknown queue policy '{}', possible values are {}".format(policy, ', '.join(POLICIES)))
+        self.maxsize = maxsize
+        self.policy = policy
+        self.sample_rates = dict(sample_rates or {})
+        self.sample_watermark = max(1, maxsize * 3 // 4)
+        self.spill = SpillFile(spill_folder) if spill_folder else None
+        self._items = deque()
+        self._sample_counters = {}
+        self._closed = False
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self.statistics = {'enqueued': 0, 'dequeued': 0, 'dropped': 0, 'sampled_out': 0, 'spilled': 0,
+                           'blocked_seconds': 0.0, 'high_water': 0}
+
+    def put(self, report_type, payload):
+        """Queues a report, returns False when the policy discarded it"""
+        with self._lock:
+            if self._closed:
+                raise ValueError("put on a closed queue")
+            if self.policy == 'sample' and len(self._items) >= self.sample_watermark and \
+                    not self._sample(report_type):
+                self.statistics['sampled_out'] += 1
+                return False
+            if self.spill is not None and (self.spill.count or len(self._items) >= self.maxsize):
+                self.spill.append(report_type, payload)
+                self.statistics['spilled'] += 1
+                self.statistics['enqueued'] += 1
+                self._not_empty.notify()
+                return True
+            if len(self._items) >= self.maxsize:
+                if self.policy == 'block':
+                    start = time.monotonic()
+                    while len(self._items) >= self.maxsize and not self._closed:
+                        self._not_full.wait()
+                    self.statistics['blocked_seconds'] += time.monotonic() - start
+                    if self._closed:
+                        return False
+                else:
+                    self._items.popleft()
+                    self.statistics['dropped'] += 1
+            self._items.append((report_type, payload))
+            self.statistics['enqueued'] += 1
+            self.statistics['high_water'] = max(self.statistics['high_water'], len(self._items))
+            self._not_empty.notify()
+            return True
+
+    def get(self, timeout=None):
+        """Returns the next (report type, payload), None when the timeout expired or the queue is closed and empty"""
+        with self._lock:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while not self._items and not (self.spill is not None and self.spill.count):
+                if self._closed:
+                    return None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._not_empty.wait(remaining)
+            if self._items:
+                item = self._items.popleft()
+            else:
+                item = self.spill.pop()
+            self.statistics['dequeued'] += 1
+            self._not_full.notify()
+            return item
+
+    def close(self):
+        """Wakes up blocked producers and lets consumers finish the queued items"""
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+    def depth(self):
+        with self._lock:
+            return len(self._items) + (self.spill.count if self.spill is not None else 0)
+
+    def metrics(self):
+        """Queue depth and counters, safe to call from any thread"""
+        with self._lock:
+            metrics = dict(self.statistics)
+            metrics['depth'] = len(self._items)
+            metrics['spill_depth'] = self.spill.count if self.spill is not None else 0
+            metrics['spill_bytes'] = self.spill.size if self.spill is not None else 0
+            metrics['maxsize'] = self.maxsize
+            return metrics
+
+    def _sample(self, report_type):
+        rate = self.sample_rates.get(report_type, self.sample_rates.get('*', 1))
+        counter = self._sample_counters.get(report_type, 0)
+        self._sample_counters[report_type] = counter + 1
+        return rate <= 1 or counter % rate == 0
+
+
+class ReportPipeline(object):
+    """Runs sink(report_type, payload) in consumer threads for the items of a BoundedReportQueue.
+
+    The receiving loop only calls submit, a slow sink fills the queue instead of stalling the connection to the
+    iDRAC. Exceptions of the sink are logged and the item is dropped.
+    """
+
+    def __init__(self, report_queue, sink, workers=1, stats_interval=60):
+        """
+        :param report_queue: BoundedReportQueue
+        :param sink: Callable taking the report type and payload
+        :param workers: Number of consumer threads
+        :param stats_interval: Seconds between queue metric log lines, 0 disables them
+        """
+        self.queue = report_queue
+        self.sink = sink
+        self.stats_interval = stats_interval
+        self._stopped = threading.Event()
+        self._threads = [threading.Thread(target=self._consume, name='report-sink-{}'.format(number), daemon=True)
+                         for number in range(workers)]
+        if stats_interval:
+            self._threads.append(threading.Thread(target=self._log_metrics, name='report-queue-stats', daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, report_type, payload):
+        return self.queue.put(report_type, payload)
+
+    async def submit_async(self, report_type, payload):
+        """submit for receivers running in an asyncio event loop. With the 'block' policy the put runs in the default
+        executor, so only the awaiting receiver waits for room while the event loop keeps serving the others."""
+        if self.queue.policy == 'block':
+            return await asyncio.get_running_loop().run_in_executor(None, self.queue.put, report_type, payload)
+        return self.queue.put(report_type, payload)
+
+    def close(self, timeout=None):
+        """Stops accepting reports and waits for the consumers to drain the queue"""
+        self.queue.close()
+        self._stopped.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        if self.queue.spill is not None:
+            self.queue.spill.close()
+
+    def _consume(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            try:
+                self.sink(*item)
+            except Exception as e:
+                logger.error("- FAIL, report sink failed for a {} report: {}".format(item[0], e))
+
+    def _log_metrics(self):
+        while not self._stopped.wait(self.stats_interval):
+            logger.info("- INFO, report queue: {}".format(", ".join(
+                "{} {}".format(name, round(value, 1) if isinstance(value, float) else value)
+                for name, value in sorted(self.queue.metrics().items()))))
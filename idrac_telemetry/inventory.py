@@ -0,0 +1,159 @@
+#
+# inventory.py Reads the iDRAC hosts of CSV files, YAML files or folders of them, selected by group and shard.
+#
+#
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+import argparse
+import csv
+import fnmatch
+import os
+import zlib
+
+from idrac_telemetry.hosts import Host
+
+DEFAULT_GROUP = 'default'
+CSV_SUFFIXES = ('.csv',)
+YAML_SUFFIXES = ('.yaml', '.yml')
+
+
+def parse_shard(value):
+    """Parses '3/8', the third of eight shards, into (3, 8)"""
+    index, _, count = value.partition('/')
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        raise argparse.ArgumentTypeError("'{}' is not a shard like 3/8".format(value))
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError("shard {} is not between 1 and {}".format(index, count))
+    return index, count
+
+
+def in_shard(ip, shard):
+    """Returns True if the host belongs to the shard (index, count). The shard only depends on the address, the same
+    host is in the same shard whatever the order or content of the inventory."""
+    index, count = shard
+    return zlib.crc32(ip.encode('utf-8')) % count == index - 1
+
+
+def group_selector(selectors):
+    """Returns a function telling if a group is selected.
+
+    :param selectors: Comma separated group names or fnmatch patterns like 'rack1,rack2*'. Patterns starting with !
+                      exclude the matching groups, 'rack*,!rack9' selects all racks but rack9. None selects all groups.
+    """
+    patterns = [pattern.strip() for pattern in (selectors or '').split(',') if pattern.strip()]
+    include = [pattern for pattern in patterns if not pattern.startswith('!')]
+    exclude = [pattern[1:] for pattern in patterns if pattern.startswith('!')]
+
+    def selected(group):
+        if include and not any(fnmatch.fnmatchcase(group, pattern) for pattern in include):
+            return False
+        return not any(fnmatch.fnmatchcase(group, pattern) for pattern in exclude)
+    return selected
+
+
+def iter_csv(path):
+    """Yields the hosts of a CSV file in the format of iDRACs.csv: a header line, then IP address, username,
+    password and an optional group. Missing or empty credentials are taken from the environment, see Host."""
+    with open(path, encoding='utf-8-sig', newline='') as file:
+        csv_reader = csv.reader(file)
+        next(csv_reader, None)
+        for line in csv_reader:
+            if not line or not line[0].strip() or line[0].lstrip().startswith('#'):
+                continue
+            line += [''] * (4 - len(line))
+            yield Host(line[0].strip(), line[1], line[2], line[3].strip() or DEFAULT_GROUP)
+
+
+def iter_yaml(path):
+    """Yields the hosts of a YAML file, needs the PyYAML package. Unlike a CSV file, the file is parsed as a whole
+    before the first host is yielded:
+
+        defaults:                       # optional, applies to all hosts of the file
+          username: root
+          password: env:IDRAC_PASSWORD
+          group: rack1
+        hosts:
+          - 192.168.0.120               # address only, everything else from defaults
+          - ip: 192.168.0.121
+            group: rack2
+            password: keyring:idrac
+    """
+    try:
+        import yaml
+    except ImportError:
+        raise ValueError("'{}' needs the PyYAML package, install it with 'pip install pyyaml'".format(path))
+    with open(path, 'rb') as file:
+        document = yaml.safe_load(file) or {}
+    if isinstance(document, list):
+        document = {'hosts': document}
+    defaults = document.get('defaults') or {}
+    for entry in document.get('hosts') or []:
+        if not isinstance(entry, dict):
+            entry = {'ip': entry}
+        settings = dict(defaults, **entry)
+        if settings.get('ip') is None:
+            raise ValueError("'{}': host entry {} has no ip".format(path, entry))
+        yield Host(str(settings['ip']).strip(), settings.get('username', ''), settings.get('password', ''),
+                   str(settings.get('group', DEFAULT_GROUP)))
+
+
+def iter_source(path):
+    """Yields the hosts of a CSV or YAML file or of all such files of a folder and its subfolders, in name order"""
+    if os.path.isdir(path):
+        for root, folders, files in os.walk(path):
+            folders.sort()
+            for name in sorted(files):
+                if name.lower().endswith(CSV_SUFFIXES + YAML_SUFFIXES):
+                    yield from iter_source(os.path.join(root, name))
+    elif path.lower().endswith(YAML_SUFFIXES):
+        yield from iter_yaml(path)
+    else:
+        yield from iter_csv(path)
+
+
+def iter_hosts(sources, groups=None, shard=None):
+    """Yields the selected hosts of the inventory sources one at a time, a host listed twice is yielded once. CSV
+    files are read line by line, YAML files one file at a time.
+
+    :param sources: Paths of CSV files, YAML files or folders
+    :param groups: Group selectors, see group_selector
+    :param shard: (index, count) to only yield the hosts of one of count runners, see in_shard
+    :raises OSError: A source can not be read
+    :raises ValueError: A YAML source is invalid or PyYAML is not installed
+    """
+    selected = group_selector(groups)
+    seen = set()
+    for source in sources:
+        for host in iter_source(source):
+            if host.ip in seen:
+                continue
+            # The first entry of a host counts, also when it is not selected
+            seen.add(host.ip)
+            if selected(host.group) and (shard is None or in_shard(host.ip, shard)):
+                yield host
+
+
+def add_inventory_arguments(parser):
+    """Adds the host selection options of the fleet scripts to an argparse parser"""
+    parser.add_argument('--group', help="Only the iDRACs of these groups, comma separated names or patterns, "
+                        "patterns starting with ! exclude groups, for example 'rack*,!rack9'", required=False)
+    parser.add_argument('--shard', help="Only the iDRACs of one shard when several runners split the inventory, for "
+                        "example 3/8 for the third of eight runners", type=parse_shard, required=False)
+
+
+def hosts_from_arguments(args, sources):
+    """Returns an iterator of the hosts of the sources selected by the options of add_inventory_arguments"""
+    if isinstance(sources, str):
+        sources = [source.strip() for source in sources.split(',') if source.strip()]
+    return iter_hosts(sources, args["group"], args["shard"])
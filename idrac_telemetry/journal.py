@@ -0,0 +1,141 @@
+#
+# journal.py Journal of the per-iDRAC steps of a fleet operation, to resume it after an interruption.
+#
+#
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+import logging
+import os
+import threading
+import time
+
+from idrac_telemetry import json_codec
+
+# Step recorded once all steps of a host succeeded
+HOST_DONE = '*'
+
+logger = logging.getLogger(__name__)
+
+
+def add_journal_arguments(parser):
+    """Adds the journal options of the fleet scripts to an argparse parser"""
+    parser.add_argument('--journal', help='File recording the result of every step on every iDRAC of the CSV file',
+                        required=False)
+    parser.add_argument('--resume', help='Continue the operation recorded in --journal: iDRACs and steps which '
+                        'succeeded are skipped, failed and missing ones are run again', action='store_true')
+
+
+def journal_from_arguments(args, operation):
+    """Returns the FleetJournal of the options of add_journal_arguments, None when no journal is kept
+
+    :raises ValueError: --resume of a journal recorded for a different operation
+    """
+    if args["resume"] and not args["journal"]:
+        raise ValueError("--resume needs the --journal file of the interrupted run")
+    if not args["journal"]:
+        return None
+    return FleetJournal(args["journal"], operation, resume=args["resume"])
+
+
+class FleetJournal(object):
+    """Append-only journal of a fleet operation.
+
+    The first line describes the operation, every further line is the outcome of one step on one host:
+    {"h": host, "s": step, "ok": true} or with "ok": false and the error as "e". A line is written and flushed as soon
+    as a step finished, so an interrupted run loses at most the steps in flight. A resumed journal is read back and
+    appended to, the last outcome of a step counts.
+    """
+
+    def __init__(self, path, operation, resume=False):
+        """
+        :param path: Journal file
+        :param operation: Description of the operation and its parameters, a journal is only resumed by the same one
+        :param resume: Read and continue an existing journal instead of starting a new one
+        :raises ValueError: The journal to resume was written for another operation
+        """
+        self.path = path
+        self.operation = operation
+        self._results = {}
+        self._lock = threading.Lock()
+        if resume and os.path.exists(path) and os.path.getsize(path):
+            complete_line = self._load()
+            self._file = open(path, 'ab')
+            if not complete_line:
+                self._file.write(b'\n')
+        else:
+            self._file = open(path, 'wb')
+            self._write({'operation': operation, 'started': time.strftime('%Y-%m-%dT%H:%M:%S%z')})
+
+    def _load(self):
+        """Reads the results of the journal, returns False if it ends with an incomplete line"""
+        with open(self.path, 'rb') as file:
+            data = file.read()
+        lines = data.splitlines()
+        header = json_codec.loads(lines[0]) if lines else {}
+        if header.get('operation') != self.operation:
+            raise ValueError("Journal '{}' was recorded for '{}', not for '{}'".format(
+                self.path, header.get('operation'), self.operation))
+        for line in lines[1:]:
+            try:
+                entry = json_codec.loads(line)
+            except ValueError:  # line cut short by the interruption
+                continue
+            self._results.setdefault(entry['h'], {})[entry['s']] = (entry['ok'], entry.get('e'))
+        return data.endswith(b'\n')
+
+    def _write(self, entry):
+        self._file.write(json_codec.dumps_bytes(entry, 'compact') + b'\n')
+        self._file.flush()
+
+    def record(self, host, step, ok, error=None):
+        """Records the outcome of a step, error is the message of a failed one"""
+        entry = {'h': host, 's': step, 'ok': bool(ok)}
+        if error:
+            entry['e'] = str(error)
+        with self._lock:
+            self._results.setdefault(host, {})[step] = (bool(ok), error)
+            self._write(entry)
+
+    def done(self, host, step=HOST_DONE):
+        """Returns True if the step, by default the whole host, succeeded before"""
+        with self._lock:
+            return self._results.get(host, {}).get(step, (False, None))[0]
+
+    def failures(self):
+        """Dictionary of host to the list of (step, error) of its failed steps, in the order the hosts failed"""
+        with self._lock:
+            failed = {}
+            for host, steps in self._results.items():
+                for step, (ok, error) in steps.items():
+                    if not ok:
+                        failed.setdefault(host, []).append((step, error))
+            return failed
+
+    def log_summary(self, hosts):
+        """Logs how many of the hosts are done and the failed steps of the others, returns True if all are done"""
+        pending = [host for host in hosts if not self.done(host)]
+        failures = self.failures()
+        logger.info("- INFO, journal '{}': {} of {} iDRACs done".format(self.path, len(hosts) - len(pending),
+                                                                        len(hosts)))
+        for host in pending:
+            for step, error in failures.get(host, [('not run', None)]):
+                if step == HOST_DONE:
+                    step = 'failed'
+                logger.error("- FAIL, iDRAC {}: {}{}".format(host, step, ": {}".format(error) if error else ""))
+        if pending:
+            logger.info("- INFO, run again with --journal {} --resume to retry only these {} iDRACs".format(
+                self.path, len(pending)))
+        return not pending
+
+    def close(self):
+        with self._lock:
+            self._file.close()
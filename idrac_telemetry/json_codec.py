@@ -0,0 +1,115 @@
+#
+# json_codec.py JSON encoding and decoding with the fastest installed JSON library.
+#
+#
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+LIBRARIES = ['auto', 'orjson', 'ujson', 'json']
+FORMATS = ['default', 'compact']
+
+
+def available_libraries():
+    """Returns the names of the installed JSON libraries, fastest first"""
+    return [name for name, module in (('orjson', orjson), ('ujson', ujson)) if module is not None] + ['json']
+
+
+class JsonCodec(object):
+    """JSON codec using orjson or ujson when one is installed and the standard library json module otherwise.
+
+    Decoding always gives the same objects as json.loads. For encoding there are two formats:
+
+    - 'default' is byte-identical to json.dumps(obj) and is used wherever the produced text is kept, for example the
+      report files written by TelemetryRsysLogProcessor.py. Only the standard library encoder produces it.
+    - 'compact' is json.dumps(obj, separators=(',', ':'), ensure_ascii=False) and is produced by the fast library.
+      The output is identical for Redfish payloads, only floats in exponent notation are written differently
+      (1e-07 versus 1e-7).
+    """
+
+    def __init__(self, library='auto'):
+        """
+        :param library: 'orjson', 'ujson', 'json' or 'auto' for the fastest installed one. A library which is not
+                        installed falls back to the standard library json module.
+        """
+        if library not in LIBRARIES:
+            raise ValueError("Unknown JSON library '{}', possible values are {}".format(library, ', '.join(LIBRARIES)))
+        installed = available_libraries()
+        self.library = installed[0] if library == 'auto' else (library if library in installed else 'json')
+        if self.library == 'orjson':
+            self._loads = orjson.loads
+            self._dumps_compact = self._orjson_dumps
+        elif self.library == 'ujson':
+            self._loads = ujson.loads
+            self._dumps_compact = self._ujson_dumps
+        else:
+            self._loads = json.loads
+            self._dumps_compact = self._json_dumps
+
+    def loads(self, data):
+        """Decodes a JSON document given as str, bytes or bytearray"""
+        try:
+            return self._loads(data)
+        except ValueError:
+            # orjson and ujson reject some valid documents, like integers beyond 64 bits
+            if self._loads is json.loads:
+                raise
+            return json.loads(data)
+
+    def dumps(self, obj, json_format='default'):
+        """Encodes obj in the given json_format and returns a str"""
+        if json_format == 'compact':
+            return self._dumps_compact(obj)
+        return json.dumps(obj)
+
+    def dumps_bytes(self, obj, json_format='default'):
+        """Encodes obj in the given json_format and returns UTF-8 encoded bytes"""
+        if json_format == 'compact' and self.library == 'orjson':
+            try:
+                return orjson.dumps(obj)
+            except TypeError:
+                pass
+        return self.dumps(obj, json_format).encode('utf-8')
+
+    @staticmethod
+    def _orjson_dumps(obj):
+        try:
+            return orjson.dumps(obj).decode('utf-8')
+        except TypeError:  # non str keys and types orjson does not serialize
+            return JsonCodec._json_dumps(obj)
+
+    @staticmethod
+    def _ujson_dumps(obj):
+        try:
+            return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False)
+        except (TypeError, OverflowError):
+            return JsonCodec._json_dumps(obj)
+
+    @staticmethod
+    def _json_dumps(obj):
+        return json.dumps(obj, separators=(',', ':'), ensure_ascii=False)
+
+
+default_codec = JsonCodec()
+loads = default_codec.loads
+dumps = default_codec.dumps
+dumps_bytes = default_codec.dumps_bytes
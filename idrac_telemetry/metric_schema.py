@@ -0,0 +1,330 @@
+#
+# metric_schema.py Compact encoding of Telemetry reports against MetricReportDefinition snapshots.
+#
+#
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+import glob
+import hashlib
+import os
+import tempfile
+import threading
+
+from idrac_telemetry import json_codec
+from idrac_telemetry.metric_values import value_context
+
+SCHEMA_SUFFIX = '.schema'
+HOSTS_FILE = 'hosts.json'
+
+# Key of an encoded report, Redfish properties never start with $
+SCHEMA_KEY = '$schema'
+
+REPORT_TYPE = '#MetricReport.v1_4_2.MetricReport'
+REPORT_CONTEXT = '/redfish/v1/$metadata#MetricReport.MetricReport'
+# Properties of an encoded report which are kept as they are
+KEPT_PROPERTIES = ('Id', 'ReportSequence', 'Timestamp')
+REPORT_PROPERTIES = ('@odata.type', '@odata.context', '@odata.id', 'Id', 'Name', 'ReportSequence', 'Timestamp',
+                     'MetricReportDefinition')
+_MISSING = object()
+
+
+def add_schema_arguments(parser):
+    """Adds the metric schema option to an argparse parser"""
+    parser.add_argument('--schema-folder', help='Metric schema registry written by GetTelemetryReports.py '
+                        '--schema-folder. Archived and published reports are encoded against the MetricReportDefinitions '
+                        'of the firmware of their iDRAC, which makes them several times smaller', required=False)
+
+
+def schemas_from_arguments(args):
+    """Returns the SchemaRegistry of the options of add_schema_arguments, None when no folder is given"""
+    return SchemaRegistry(args["schema_folder"]) if args["schema_folder"] else None
+
+
+def schema_id(firmware, reports):
+    """Returns the Id of the schema of a firmware version and its MetricIds per report: the firmware version and a
+    hash of the MetricIds, as custom MetricReportDefinitions differ between iDRACs of the same firmware"""
+    digest = hashlib.sha1(json_codec.dumps_bytes(sorted(reports.items()), 'compact')).hexdigest()[:8]
+    safe_firmware = ''.join(character if character.isalnum() or character in '.-' else '_'
+                            for character in firmware or 'unknown')
+    return '{}-{}'.format(safe_firmware, digest)
+
+
+class MetricSchema(object):
+    """MetricIds of the MetricReportDefinitions of an iDRAC firmware version, in definition order"""
+
+    def __init__(self, schema_id, firmware, reports):
+        """
+        :param schema_id: Id of the schema, see schema_id
+        :param firmware: iDRAC firmware version
+        :param reports: Dictionary of report Id to the list of its MetricIds
+        """
+        self.id = schema_id
+        self.firmware = firmware
+        self.reports = reports
+        self._numbers = {report_id: {metric_id: number for number, metric_id in enumerate(metric_ids)}
+                         for report_id, metric_ids in reports.items()}
+
+    def numbers(self, report_id):
+        """Returns the dictionary of MetricId to its number in a report, empty for unknown reports"""
+        return self._numbers.get(report_id, {})
+
+    def to_dict(self):
+        return {'id': self.id, 'firmware': self.firmware, 'reports': self.reports}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['id'], data.get('firmware'), data['reports'])
+
+
+class SchemaRegistry(object):
+    """Folder of metric schemas, one <id>.schema file per firmware version and set of MetricReportDefinitions, and
+    hosts.json with the schema of every iDRAC. Schema files are never changed once written, reports encoded against
+    them stay readable. The same files are kept in report archives, which makes an archive readable on its own."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self._schemas = {}
+        self._hosts = None
+        self._latest_id = _MISSING
+        self._lock = threading.Lock()
+
+    def snapshot(self, hosts, firmware, reports):
+        """Stores the MetricIds of the reports of an iDRAC and makes it the schema of the iDRAC
+
+        :param hosts: Addresses and names of the iDRAC, like its IP address and the host name its Rsyslog messages
+                      are tagged with
+        :param firmware: Firmware version of the iDRAC
+        :param reports: Dictionary of report Id to the list of its MetricIds
+        :return: The MetricSchema
+        """
+        schema = MetricSchema(schema_id(firmware, reports), firmware, reports)
+        self.add(schema)
+        with self._lock:
+            schema_ids = dict(self._load_hosts())
+            schema_ids.update((host, schema.id) for host in hosts)
+            self._write(HOSTS_FILE, schema_ids)
+            self._hosts = schema_ids
+        return schema
+
+    def add(self, schema):
+        """Writes a schema to the folder unless it is there already"""
+        if schema.id in self._schemas:
+            return
+        with self._lock:
+            self._schemas[schema.id] = schema
+            if not os.path.exists(os.path.join(self.folder, schema.id + SCHEMA_SUFFIX)):
+                self._write(schema.id + SCHEMA_SUFFIX, schema.to_dict())
+
+    def schema(self, schema_id):
+        """Returns the MetricSchema of an Id
+
+        :raises KeyError: The schema is not in the folder
+        """
+        schema = self._schemas.get(schema_id)
+        if schema is None:
+            try:
+                with open(os.path.join(self.folder, os.path.basename(schema_id) + SCHEMA_SUFFIX), 'rb') as file:
+                    schema = MetricSchema.from_dict(json_codec.loads(file.read()))
+            except FileNotFoundError:
+                raise KeyError("Metric schema '{}' is not in '{}'".format(schema_id, self.folder))
+            self._schemas[schema_id] = schema
+        return schema
+
+    def schema_for(self, host):
+        """Returns the MetricSchema of an iDRAC, the most recent snapshot when the iDRAC has none and None when the
+        folder holds no schema. The schema only decides how small the encoded reports are, never if they decode."""
+        with self._lock:
+            hosts = self._load_hosts()
+        schema_id = hosts.get(host)
+        if schema_id is None:
+            if self._latest_id is _MISSING:
+                self._latest_id = self._latest()
+            if self._latest_id is None:
+                return None
+            schema_id = self._latest_id
+        return self.schema(schema_id)
+
+    def _latest(self):
+        paths = glob.glob(os.path.join(self.folder, '*' + SCHEMA_SUFFIX))
+        if not paths:
+            return None
+        return os.path.basename(max(paths, key=os.path.getmtime))[:-len(SCHEMA_SUFFIX)]
+
+    def _load_hosts(self):
+        if self._hosts is None:
+            try:
+                with open(os.path.join(self.folder, HOSTS_FILE), 'rb') as file:
+                    self._hosts = json_codec.loads(file.read())
+            except FileNotFoundError:
+                self._hosts = {}
+        return self._hosts
+
+    def _write(self, name, data):
+        """Replaces a file of the folder atomically"""
+        os.makedirs(self.folder, exist_ok=True)
+        descriptor, temporary_path = tempfile.mkstemp(dir=self.folder, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(json_codec.dumps_bytes(data, 'compact'))
+            os.replace(temporary_path, os.path.join(self.folder, name))
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+
+
+def _standard_properties(report_id):
+    return {'@odata.type': REPORT_TYPE, '@odata.context': REPORT_CONTEXT,
+            '@odata.id': '/redfish/v1/TelemetryService/MetricReports/{}'.format(report_id),
+            'Name': '{} Metric Report'.format(report_id),
+            'MetricReportDefinition': {'@odata.id': '/redfish/v1/TelemetryService/MetricReportDefinitions/{}'.format(
+                report_id)}}
+
+
+def _template(text, context, metric_id):
+    if context:
+        text = text.replace(context, '{c}')
+    return text.replace(metric_id, '{m}')
+
+
+def _fill(template, context, metric_id):
+    return template.replace('{c}', context).replace('{m}', metric_id)
+
+
+def _metric_value(metric_id, time_stamp, value, metric_property, label, report_id, context):
+    metric_value = {'MetricId': metric_id, 'Timestamp': time_stamp, 'MetricValue': value}
+    if metric_property is not None:
+        metric_value['MetricProperty'] = metric_property
+    metric_value['Oem'] = {'Dell': {'ContextID': context, 'Label': label, 'Source': report_id, 'FQDD': context}}
+    return metric_value
+
+
+def encode_report(report, schema=None):
+    """Returns the compact form of a report dictionary, decode_report turns it back into an equal dictionary.
+
+    MetricIds become their number in the schema, the contexts of the MetricValues are listed once and every
+    MetricValue refers to them by number. MetricProperty and Label are templates with the context and MetricId left
+    out, listed once per report. Properties derived from the report Id, like @odata.id, are dropped. A MetricValue
+    which does not have the usual iDRAC layout is kept as it is, a report without Id or MetricValues dictionaries is
+    not encoded.
+
+    :param report: Report dictionary
+    :param schema: MetricSchema of the iDRAC, MetricIds are kept as text without
+    """
+    report_id, metric_values = report.get('Id'), report.get('MetricValues')
+    if not isinstance(report_id, str) or not isinstance(metric_values, list) or \
+            not all(isinstance(value, dict) for value in metric_values):
+        return report
+    report_time = report.get('Timestamp')
+    numbers = schema.numbers(report_id) if schema is not None else {}
+    contexts, context_numbers = [], {}
+    templates, template_numbers = [], {}
+    rows = []
+    for value in metric_values:
+        try:
+            metric_id, time_stamp = value['MetricId'], value['Timestamp']
+            context = value_context(value)
+            metric_property = value.get('MetricProperty')
+            label = value['Oem']['Dell']['Label']
+            if not all(isinstance(text, str) for text in (metric_id, time_stamp, context, label)) or \
+                    not isinstance(metric_property, (str, type(None))) or \
+                    _metric_value(metric_id, time_stamp, value['MetricValue'], metric_property, label, report_id,
+                                  context) != value:
+                raise TypeError(metric_id)
+        except (KeyError, TypeError, AttributeError):
+            rows.append(value)
+            continue
+        row_templates = []
+        for text in (metric_property, label):
+            if text is None:
+                row_templates.append(None)
+                continue
+            template = _template(text, context, metric_id)
+            if _fill(template, context, metric_id) != text:
+                template = text
+                if _fill(template, context, metric_id) != text:  # contains {c} or {m} itself
+                    break
+            number = template_numbers.get(template)
+            if number is None:
+                number = template_numbers[template] = len(templates)
+                templates.append(template)
+            row_templates.append(number)
+        else:
+            context_number = context_numbers.get(context)
+            if context_number is None:
+                context_number = context_numbers[context] = len(contexts)
+                contexts.append(context)
+            rows.append([numbers.get(metric_id, metric_id), context_number,
+                         0 if time_stamp == report_time else time_stamp, value['MetricValue']] + row_templates)
+            continue
+        rows.append(value)
+    encoded = {SCHEMA_KEY: schema.id if schema is not None else ''}
+    for name in KEPT_PROPERTIES:
+        if name in report:
+            encoded[name] = report[name]
+    encoded['c'], encoded['t'], encoded['m'] = contexts, templates, rows
+    standard = _standard_properties(report_id)
+    standard['MetricValues@odata.count'] = len(metric_values)
+    extra = {name: item for name, item in report.items()
+             if name not in KEPT_PROPERTIES and name != 'MetricValues' and standard.get(name, _MISSING) != item}
+    missing = [name for name in standard if name not in report]
+    if extra:
+        encoded['x'] = extra
+    if missing:
+        encoded['d'] = missing
+    return encoded
+
+
+def decode_report(encoded, schemas=None):
+    """Returns the report dictionary of a report encoded by encode_report, other reports are returned as they are
+
+    :param schemas: SchemaRegistry with the schema of the report
+    :raises KeyError: The schema of the report is unknown
+    """
+    if SCHEMA_KEY not in encoded:
+        return encoded
+    report_id = encoded['Id']
+    if encoded[SCHEMA_KEY]:
+        if schemas is None:
+            raise KeyError("Report encoded with metric schema '{}' needs the schema registry".format(
+                encoded[SCHEMA_KEY]))
+        metric_ids = schemas.schema(encoded[SCHEMA_KEY]).reports.get(report_id, [])
+    else:
+        metric_ids = []
+    report_time = encoded.get('Timestamp')
+    contexts, templates = encoded['c'], encoded['t']
+    metric_values = []
+    for row in encoded['m']:
+        if isinstance(row, dict):
+            metric_values.append(row)
+            continue
+        metric, context_number, time_stamp, value, property_number, label_number = row
+        metric_id = metric_ids[metric] if isinstance(metric, int) else metric
+        context = contexts[context_number]
+        metric_values.append(_metric_value(
+            metric_id, report_time if time_stamp == 0 else time_stamp, value,
+            None if property_number is None else _fill(templates[property_number], context, metric_id),
+            None if label_number is None else _fill(templates[label_number], context, metric_id), report_id,
+            context))
+    standard = _standard_properties(report_id)
+    missing = encoded.get('d', ())
+    report = {}
+    for name in REPORT_PROPERTIES:
+        if name in KEPT_PROPERTIES:
+            if name in encoded:
+                report[name] = encoded[name]
+        elif name not in missing:
+            report[name] = standard[name]
+    report['MetricValues'] = metric_values
+    if 'MetricValues@odata.count' not in missing:
+        report['MetricValues@odata.count'] = len(metric_values)
+    report.update(encoded.get('x', {}))
+    return report
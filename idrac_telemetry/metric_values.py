@@ -0,0 +1,125 @@
+#
+# metric_values.py Array-backed MetricValues of Telemetry reports.
+#
+#
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+import threading
+from array import array
+
+from idrac_telemetry.archive import parse_timestamp
+
+NAN = float('nan')
+
+
+def value_context(value):
+    """Returns the ContextID or FQDD of a MetricValue, '' when it has none"""
+    dell = (value.get('Oem') or {}).get('Dell') or {}
+    return dell.get('ContextID') or dell.get('FQDD') or ''
+
+
+class Vocabulary(object):
+    """Numbers strings like MetricIds in the order they are first seen, so every distinct string is stored once and
+    referenced by its number. Thread safe, numbers are never reused."""
+
+    def __init__(self):
+        self.names = []
+        self._numbers = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.names)
+
+    def number(self, name):
+        number = self._numbers.get(name)
+        if number is None:
+            with self._lock:
+                number = self._numbers.get(name)
+                if number is None:
+                    number = self._numbers[name] = len(self.names)
+                    self.names.append(name)
+        return number
+
+
+class MetricValueArray(object):
+    """MetricValues of a report as parallel arrays instead of one dictionary per value.
+
+    Every value takes 24 bytes: the numbers of its MetricId and context in shared Vocabulary instances, its Timestamp
+    in seconds since the epoch and its MetricValue as float. A missing or unparsable Timestamp or MetricValue is NaN.
+    The arrays support the buffer protocol, numpy.frombuffer reads them without a copy.
+    """
+    __slots__ = ('metric_ids', 'contexts', 'metric_numbers', 'context_numbers', 'timestamps', 'values')
+
+    def __init__(self, metric_ids, contexts):
+        """
+        :param metric_ids: Vocabulary of the MetricIds
+        :param contexts: Vocabulary of the ContextIDs and FQDDs
+        """
+        self.metric_ids = metric_ids
+        self.contexts = contexts
+        self.metric_numbers = array('I')
+        self.context_numbers = array('I')
+        self.timestamps = array('d')
+        self.values = array('d')
+
+    @classmethod
+    def from_report(cls, report, metric_ids, contexts, selected=None):
+        """Returns the MetricValues of a report dictionary, see extend"""
+        metric_values = cls(metric_ids, contexts)
+        metric_values.extend(report, selected)
+        return metric_values
+
+    def extend(self, report, selected=None):
+        """Appends the MetricValues of a report dictionary, the values of many reports can share one array
+
+        :param selected: Function telling if a MetricId is kept, all are kept when None
+        :return: Number of values appended
+        """
+        count = len(self.values)
+        metric_number, context_number = self.metric_ids.number, self.contexts.number
+        last_time_stamp = last_time = None
+        for value in report.get('MetricValues') or []:
+            metric_id = value.get('MetricId')
+            if not metric_id or (selected is not None and not selected(metric_id)):
+                continue
+            time_stamp = value.get('Timestamp')
+            if time_stamp != last_time_stamp:  # the values of a report mostly share their Timestamp
+                last_time_stamp, last_time = time_stamp, parse_timestamp(time_stamp)
+            try:
+                number = float(value.get('MetricValue'))
+            except (TypeError, ValueError):
+                number = NAN
+            self.metric_numbers.append(metric_number(metric_id))
+            self.context_numbers.append(context_number(value_context(value)))
+            self.timestamps.append(NAN if last_time is None else last_time)
+            self.values.append(number)
+        return len(self.values) - count
+
+    def append(self, metric_id, timestamp, value, context=''):
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            value = NAN
+        self.metric_numbers.append(self.metric_ids.number(metric_id))
+        self.context_numbers.append(self.contexts.number(context))
+        self.timestamps.append(NAN if timestamp is None else timestamp)
+        self.values.append(value)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        """Yields (MetricId, timestamp, value, context) of every value"""
+        metric_names, context_names = self.metric_ids.names, self.contexts.names
+        for metric_number, context_number, timestamp, value in zip(self.metric_numbers, self.context_numbers,
+                                                                  self.timestamps, self.values):
+            yield metric_names[metric_number], timestamp, value, context_names[context_number]
@@ -0,0 +1,314 @@
+#
+# profiling.py Profiling and per-stage timing of the scripts without changing their code.
+#
+#
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+# cProfile, pstats, inspect and signal are imported when used, idrac-telemetry imports this module on every start
+import collections
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+
+PROFILERS = ['cprofile', 'sampling']
+
+logger = logging.getLogger(__name__)
+
+
+def add_profile_arguments(parser):
+    """Adds the profiling options to an argparse parser"""
+    parser.add_argument('--profile', help='Profile the run and write the profile to this file when the script ends: '
+                        'pstats data of cProfile or the collapsed stacks of the sampling profiler, for flame graph '
+                        'tools. A summary of the slowest functions and of the --timing spans is written to FILE.txt',
+                        metavar='FILE', required=False)
+    parser.add_argument('--profiler', help='cprofile traces every call of the main thread and of the threads started '
+                        'after it, sampling records the stacks of all threads every --profile-interval seconds at a '
+                        'smaller cost', default='cprofile',
+                        choices=PROFILERS)
+    parser.add_argument('--profile-interval', help='Seconds between two stacks of the sampling profiler',
+                        type=float, default=0.005)
+    parser.add_argument('--timing', help='Measure the time of every stage, like parsing, reassembling, decoding, '
+                        'encoding and writing reports, and of every Redfish request. The totals are logged at the end '
+                        'and added to the --profile summary', action='store_true')
+
+
+def profiler_from_arguments(args):
+    """Returns the Profiler of the options of add_profile_arguments, None when neither profiling nor timing is on"""
+    if not args["profile"] and not args["timing"]:
+        return None
+    return Profiler(args["profile"], args["profiler"], args["profile_interval"], args["timing"])
+
+
+class SpanRecorder(object):
+    """Number, total and longest duration of named spans, thread safe"""
+
+    def __init__(self):
+        self._spans = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self._lock:
+            span = self._spans.get(name)
+            if span is None:
+                span = self._spans[name] = [0, 0.0, 0.0]
+            span[0] += 1
+            span[1] += seconds
+            if seconds > span[2]:
+                span[2] = seconds
+
+    def spans(self):
+        """Returns (name, count, total seconds, longest seconds) of every span, longest total first"""
+        with self._lock:
+            return sorted(((name, count, total, longest) for name, (count, total, longest) in self._spans.items()),
+                          key=lambda span: -span[2])
+
+    def summary(self):
+        lines = ["{:<28}{:>10}{:>12}{:>12}{:>12}".format('span', 'count', 'total s', 'mean ms', 'max ms')]
+        for name, count, total, longest in self.spans():
+            lines.append("{:<28}{:>10}{:>12.3f}{:>12.3f}{:>12.3f}".format(name, count, total, total / count * 1000,
+                                                                         longest * 1000))
+        return lines
+
+
+class SamplingProfiler(object):
+    """Records the stack of every thread every interval seconds from a background thread. The counts are wall clock
+    time, a thread waiting for input shows up in the function it waits in."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = 0
+        self.stacks = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        labels = {}
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if not names.keys() >= frames.keys():
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in frames.items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = "{} ({}:{})".format(code.co_name, os.path.basename(code.co_filename),
+                                                                   code.co_firstlineno)
+                    stack.append(label)
+                    frame = frame.f_back
+                stack.append(names.get(ident, 'thread-{}'.format(ident)))
+                self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def write(self, path):
+        """Writes the collapsed stacks, one 'thread;caller;callee count' line per stack"""
+        with open(path, 'w') as file:
+            for stack, count in self.stacks.most_common():
+                file.write("{} {}\n".format(';'.join(stack), count))
+
+    def summary(self, limit=30):
+        own, inclusive = collections.Counter(), collections.Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for label in set(stack[1:]):
+                inclusive[label] += count
+        total = sum(self.stacks.values()) or 1
+        lines = ["{} samples every {} seconds of all threads".format(self.samples, self.interval), "",
+                 "{:>8}  {}".format('own %', 'function')]
+        lines.extend("{:>8.2f}  {}".format(count * 100 / total, label) for label, count in own.most_common(limit))
+        lines.extend(["", "{:>8}  {}".format('total %', 'function')])
+        lines.extend("{:>8.2f}  {}".format(count * 100 / total, label)
+                     for label, count in inclusive.most_common(limit))
+        return lines
+
+
+class Profiler(object):
+    """Profiles a run with cProfile or the SamplingProfiler and records timing spans of instrumented functions.
+
+    Functions are timed by replacing them on their object or class with instrument, which is undone by stop. A script
+    which is not instrumented costs nothing. stop writes the profile and the summary. A SIGTERM ends the run like
+    Ctrl+C while the profiler runs and is sent again by stop, so a service stopped by its init system still writes its
+    profile and still ends like before.
+    """
+
+    def __init__(self, path=None, profiler='cprofile', interval=0.005, timing=False):
+        """
+        :param path: File the profile is written to, no profile is taken when None
+        :param profiler: One of PROFILERS
+        :param interval: Seconds between two stacks of the sampling profiler
+        :param timing: Record spans of the functions given to instrument and of the Redfish requests
+        """
+        if profiler not in PROFILERS:
+            raise ValueError("Unknown profiler '{}', possible values are {}".format(profiler, ', '.join(PROFILERS)))
+        self.path = path
+        self.profiler = profiler
+        self.timing = timing
+        self.spans = SpanRecorder()
+        self._profile = None
+        if path is not None and profiler == 'cprofile':
+            import cProfile
+            self._profile = cProfile.Profile()
+        elif path is not None:
+            self._profile = SamplingProfiler(interval)
+        self._thread_profiles = []
+        self._instrumented = []
+        self._lock = threading.Lock()
+        self._started = None
+        self._previous_handler = None
+        self._terminated = False
+
+    def start(self):
+        import signal
+        if self.timing:
+            self.instrument_redfish()
+        if threading.current_thread() is threading.main_thread() and \
+                signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+            self._previous_handler = signal.signal(signal.SIGTERM, self._exit_on_signal)
+        self._started = time.monotonic()
+        if self._profile is not None:
+            if self.profiler == 'cprofile':
+                threading.setprofile(self._profile_thread)
+                self._profile.enable()
+            else:
+                self._profile.start()
+
+    def stop(self):
+        """Stops profiling, undoes the instrumentation and writes the profile and the summary"""
+        if self._profile is not None:
+            if self.profiler == 'cprofile':
+                self._profile.disable()
+                threading.setprofile(None)
+            else:
+                self._profile.stop()
+        duration = time.monotonic() - self._started
+        while self._instrumented:
+            target, attribute, original = self._instrumented.pop()
+            if original is None:
+                delattr(target, attribute)
+            else:
+                setattr(target, attribute, original)
+        try:
+            self._write(duration)
+        finally:
+            if self._previous_handler is not None:
+                import signal
+                signal.signal(signal.SIGTERM, self._previous_handler)
+                self._previous_handler = None
+                if self._terminated:
+                    os.kill(os.getpid(), signal.SIGTERM)
+
+    def _write(self, duration):
+        lines = ["Run of {} seconds: {}".format(round(duration, 3), ' '.join(sys.argv))]
+        if self.timing:
+            lines.extend([""] + self.spans.summary())
+            for line in self.spans.summary():
+                logger.info(line)
+        if self.path is None:
+            return
+        if self.profiler == 'cprofile':
+            import io
+            import pstats
+            stream = io.StringIO()
+            statistics = pstats.Stats(self._profile, stream=stream)
+            with self._lock:
+                for profile in self._thread_profiles:
+                    statistics.add(profile)
+            statistics.dump_stats(self.path)
+            statistics.sort_stats('cumulative').print_stats(30)
+            lines.extend(["", "cProfile of the main thread and {} threads".format(len(self._thread_profiles)), "",
+                          stream.getvalue()])
+        else:
+            self._profile.write(self.path)
+            lines.extend([""] + self._profile.summary())
+        with open(self.path + '.txt', 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+        logger.info("- INFO, profile written to '{}', summary to '{}.txt'".format(self.path, self.path))
+
+    def _exit_on_signal(self, number, frame):
+        self._terminated = True
+        raise SystemExit(128 + number)
+
+    def _profile_thread(self, frame, event, argument):
+        """Profile function of new threads, replaces itself with a cProfile of the thread"""
+        import cProfile
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:  # Python versions running only one cProfile at a time profile the main thread
+            return
+        with self._lock:
+            self._thread_profiles.append(profile)
+
+    def instrument(self, target, attribute, name):
+        """Records a span for every call of a function or coroutine function of an object or class
+
+        :param target: Object or class the function is looked up on
+        :param attribute: Name of the function
+        :param name: Name of the span, or a function returning it from the positional and keyword arguments of the call
+        """
+        if not self.timing:
+            return
+        import inspect
+        function = getattr(target, attribute)
+        record = self.spans.record
+        span_name = name if callable(name) else lambda arguments, options: name
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def timed(*arguments, **options):
+                started = time.perf_counter()
+                try:
+                    return await function(*arguments, **options)
+                finally:
+                    record(span_name(arguments, options), time.perf_counter() - started)
+        else:
+            @functools.wraps(function)
+            def timed(*arguments, **options):
+                started = time.perf_counter()
+                try:
+                    return function(*arguments, **options)
+                finally:
+                    record(span_name(arguments, options), time.perf_counter() - started)
+        self._instrumented.append((target, attribute, vars(target).get(attribute)))
+        setattr(target, attribute, timed)
+
+    def instrument_redfish(self):
+        """Times the Redfish requests sent with requests and with the AsyncRedfishClient, per HTTP method"""
+        import requests
+        from idrac_telemetry.async_redfish import AsyncRedfishClient
+        self.instrument(requests.Session, 'request', _redfish_span)
+        self.instrument(AsyncRedfishClient, '_send_now', _redfish_span)
+
+
+def _redfish_span(arguments, options):
+    # Session.request(self, method, url, ...) and AsyncRedfishClient._send_now(self, method, host, ...)
+    method = arguments[1] if len(arguments) > 1 else options.get('method')
+    return 'redfish ' + str(method).upper()
+
@@ -0,0 +1,462 @@
+#
+# publisher.py Publishes Telemetry reports or their MetricValues to a message broker in compressed batches.
+#
+#
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+import gzip
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+
+from idrac_telemetry import json_codec
+from idrac_telemetry.metric_schema import decode_report, encode_report
+from idrac_telemetry.metric_values import value_context
+
+COMPRESSIONS = ['zlib', 'gzip', 'none']
+FORMATS = ['reports', 'metric-values', 'encoded-reports']
+# Seconds a failed batch waits at most before it is sent again
+MAX_BACKOFF = 30
+
+# Record header of the file broker: length of the JSON headers and of the batch
+_FILE_RECORD_HEADER = struct.Struct('>II')
+
+logger = logging.getLogger(__name__)
+
+
+def compress(data, compression):
+    if compression == 'zlib':
+        return zlib.compress(data, 6)
+    if compression == 'gzip':
+        return gzip.compress(data, 6, mtime=0)
+    return data
+
+
+def decode_batch(headers, payload, schemas=None):
+    """Returns the records of a published batch as list of dictionaries, for consumers and tests
+
+    :param schemas: SchemaRegistry, the reports of 'encoded-reports' batches are decoded with it
+    """
+    compression = headers.get('compression', 'none')
+    if compression == 'zlib':
+        payload = zlib.decompress(payload)
+    elif compression == 'gzip':
+        payload = gzip.decompress(payload)
+    records = [json_codec.loads(line) for line in payload.splitlines() if line]
+    if headers.get('format') == 'encoded-reports':
+        for record in records:
+            record['report'] = decode_report(record['report'], schemas)
+    return records
+
+
+class Broker(object):
+    """Destination of the batches. send blocks until the broker acknowledged the batch and raises an exception when
+    it was not accepted, the Publisher calls it from its sender threads and retries failed batches."""
+
+    def send(self, topic, partition, payload, headers):
+        """
+        :param topic: Topic name
+        :param partition: Partition number of the batch, all batches of an iDRAC go to the same partition
+        :param payload: Compressed batch
+        :param headers: Dictionary of str to str describing the batch
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemoryBroker(Broker):
+    """In-process stand-in of a broker keeping the batches in lists, for tests and benchmarks"""
+
+    def __init__(self, latency=0.0, failures=0):
+        """
+        :param latency: Seconds every send takes, like the round trip to a broker
+        :param failures: Number of sends failing with ConnectionError before the broker accepts batches
+        """
+        self.latency = latency
+        self.failures = failures
+        self.batches = {}
+        self._lock = threading.Lock()
+
+    def send(self, topic, partition, payload, headers):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            if self.failures > 0:
+                self.failures -= 1
+                raise ConnectionError("broker not available")
+            self.batches.setdefault((topic, partition), []).append((dict(headers), payload))
+
+    def records(self, topic=None):
+        """Returns the decoded records of all partitions, in partition and send order"""
+        with self._lock:
+            return [record for (batch_topic, _), batches in sorted(self.batches.items())
+                    if topic is None or batch_topic == topic
+                    for headers, payload in batches for record in decode_batch(headers, payload)]
+
+
+class FileBroker(Broker):
+    """Stand-in of a broker appending the batches of every topic and partition to a file in a folder,
+    <topic>.<partition>.log, which is read back with read"""
+
+    def __init__(self, folder, fsync=False):
+        self.folder = folder
+        self.fsync = fsync
+        self._files = {}
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    def path(self, topic, partition):
+        return os.path.join(self.folder, '{}.{}.log'.format(topic, partition))
+
+    def send(self, topic, partition, payload, headers):
+        encoded_headers = json_codec.dumps_bytes(headers, 'compact')
+        with self._lock:
+            file = self._files.get((topic, partition))
+            if file is None:
+                file = self._files[(topic, partition)] = open(self.path(topic, partition), 'ab')
+            file.write(_FILE_RECORD_HEADER.pack(len(encoded_headers), len(payload)) + encoded_headers + payload)
+            file.flush()
+            if self.fsync:
+                os.fsync(file.fileno())
+
+    def read(self, topic, partition):
+        """Yields (headers, payload) of the batches of a partition in send order"""
+        with open(self.path(topic, partition), 'rb') as file:
+            while True:
+                header = file.read(_FILE_RECORD_HEADER.size)
+                if len(header) < _FILE_RECORD_HEADER.size:
+                    return
+                headers_length, payload_length = _FILE_RECORD_HEADER.unpack(header)
+                headers = json_codec.loads(file.read(headers_length))
+                yield headers, file.read(payload_length)
+
+    def close(self):
+        with self._lock:
+            for file in self._files.values():
+                file.close()
+            self._files.clear()
+
+
+class KafkaBroker(Broker):
+    """Kafka topic written with the kafka-python package. The partition number is sent as message key, Kafka maps it
+    to one of the partitions of the topic, so the batches of an iDRAC stay in order."""
+
+    def __init__(self, servers):
+        """
+        :param servers: Comma separated host:port of the bootstrap servers
+        :raises RuntimeError: kafka-python is not installed
+        """
+        try:
+            from kafka import KafkaProducer
+        except ImportError:
+            raise RuntimeError("Publishing to Kafka needs the kafka-python package, install it with "
+                               "'pip install kafka-python'")
+        self._producer = KafkaProducer(bootstrap_servers=servers.split(','), acks='all', retries=0)
+
+    def send(self, topic, partition, payload, headers):
+        future = self._producer.send(topic, value=payload, key=str(partition).encode('utf-8'),
+                                     headers=[(name, str(value).encode('utf-8')) for name, value in headers.items()])
+        future.get(timeout=60)
+
+    def close(self):
+        self._producer.close()
+
+
+def open_broker(url):
+    """Returns the Broker of a URL: memory://, file:///folder or kafka://host:port[,host:port]
+
+    :raises ValueError: Unknown scheme
+    """
+    scheme, _, location = url.partition('://')
+    if scheme == 'memory':
+        return MemoryBroker()
+    if scheme == 'file':
+        return FileBroker(location)
+    if scheme == 'kafka':
+        return KafkaBroker(location)
+    raise ValueError("'{}' is not a broker URL like file:///var/spool/telemetry or kafka://broker:9092".format(url))
+
+
+def add_publisher_arguments(parser):
+    """Adds the publishing options to an argparse parser"""
+    parser.add_argument('--publish', help='Publish the reports in compressed batches to a broker, '
+                        'kafka://host:9092[,host:9092] (needs kafka-python) or file:///folder as local stand-in',
+                        required=False)
+    parser.add_argument('--publish-topic', help='Topic the batches are published to', default='idrac-telemetry')
+    parser.add_argument('--publish-format', help='reports publishes every report as one record, metric-values one '
+                        'record per MetricValue with the iDRAC, report Id and context, encoded-reports the reports '
+                        'encoded against the metric schemas of --schema-folder', default='reports',
+                        choices=FORMATS)
+    parser.add_argument('--publish-partitions', help='Number of partitions, the reports of an iDRAC always go to the '
+                        'same one', type=int, default=8)
+    parser.add_argument('--publish-batch-bytes', help='Uncompressed bytes after which a batch is sent', type=int,
+                        default=1048576)
+    parser.add_argument('--publish-linger', help='Seconds after which a batch which is not full is sent', type=float,
+                        default=1.0)
+    parser.add_argument('--publish-compression', help='Compression of the batches', default='zlib',
+                        choices=COMPRESSIONS)
+
+
+def publisher_from_arguments(args, schemas=None, retries=5):
+    """Returns the Publisher of the options of add_publisher_arguments, None when nothing is published
+
+    :param schemas: SchemaRegistry the 'encoded-reports' are encoded with
+    :param retries: See Publisher, None for callers which keep the reports until the publisher flushed them
+
+    :raises ValueError: Unknown broker URL
+    :raises RuntimeError: The package of the broker is not installed
+    """
+    if not args["publish"]:
+        return None
+    return Publisher(open_broker(args["publish"]), topic=args["publish_topic"], record_format=args["publish_format"],
+                     partitions=args["publish_partitions"], batch_bytes=args["publish_batch_bytes"],
+                     linger=args["publish_linger"], compression=args["publish_compression"], retries=retries,
+                     schemas=schemas)
+
+
+class PendingBatch(object):
+    __slots__ = ('records', 'size', 'created')
+
+    def __init__(self):
+        self.records = []
+        self.size = 0
+        self.created = time.monotonic()
+
+
+class Publisher(object):
+    """Collects records per partition into batches and sends them to a Broker from sender threads.
+
+    The partition of a record is the CRC32 of its iDRAC name modulo partitions. A batch is sent once it holds
+    batch_bytes of records or is linger seconds old, compressed as a whole, with the headers topic, format,
+    compression and records. Every partition is sent by one sender thread, the batches of a partition are sent one
+    after the other and in order, also when one is retried. A failed send is retried with exponential backoff, a
+    batch failing retries times is dropped and counted, with retries None a batch is retried until the broker takes
+    it or the publisher is closed. publish blocks while max_pending batches wait to be sent.
+    """
+
+    def __init__(self, broker, topic='idrac-telemetry', record_format='reports', partitions=8, batch_bytes=1048576,
+                 linger=1.0, compression='zlib', senders=4, max_pending=64, retries=5, backoff=0.5, on_ack=None,
+                 schemas=None):
+        """
+        :param broker: Broker receiving the batches
+        :param topic: Topic of the batches
+        :param record_format: One of FORMATS
+        :param partitions: Number of partitions
+        :param batch_bytes: Uncompressed bytes of records after which a batch is sent
+        :param linger: Seconds after which a batch which is not full is sent
+        :param compression: One of COMPRESSIONS
+        :param senders: Number of sender threads, sends to the broker in flight at the same time
+        :param max_pending: Batches waiting to be sent per sender before publish blocks
+        :param retries: Number of times a failed send is repeated, None repeats it until the publisher is closed
+        :param backoff: Seconds before the first retry, doubled for each further one up to MAX_BACKOFF
+        :param on_ack: Called with (partition, number of records) for every batch the broker acknowledged
+        :param schemas: SchemaRegistry the reports are encoded with in the 'encoded-reports' format, without it only
+                        the MetricIds are not shortened
+        """
+        if compression not in COMPRESSIONS:
+            raise ValueError("Unknown compression '{}', possible values are {}".format(
+                compression, ', '.join(COMPRESSIONS)))
+        if record_format not in FORMATS:
+            raise ValueError("Unknown format '{}', possible values are {}".format(record_format, ', '.join(FORMATS)))
+        self.broker = broker
+        self.topic = topic
+        self.record_format = record_format
+        self.partitions = partitions
+        self.batch_bytes = batch_bytes
+        self.linger = linger
+        self.compression = compression
+        self.retries = retries
+        self.backoff = backoff
+        self.on_ack = on_ack
+        self.schemas = schemas
+        self.statistics = {'records': 0, 'batches': 0, 'raw_bytes': 0, 'compressed_bytes': 0, 'acked_batches': 0,
+                           'acked_records': 0, 'retries': 0, 'failed_batches': 0, 'failed_records': 0}
+        self._batches = {}
+        self._lock = threading.Lock()
+        # Held while a batch of the partition is sealed and queued, so its batches reach the sender in order
+        self._partition_locks = [threading.Lock() for _ in range(partitions)]
+        self._unacked = 0
+        self._idle = threading.Condition(self._lock)
+        self._closed = threading.Event()
+        self._queues = [queue.Queue(max_pending) for _ in range(max(1, min(senders, partitions)))]
+        self._threads = [threading.Thread(target=self._send_loop, args=(sender_queue,),
+                                          name='publisher-{}'.format(number), daemon=True)
+                         for number, sender_queue in enumerate(self._queues)]
+        self._threads.append(threading.Thread(target=self._linger_loop, name='publisher-linger', daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def closed(self):
+        return self._closed.is_set()
+
+    def partition(self, host):
+        return zlib.crc32(host.encode('utf-8')) % self.partitions
+
+    def publish(self, host, report):
+        """Adds a report to the batch of the partition of its iDRAC
+
+        :param host: iDRAC name
+        :param report: Report as dictionary, or as JSON bytes when it was not decoded
+        """
+        if self.record_format == 'reports':
+            if isinstance(report, (bytes, bytearray)):
+                records = [b'{"host":' + json_codec.dumps_bytes(host, 'compact') + b',"report":' + bytes(report) +
+                           b'}']
+            else:
+                records = [json_codec.dumps_bytes({'host': host, 'report': report}, 'compact')]
+        elif self.record_format == 'encoded-reports':
+            if isinstance(report, (bytes, bytearray)):
+                report = json_codec.loads(report)
+            schema = self.schemas.schema_for(host) if self.schemas is not None else None
+            records = [json_codec.dumps_bytes({'host': host, 'report': encode_report(report, schema)}, 'compact')]
+        else:
+            if isinstance(report, (bytes, bytearray)):
+                report = json_codec.loads(report)
+            report_id = report.get('Id', 'UnknownId')
+            records = [json_codec.dumps_bytes({'host': host, 'report_id': report_id,
+                                               'metric_id': value.get('MetricId'),
+                                               'context': value_context(value), 'timestamp': value.get('Timestamp'),
+                                               'value': value.get('MetricValue')}, 'compact')
+                       for value in report.get('MetricValues') or []]
+        if records:
+            self.publish_records(self.partition(host), records)
+
+    def publish_records(self, partition, records):
+        """Adds encoded records, JSON bytes without line break, to the batch of a partition"""
+        full = None
+        with self._partition_locks[partition]:
+            with self._lock:
+                if self._closed.is_set():
+                    raise ValueError("publish on a closed Publisher")
+                batch = self._batches.get(partition)
+                if batch is None:
+                    batch = self._batches[partition] = PendingBatch()
+                batch.records.extend(records)
+                batch.size += sum(len(record) + 1 for record in records)
+                self.statistics['records'] += len(records)
+                if batch.size >= self.batch_bytes:
+                    full = self._seal(partition)
+            if full is not None:
+                self._enqueue(partition, full)
+
+    def flush(self, timeout=None):
+        """Sends all batches, also the ones which are not full, and waits until the broker acknowledged or the sends
+        failed. Returns False if the timeout expired first."""
+        with self._lock:
+            partitions = list(self._batches)
+        for partition in partitions:
+            self._send_batch(partition)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while self._unacked:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def close(self, timeout=None):
+        """Sends the remaining batches, stops the sender threads and closes the broker"""
+        flushed = self.flush(timeout)
+        self._closed.set()
+        for sender_queue in self._queues:
+            sender_queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self.broker.close()
+        return flushed
+
+    def _seal(self, partition):
+        """Takes the batch of a partition out of the collected ones, called with the lock held"""
+        batch = self._batches.pop(partition)
+        self._unacked += 1
+        return batch
+
+    def _enqueue(self, partition, batch):
+        """Hands a sealed batch to the sender of its partition, called with the partition lock held"""
+        self._queues[partition % len(self._queues)].put((partition, batch))
+
+    def _send_batch(self, partition, created_before=None):
+        """Seals and queues the batch of a partition, if it has one created before created_before when given"""
+        with self._partition_locks[partition]:
+            with self._lock:
+                batch = self._batches.get(partition)
+                if batch is None or (created_before is not None and batch.created > created_before):
+                    return
+                batch = self._seal(partition)
+            self._enqueue(partition, batch)
+
+    def _linger_loop(self):
+        while not self._closed.wait(min(self.linger, 1.0) / 2):
+            created_before = time.monotonic() - self.linger
+            with self._lock:
+                partitions = [partition for partition, batch in self._batches.items()
+                              if batch.created <= created_before]
+            for partition in partitions:
+                self._send_batch(partition, created_before)
+
+    def _send_loop(self, sender_queue):
+        while True:
+            item = sender_queue.get()
+            if item is None:
+                return
+            partition, batch = item
+            try:
+                self._send(partition, batch)
+            finally:
+                with self._lock:
+                    self._unacked -= 1
+                    if not self._unacked:
+                        self._idle.notify_all()
+
+    def _send(self, partition, batch):
+        raw = b'\n'.join(batch.records) + b'\n'
+        payload = compress(raw, self.compression)
+        headers = {'topic': self.topic, 'format': self.record_format, 'compression': self.compression,
+                   'records': str(len(batch.records))}
+        with self._lock:
+            self.statistics['batches'] += 1
+            self.statistics['raw_bytes'] += len(raw)
+            self.statistics['compressed_bytes'] += len(payload)
+        delay = self.backoff
+        attempt = 0
+        while True:
+            try:
+                self.broker.send(self.topic, partition, payload, headers)
+                break
+            except Exception as e:
+                if attempt == self.retries or (self.retries is None and self._closed.is_set()):
+                    logger.error("- FAIL, dropping a batch of {} records of partition {} after {} attempts: {}".format(
+                        len(batch.records), partition, attempt + 1, e))
+                    with self._lock:
+                        self.statistics['failed_batches'] += 1
+                        self.statistics['failed_records'] += len(batch.records)
+                    return
+                logger.warning("Sending a batch of partition {} failed, retrying in {} seconds: {}".format(
+                    partition, delay, e))
+                with self._lock:
+                    self.statistics['retries'] += 1
+                self._closed.wait(delay)
+                delay = min(delay * 2, MAX_BACKOFF)
+                attempt += 1
+        with self._lock:
+            self.statistics['acked_batches'] += 1
+            self.statistics['acked_records'] += len(batch.records)
+        if self.on_ack is not None:
+            self.on_ack(partition, len(batch.records))
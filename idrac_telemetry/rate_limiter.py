@@ -0,0 +1,134 @@
+#
+# rate_limiter.py Token bucket per iDRAC whose rate follows the latency and busy answers of the iDRAC.
+#
+#
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+import asyncio
+import threading
+import time
+
+# Status codes of a busy iDRAC, the request is sent again once the rate of the iDRAC was lowered
+BUSY_STATUS_CODES = (429, 503)
+
+
+def retry_after_seconds(headers):
+    """Seconds of a Retry-After header given in seconds, None when missing or given as date"""
+    value = (headers or {}).get('Retry-After', '')
+    return int(value) if value.isdigit() else None
+
+
+class BucketState(object):
+    __slots__ = ('rate', 'tokens', 'updated', 'blocked_until', 'latency')
+
+    def __init__(self, rate, tokens, updated):
+        self.rate = rate
+        self.tokens = tokens
+        self.updated = updated
+        self.blocked_until = 0.0
+        self.latency = None
+
+
+class AdaptiveRateLimiter(object):
+    """Token bucket per host with a rate adjusted like TCP congestion control.
+
+    Every request takes a token, tokens are refilled at the rate of the host up to burst. Each answered request
+    within target_latency raises the rate by increase requests per second, up to max_rate. A slow answer lowers it by
+    a tenth, a busy answer (503, 429) or a failed connection halves it, down to min_rate, and a Retry-After header
+    blocks the host for the given time. The limiter is safe to use from threads and from an event loop.
+    """
+
+    def __init__(self, initial_rate=4.0, min_rate=0.2, max_rate=20.0, burst=4, target_latency=5.0, increase=0.5):
+        """
+        :param initial_rate: Requests per second a host starts with
+        :param min_rate: Lowest rate of a host
+        :param max_rate: Highest rate of a host
+        :param burst: Number of requests a host can be sent at once after an idle time
+        :param target_latency: Seconds of a response time above which the iDRAC is considered loaded
+        :param increase: Requests per second added to the rate for each fast answer
+        """
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.target_latency = target_latency
+        self.increase = increase
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, host):
+        """Takes a token of host if one is available.
+
+        :return: 0 when a token was taken, otherwise the seconds after which the next token is available
+        """
+        with self._lock:
+            now = time.monotonic()
+            state = self._states.get(host)
+            if state is None:
+                state = self._states[host] = BucketState(self.initial_rate, self.burst, now)
+            if now < state.blocked_until:
+                state.updated = state.blocked_until
+                return state.blocked_until - now
+            state.tokens = min(self.burst, state.tokens + (now - state.updated) * state.rate)
+            state.updated = now
+            if state.tokens >= 1:
+                state.tokens -= 1
+                return 0
+            # Waiters check again instead of holding a reservation, so a raised rate applies to them right away
+            return (1 - state.tokens) / state.rate
+
+    def acquire(self, host):
+        """Waits in the calling thread until a request may be sent to host"""
+        wait = self.try_acquire(host)
+        while wait:
+            time.sleep(wait)
+            wait = self.try_acquire(host)
+
+    async def acquire_async(self, host):
+        """Waits in the event loop until a request may be sent to host"""
+        wait = self.try_acquire(host)
+        while wait:
+            await asyncio.sleep(wait)
+            wait = self.try_acquire(host)
+
+    def record(self, host, latency, status_code=None, retry_after=None):
+        """Adjusts the rate of host to the outcome of a request.
+
+        :param latency: Seconds the request took
+        :param status_code: HTTP status code, None when the connection failed
+        :param retry_after: Seconds of the Retry-After header of a busy answer
+        """
+        with self._lock:
+            state = self._states.get(host)
+            if state is None:
+                return
+            state.latency = latency if state.latency is None else 0.7 * state.latency + 0.3 * latency
+            if status_code is None or status_code in BUSY_STATUS_CODES:
+                state.rate = max(self.min_rate, state.rate / 2)
+                # The next request waits for a whole token at the lowered rate
+                state.tokens = min(state.tokens, 0)
+                if retry_after:
+                    state.blocked_until = max(state.blocked_until, time.monotonic() + retry_after)
+            elif state.latency > self.target_latency:
+                state.rate = max(self.min_rate, state.rate * 0.9)
+            else:
+                state.rate = min(self.max_rate, state.rate + self.increase)
+
+    def rate(self, host):
+        with self._lock:
+            state = self._states.get(host)
+            return state.rate if state is not None else self.initial_rate
+
+    def rates(self):
+        """Dictionary of host to current rate and smoothed latency"""
+        with self._lock:
+            return {host: {'rate': state.rate, 'latency': state.latency} for host, state in self._states.items()}
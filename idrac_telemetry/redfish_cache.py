@@ -0,0 +1,205 @@
+#
+# redfish_cache.py On-disk cache for read-mostly Redfish GET requests, revalidated with ETag/If-None-Match.
+#
+#
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+import base64
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from idrac_telemetry import json_codec
+
+DEFAULT_CACHE_FOLDER = os.environ.get('IDRAC_TELEMETRY_CACHE',
+                                      os.path.join(os.path.expanduser('~'), '.cache', 'idrac-telemetry', 'redfish'))
+DEFAULT_TTL = 3600
+
+logger = logging.getLogger(__name__)
+
+
+def add_cache_arguments(parser):
+    """Adds the cache options shared by the scripts to an argparse parser"""
+    parser.add_argument('--no-cache', help='Always read from the iDRAC, do not use or update the local Redfish '
+                        'response cache', action='store_true')
+    parser.add_argument('--invalidate-cache', help='Drop the cached Redfish responses of the targeted iDRACs before '
+                        'running', action='store_true')
+    parser.add_argument('--cache-ttl', help='Seconds a cached Redfish response is used without asking the iDRAC, '
+                        'older responses are revalidated with their ETag', type=int, default=DEFAULT_TTL)
+    parser.add_argument('--cache-folder', help='Folder of the Redfish response cache', default=DEFAULT_CACHE_FOLDER)
+
+
+def cache_from_arguments(args):
+    """Returns the RedfishCache configured by the options of add_cache_arguments"""
+    return RedfishCache(args["cache_folder"], args["cache_ttl"], enabled=not args["no_cache"],
+                        invalidate=args["invalidate_cache"])
+
+
+class CachedResponse(object):
+    """The parts of a requests.Response the scripts use, rebuilt from a cache entry"""
+
+    def __init__(self, status_code, content, headers, from_cache):
+        self.status_code = status_code
+        self.content = content
+        self.headers = CaseInsensitiveDict(headers)
+        self.from_cache = from_cache
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', 'replace')
+
+    def json(self):
+        return json_codec.loads(self.content)
+
+
+class RedfishCache(object):
+    """Caches successful Redfish GET responses on disk, keyed by iDRAC, credentials and URI.
+
+    A response younger than its TTL is returned without contacting the iDRAC. An older one is revalidated with
+    If-None-Match when the iDRAC sent an ETag, a 304 answer then only refreshes the entry. A TTL of 0 revalidates
+    on every use, which still saves the transfer of unchanged bodies. Callers invalidate the entries a write
+    request changes.
+    """
+
+    def __init__(self, cache_folder=DEFAULT_CACHE_FOLDER, ttl=DEFAULT_TTL, enabled=True, invalidate=False):
+        """
+        :param cache_folder: Folder the entries are stored in, one sub folder per iDRAC
+        :param ttl: Default number of seconds an entry is used without revalidation
+        :param enabled: A disabled cache passes every request through to the iDRAC and stores nothing
+        :param invalidate: Drop the entries of every iDRAC the first time it is accessed
+        """
+        self.cache_folder = cache_folder
+        self.ttl = ttl
+        self.enabled = enabled
+        self.invalidate_on_first_use = invalidate
+        self._invalidated_hosts = set()
+
+    def get(self, ip, uri, auth, ttl=None, headers=None, **kwargs):
+        """GETs https://<ip><uri> through the cache.
+
+        :param ip: IP address of the iDRAC
+        :param uri: Redfish URI, for example /redfish/v1/TelemetryService
+        :param auth: (username, password) tuple
+        :param ttl: Seconds the response may be served from the cache, defaults to the cache TTL
+        :param headers: Additional request headers
+        :param kwargs: Passed on to requests.get
+        :return: A requests.Response when the iDRAC was asked and the cache is disabled, a CachedResponse otherwise
+        """
+        url = 'https://{}{}'.format(ip, uri)
+        kwargs.setdefault('verify', False)
+        if not self.enabled:
+            return requests.get(url, headers=headers, auth=auth, **kwargs)
+        if self.invalidate_on_first_use and ip not in self._invalidated_hosts:
+            self._invalidated_hosts.add(ip)
+            self.invalidate(ip)
+        ttl = self.ttl if ttl is None else ttl
+        entry_file = self._entry_file(ip, auth, uri)
+        entry = self._load(entry_file)
+        request_headers = dict(headers or {})
+        if entry is not None:
+            if time.time() - entry['stored'] < ttl:
+                logger.debug("Using cached response of {}".format(url))
+                return self._response(entry, True)
+            if entry['headers'].get('ETag'):
+                request_headers['If-None-Match'] = entry['headers']['ETag']
+        response = requests.get(url, headers=request_headers, auth=auth, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            logger.debug("Cached response of {} is still valid".format(url))
+            entry['stored'] = time.time()
+            self._store(entry_file, entry)
+            return self._response(entry, True)
+        if response.status_code == 200:
+            self._store(entry_file, {'uri': uri.rstrip('/'), 'stored': time.time(), 'status_code': 200,
+                                     'headers': {name: response.headers[name] for name in ('ETag', 'Content-Type')
+                                                 if name in response.headers},
+                                     'content': base64.b64encode(response.content).decode('ascii')})
+        elif entry is not None:
+            self._remove(entry_file)
+        return response
+
+    def invalidate(self, ip, uri=None, recursive=True):
+        """Drops the cached responses of an iDRAC.
+
+        :param ip: IP address of the iDRAC
+        :param uri: Only drop the entry of this URI
+        :param recursive: With a URI, also drop the entries of the URIs below it, like the members of a collection
+        """
+        host_folder = os.path.join(self.cache_folder, self._safe_name(ip))
+        if uri is None:
+            shutil.rmtree(host_folder, ignore_errors=True)
+            return
+        if not os.path.isdir(host_folder):
+            return
+        prefix = uri.rstrip('/')
+        for file_name in os.listdir(host_folder):
+            if not file_name.endswith('.json'):
+                continue
+            entry_file = os.path.join(host_folder, file_name)
+            entry = self._load(entry_file)
+            if entry is None or entry['uri'] == prefix or (recursive and entry['uri'].startswith(prefix + '/')):
+                self._remove(entry_file)
+
+    def clear(self):
+        """Drops the cached responses of all iDRACs"""
+        shutil.rmtree(self.cache_folder, ignore_errors=True)
+
+    def _entry_file(self, ip, auth, uri):
+        return os.path.join(self.cache_folder, self._safe_name(ip),
+                            self._credentials_prefix(ip, auth) + hashlib.sha1(uri.rstrip('/').encode()).hexdigest() +
+                            '.json')
+
+    @staticmethod
+    def _credentials_prefix(ip, auth):
+        # The password is part of the key, a run with wrong credentials never gets the responses of a correct one
+        user, password = auth
+        return hashlib.sha256('\0'.join((ip, user, password)).encode()).hexdigest()[:16] + '_'
+
+    @staticmethod
+    def _safe_name(ip):
+        return "".join(character if character.isalnum() or character in '.-' else '_' for character in ip)
+
+    @staticmethod
+    def _response(entry, from_cache):
+        return CachedResponse(entry['status_code'], base64.b64decode(entry['content']), entry['headers'], from_cache)
+
+    @staticmethod
+    def _load(entry_file):
+        try:
+            with open(entry_file, 'rb') as file:
+                return json_codec.loads(file.read())
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _store(entry_file, entry):
+        folder = os.path.dirname(entry_file)
+        try:
+            os.makedirs(folder, mode=0o700, exist_ok=True)
+            descriptor, temporary_file = tempfile.mkstemp(dir=folder, suffix='.tmp')
+            with os.fdopen(descriptor, 'w') as file:
+                file.write(json_codec.dumps(entry, 'compact'))
+            os.replace(temporary_file, entry_file)
+        except OSError as e:
+            logger.warning("Unable to cache the Redfish response in '{}': {}".format(entry_file, e))
+
+    @staticmethod
+    def _remove(entry_file):
+        try:
+            os.remove(entry_file)
+        except OSError:
+            pass
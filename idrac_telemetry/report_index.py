@@ -0,0 +1,271 @@
+#
+# report_index.py SQLite index of saved Telemetry reports and archive blocks by iDRAC, report Id, MetricId and time.
+#
+#
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+import glob
+import logging
+import os
+import sqlite3
+
+from idrac_telemetry import json_codec
+from idrac_telemetry.archive import INDEX_SUFFIX, ArchiveReader, parse_timestamp
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scanned (path TEXT PRIMARY KEY, mtime REAL, size INTEGER);
+CREATE TABLE IF NOT EXISTS sources (
+    source_id INTEGER PRIMARY KEY, kind TEXT NOT NULL, path TEXT NOT NULL, offset INTEGER, length INTEGER,
+    report_id TEXT, start REAL, end REAL);
+CREATE TABLE IF NOT EXISTS source_hosts (host TEXT NOT NULL, source_id INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS source_metrics (metric_id TEXT NOT NULL, source_id INTEGER NOT NULL);
+CREATE UNIQUE INDEX IF NOT EXISTS sources_location ON sources (path, offset);
+CREATE INDEX IF NOT EXISTS sources_report_time ON sources (report_id, start, end);
+CREATE INDEX IF NOT EXISTS source_hosts_host ON source_hosts (host, source_id);
+CREATE INDEX IF NOT EXISTS source_hosts_source ON source_hosts (source_id);
+CREATE INDEX IF NOT EXISTS source_metrics_metric ON source_metrics (metric_id, source_id);
+CREATE INDEX IF NOT EXISTS source_metrics_source ON source_metrics (source_id);
+"""
+
+# Kinds of indexed sources
+FILE = 'file'
+BLOCK = 'block'
+
+logger = logging.getLogger(__name__)
+
+
+def report_time_range(report):
+    """Returns the smallest and largest Timestamp of a report and its MetricValues in seconds since the epoch"""
+    times = [parse_timestamp(value.get('Timestamp')) for value in report.get('MetricValues') or []]
+    times.append(parse_timestamp(report.get('Timestamp')))
+    times = [seconds for seconds in times if seconds is not None]
+    return (min(times), max(times)) if times else (None, None)
+
+
+def metric_ids(report):
+    return {value.get('MetricId') for value in report.get('MetricValues') or [] if value.get('MetricId')}
+
+
+class ReportIndex(object):
+    """Index of report sources, a source is a report JSON file written by TelemetryRsysLogProcessor.py or a block of
+    an archive written by idrac_telemetry.archive.
+
+    update scans the folders incrementally: report folders whose modification time did not change are not listed
+    again, report files and archive index files are only read when they are new or grew. Queries select the sources by
+    report Id, iDRAC, MetricId and time range in the database and only open the matching files and blocks.
+    """
+
+    def __init__(self, database):
+        """
+        :param database: Path of the SQLite database, created if needed
+        """
+        self.database = database
+        self.connection = sqlite3.connect(database)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def update(self, report_folders=(), archive_folders=()):
+        """Indexes new report files and archive blocks.
+
+        :param report_folders: Folders in the <folder>/<iDRAC>/<report>.json layout of TelemetryRsysLogProcessor.py
+        :param archive_folders: Archive folders written by idrac_telemetry.archive
+        :return: Number of sources added
+        :raises ValueError: If one of the folders does not exist
+        """
+        for folder in tuple(report_folders) + tuple(archive_folders):
+            if not os.path.isdir(folder):
+                raise ValueError("folder '{}' does not exist".format(folder))
+        added = 0
+        with self.connection:
+            for folder in report_folders:
+                added += self._update_report_folder(folder)
+            for folder in archive_folders:
+                added += self._update_archive(folder)
+        return added
+
+    def sources(self, report_ids=None, hosts=None, metric_ids=None, start=None, end=None):
+        """Returns (kind, path, offset, length) of the sources which may contain matching values"""
+        conditions, parameters = [], []
+        if report_ids:
+            conditions.append("s.report_id IN ({})".format(",".join("?" * len(report_ids))))
+            parameters.extend(report_ids)
+        if start is not None:
+            conditions.append("(s.end IS NULL OR s.end >= ?)")
+            parameters.append(start)
+        if end is not None:
+            conditions.append("(s.start IS NULL OR s.start <= ?)")
+            parameters.append(end)
+        if hosts:
+            conditions.append("s.source_id IN (SELECT source_id FROM source_hosts WHERE host IN ({}))".format(
+                ",".join("?" * len(hosts))))
+            parameters.extend(hosts)
+        if metric_ids:
+            conditions.append("s.source_id IN (SELECT source_id FROM source_metrics WHERE metric_id IN ({}))".format(
+                ",".join("?" * len(metric_ids))))
+            parameters.extend(metric_ids)
+        query = "SELECT s.kind, s.path, s.offset, s.length FROM sources s"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        return self.connection.execute(query + " ORDER BY s.start", parameters).fetchall()
+
+    def values(self, report_ids=None, hosts=None, metric_ids=None, start=None, end=None, context=None):
+        """Yields (host, report Id, timestamp, MetricId, context, value) of the matching MetricValues.
+
+        :param context: Only values whose Oem.Dell.ContextID or FQDD contains this string
+        """
+        host_filter = set(hosts) if hosts else None
+        metric_filter = set(metric_ids) if metric_ids else None
+        readers = {}
+        for kind, path, offset, length in self.sources(report_ids, hosts, metric_ids, start, end):
+            if kind == FILE:
+                try:
+                    with open(path, 'rb') as file:
+                        items = [(os.path.basename(os.path.dirname(path)), json_codec.loads(file.read()))]
+                except (OSError, ValueError) as e:
+                    logger.warning("Skipping '{}': {}".format(path, e))
+                    continue
+            else:
+                folder = os.path.dirname(path)
+                if folder not in readers:
+                    readers[folder] = ArchiveReader(folder)
+                reader = readers[folder]
+                items = reader.read_block({'id': os.path.basename(path)[:-len(INDEX_SUFFIX)], 'offset': offset,
+                                           'length': length})
+            for host, report in items:
+                if host_filter is not None and host not in host_filter:
+                    continue
+                report_id = report.get('Id')
+                if report_ids and report_id not in report_ids:
+                    continue
+                for value in report.get('MetricValues') or []:
+                    if metric_filter is not None and value.get('MetricId') not in metric_filter:
+                        continue
+                    dell = (value.get('Oem') or {}).get('Dell') or {}
+                    value_context = dell.get('ContextID') or dell.get('FQDD') or ''
+                    if context and context not in value_context:
+                        continue
+                    time_stamp = value.get('Timestamp') or report.get('Timestamp')
+                    if start is not None or end is not None:
+                        seconds = parse_timestamp(time_stamp)
+                        if seconds is None or (start is not None and seconds < start) or \
+                                (end is not None and seconds > end):
+                            continue
+                    yield host, report_id, time_stamp, value.get('MetricId'), value_context, value.get('MetricValue')
+
+    def statistics(self):
+        cursor = self.connection.execute("SELECT kind, COUNT(*) FROM sources GROUP BY kind")
+        counts = dict(cursor.fetchall())
+        counts['hosts'] = self.connection.execute("SELECT COUNT(DISTINCT host) FROM source_hosts").fetchone()[0]
+        counts['metric_ids'] = self.connection.execute(
+            "SELECT COUNT(DISTINCT metric_id) FROM source_metrics").fetchone()[0]
+        return counts
+
+    def _scanned(self, path):
+        return self.connection.execute("SELECT mtime, size FROM scanned WHERE path = ?", (path,)).fetchone()
+
+    def _mark_scanned(self, path, mtime, size):
+        self.connection.execute("INSERT OR REPLACE INTO scanned (path, mtime, size) VALUES (?, ?, ?)",
+                                (path, mtime, size))
+
+    def _add_source(self, kind, path, offset, length, report_id, start, end, hosts, metrics):
+        self.connection.execute("DELETE FROM source_hosts WHERE source_id IN "
+                                "(SELECT source_id FROM sources WHERE path = ? AND offset = ?)", (path, offset))
+        self.connection.execute("DELETE FROM source_metrics WHERE source_id IN "
+                                "(SELECT source_id FROM sources WHERE path = ? AND offset = ?)", (path, offset))
+        self.connection.execute("DELETE FROM sources WHERE path = ? AND offset = ?", (path, offset))
+        source_id = self.connection.execute(
+            "INSERT INTO sources (kind, path, offset, length, report_id, start, end) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (kind, path, offset, length, report_id, start, end)).lastrowid
+        self.connection.executemany("INSERT INTO source_hosts (host, source_id) VALUES (?, ?)",
+                                    [(host, source_id) for host in hosts])
+        self.connection.executemany("INSERT INTO source_metrics (metric_id, source_id) VALUES (?, ?)",
+                                    [(metric_id, source_id) for metric_id in metrics])
+
+    def _remove_source(self, path):
+        for table in ('source_hosts', 'source_metrics'):
+            self.connection.execute("DELETE FROM {} WHERE source_id IN (SELECT source_id FROM sources WHERE path = ?)"
+                                    .format(table), (path,))
+        self.connection.execute("DELETE FROM sources WHERE path = ?", (path,))
+        self.connection.execute("DELETE FROM scanned WHERE path = ?", (path,))
+
+    def _update_report_folder(self, folder):
+        added = 0
+        folder = os.path.abspath(folder)
+        for idrac_entry in os.scandir(folder):
+            if not idrac_entry.is_dir():
+                continue
+            folder_mtime = idrac_entry.stat().st_mtime
+            scanned = self._scanned(idrac_entry.path)
+            if scanned is not None and scanned[0] == folder_mtime:
+                continue  # no report file was added or removed
+            present = set()
+            complete = True
+            for entry in os.scandir(idrac_entry.path):
+                if not entry.name.endswith('.json') or not entry.is_file():
+                    continue
+                present.add(entry.path)
+                stat = entry.stat()
+                scanned_file = self._scanned(entry.path)
+                if scanned_file is not None and scanned_file == (stat.st_mtime, stat.st_size):
+                    continue
+                try:
+                    with open(entry.path, 'rb') as file:
+                        report = json_codec.loads(file.read())
+                except (OSError, ValueError) as e:
+                    logger.warning("Skipping '{}': {}".format(entry.path, e))
+                    complete = False  # possibly still being written, the folder is listed again next time
+                    continue
+                start, end = report_time_range(report)
+                self._add_source(FILE, entry.path, 0, stat.st_size, report.get('Id'), start, end,
+                                 [idrac_entry.name], metric_ids(report))
+                self._mark_scanned(entry.path, stat.st_mtime, stat.st_size)
+                added += 1
+            prefix = idrac_entry.path + os.sep
+            indexed = self.connection.execute("SELECT path FROM sources WHERE kind = ? AND substr(path, 1, ?) = ?",
+                                              (FILE, len(prefix), prefix)).fetchall()
+            for path, in indexed:
+                if path not in present:  # report file was deleted
+                    self._remove_source(path)
+            if complete:
+                self._mark_scanned(idrac_entry.path, folder_mtime, 0)
+        return added
+
+    def _update_archive(self, folder):
+        added = 0
+        folder = os.path.abspath(folder)
+        reader = ArchiveReader(folder)
+        for index_path in sorted(glob.glob(os.path.join(folder, '*' + INDEX_SUFFIX))):
+            size = os.path.getsize(index_path)
+            scanned = self._scanned(index_path)
+            consumed = scanned[1] if scanned is not None and scanned[1] <= size else 0
+            if consumed == size:
+                continue
+            with open(index_path, 'rb') as file:
+                file.seek(consumed)
+                data = file.read()
+            # Only complete lines, the writer may be appending the last one
+            data = data[:data.rfind(b'\n') + 1]
+            for line in data.splitlines():
+                entry = json_codec.loads(line)
+                metrics = set()
+                times = [entry['start'], entry['end']]
+                for _, report in reader.read_block(entry):
+                    metrics.update(metric_ids(report))
+                    times.extend(report_time_range(report))
+                times = [seconds for seconds in times if seconds is not None]
+                self._add_source(BLOCK, index_path, entry['offset'], entry['length'], entry['id'],
+                                 min(times) if times else None, max(times) if times else None, entry['hosts'], metrics)
+                added += 1
+            self._mark_scanned(index_path, os.path.getmtime(index_path), consumed + len(data))
+        return added
@@ -0,0 +1,227 @@
+#
+# sequence_tracker.py Detects lost and duplicated Telemetry reports from their ReportSequence.
+#
+#
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from idrac_telemetry import json_codec
+from idrac_telemetry.archive import parse_timestamp
+
+# Results of SequenceTracker.observe
+NEW = 'new'
+DUPLICATE = 'duplicate'
+LATE = 'late'
+RESET = 'reset'
+UNTRACKED = 'untracked'
+
+logger = logging.getLogger(__name__)
+
+
+class SequenceState(object):
+    """Sequence state of one report type of one iDRAC.
+
+    last is the highest ReportSequence seen and timestamp the Timestamp of its report in seconds, None when unknown.
+    Bit n of window is set when last - n - 1 was received, so duplicates and late reports up to window_size behind
+    last are recognised.
+    """
+
+    __slots__ = ('last', 'window', 'received', 'duplicates', 'missing', 'resets', 'timestamp')
+
+    def __init__(self, last, window=0, received=0, duplicates=0, missing=0, resets=0, timestamp=None):
+        self.last = last
+        self.window = window
+        self.received = received
+        self.duplicates = duplicates
+        self.missing = missing
+        self.resets = resets
+        self.timestamp = timestamp
+
+    def to_list(self):
+        return [self.last, self.window, self.received, self.duplicates, self.missing, self.resets, self.timestamp]
+
+    def restarted(self, sequence, timestamp):
+        """Returns True if a sequence not above last comes with a report newer than the one of last, the iDRAC then
+        restarted its counter, also when the new sequence is still within the window"""
+        return sequence <= self.last and timestamp is not None and self.timestamp is not None and \
+            timestamp > self.timestamp
+
+    @property
+    def loss_rate(self):
+        expected = self.received + self.missing
+        return self.missing / expected if expected else 0.0
+
+
+class SequenceTracker(object):
+    """Tracks the ReportSequence of every (iDRAC, report Id) to flag gaps and duplicates as reports arrive.
+
+    A sequence above the last one is new, the skipped numbers count as missing until they arrive late. A sequence
+    seen before is a duplicate and should not be passed on, is_duplicate checks this before a report is saved and
+    observe records it once it was saved. A sequence far below the last one, or not above it in a report with a
+    newer Timestamp, means the iDRAC restarted its counter, for example after a reboot, and starts the tracking
+    over. The state is saved to state_file, a JSON document with one short list per key, at
+    most every save_interval seconds and by save.
+    """
+
+    def __init__(self, state_file=None, window_size=64, save_interval=30):
+        """
+        :param state_file: File the state is loaded from and saved to, the state is not persisted when None
+        :param window_size: Number of sequences behind the last one checked for duplicates and late arrivals
+        :param save_interval: Minimum number of seconds between two automatic saves, None only saves by save, for
+                              callers which save once the observed reports are stored
+        """
+        self.state_file = state_file
+        self.window_size = window_size
+        self.save_interval = save_interval
+        self.states = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_save = time.monotonic()
+        if state_file and os.path.exists(state_file):
+            self.load()
+
+    def observe(self, host, report_id, sequence, timestamp=None):
+        """Records a received report.
+
+        :param host: iDRAC name or address
+        :param report_id: Id of the MetricReport
+        :param sequence: ReportSequence of the report, as str or int
+        :param timestamp: Timestamp of the report like 2022-05-10T12:00:00-05:00, recognises counter restarts which
+                          stay within the window
+        :return: NEW, LATE (a missing report arrived), DUPLICATE, RESET or UNTRACKED if sequence is not a number
+        """
+        try:
+            sequence = int(sequence)
+        except (TypeError, ValueError):
+            return UNTRACKED
+        key = (host, report_id)
+        with self._lock:
+            result = self._observe(key, sequence, parse_timestamp(timestamp))
+            self._dirty = True
+            if self.state_file and self.save_interval is not None and \
+                    time.monotonic() - self._last_save >= self.save_interval:
+                self._save()
+        return result
+
+    def is_duplicate(self, host, report_id, sequence, timestamp=None):
+        """Returns True if the report was observed before, without recording it, see observe"""
+        try:
+            sequence = int(sequence)
+        except (TypeError, ValueError):
+            return False
+        timestamp = parse_timestamp(timestamp)
+        with self._lock:
+            state = self.states.get((host, report_id))
+            if state is None or sequence > state.last or state.restarted(sequence, timestamp):
+                return False
+            distance = state.last - sequence
+            return distance == 0 or (distance <= self.window_size and bool(state.window & (1 << (distance - 1))))
+
+    def _observe(self, key, sequence, timestamp):
+        state = self.states.get(key)
+        if state is None:
+            self.states[key] = SequenceState(sequence, received=1, timestamp=timestamp)
+            return NEW
+        if state.restarted(sequence, timestamp):
+            return self._reset(key, state, sequence, timestamp)
+        if sequence > state.last:
+            gap = sequence - state.last - 1
+            if gap:
+                state.missing += gap
+                logger.warning("Gap in ReportSequence of {} on iDRAC {}: {} reports missing between {} and {}".format(
+                    key[1], key[0], gap, state.last, sequence))
+            shift = sequence - state.last
+            state.window = ((state.window << shift) | (1 << (shift - 1))) & ((1 << self.window_size) - 1) \
+                if shift <= self.window_size else 0
+            state.last = sequence
+            state.timestamp = timestamp
+            state.received += 1
+            return NEW
+        if sequence == state.last:
+            state.duplicates += 1
+            return DUPLICATE
+        distance = state.last - sequence
+        if distance <= self.window_size:
+            bit = 1 << (distance - 1)
+            if state.window & bit:
+                state.duplicates += 1
+                return DUPLICATE
+            state.window |= bit
+            state.received += 1
+            state.missing = max(state.missing - 1, 0)
+            return LATE
+        return self._reset(key, state, sequence, timestamp)
+
+    @staticmethod
+    def _reset(key, state, sequence, timestamp):
+        logger.warning("ReportSequence of {} on iDRAC {} restarted at {} after {}".format(
+            key[1], key[0], sequence, state.last))
+        state.last, state.window, state.timestamp = sequence, 0, timestamp
+        state.received += 1
+        state.resets += 1
+        return RESET
+
+    def metrics(self):
+        """Dictionary of (host, report Id) to received, duplicates, missing, resets and loss_rate"""
+        with self._lock:
+            return {key: {'last': state.last, 'received': state.received, 'duplicates': state.duplicates,
+                          'missing': state.missing, 'resets': state.resets, 'loss_rate': state.loss_rate}
+                    for key, state in self.states.items()}
+
+    def totals(self):
+        """Sums of the counters over all keys and the overall loss_rate"""
+        with self._lock:
+            totals = {'keys': len(self.states), 'received': 0, 'duplicates': 0, 'missing': 0, 'resets': 0}
+            for state in self.states.values():
+                totals['received'] += state.received
+                totals['duplicates'] += state.duplicates
+                totals['missing'] += state.missing
+                totals['resets'] += state.resets
+        expected = totals['received'] + totals['missing']
+        totals['loss_rate'] = totals['missing'] / expected if expected else 0.0
+        return totals
+
+    def load(self):
+        with open(self.state_file, 'rb') as file:
+            document = json_codec.loads(file.read())
+        with self._lock:
+            self.states = {}
+            for host, report_ids in document.get('states', {}).items():
+                for report_id, values in report_ids.items():
+                    self.states[(host, report_id)] = SequenceState(*values)
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        if not self.state_file or not self._dirty:
+            return
+        document = {'version': 1, 'states': {}}
+        for (host, report_id), state in self.states.items():
+            document['states'].setdefault(host, {})[report_id] = state.to_list()
+        folder = os.path.dirname(os.path.abspath(self.state_file))
+        try:
+            descriptor, temporary_file = tempfile.mkstemp(dir=folder, suffix='.tmp')
+            with os.fdopen(descriptor, 'w') as file:
+                file.write(json_codec.dumps(document, 'compact'))
+            os.replace(temporary_file, self.state_file)
+        except OSError as e:
+            logger.error("Unable to save the ReportSequence state to '{}': {}".format(self.state_file, e))
+            return
+        self._dirty = False
+        self._last_save = time.monotonic()
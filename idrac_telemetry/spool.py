@@ -0,0 +1,306 @@
+#
+# spool.py Append-only, segment based write-ahead spool of received Telemetry reports.
+#
+#
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+import glob
+import logging
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+
+from idrac_telemetry import json_codec
+
+# Record header: payload length, CRC32 of key and payload, key length
+RECORD_HEADER = struct.Struct('>IIH')
+SEGMENT_SUFFIX = '.seg'
+CURSOR_SUFFIX = '.cursor'
+
+logger = logging.getLogger(__name__)
+
+
+def segment_name(number):
+    return '{:016d}{}'.format(number, SEGMENT_SUFFIX)
+
+
+def encode_record(key, data):
+    encoded_key = key.encode('utf-8')
+    return RECORD_HEADER.pack(len(data), zlib.crc32(data, zlib.crc32(encoded_key)), len(encoded_key)) + \
+        encoded_key + data
+
+
+def decode_records(buffer, offset=0):
+    """Yields (offset after the record, key, data) for the valid records of buffer starting at offset.
+
+    Stops at the first incomplete record or CRC mismatch, which is a torn write at the end of a segment.
+    """
+    view = memoryview(buffer)
+    end = len(buffer)
+    while offset + RECORD_HEADER.size <= end:
+        data_length, crc, key_length = RECORD_HEADER.unpack_from(view, offset)
+        key_start = offset + RECORD_HEADER.size
+        data_start = key_start + key_length
+        record_end = data_start + data_length
+        if record_end > end:
+            return
+        key, data = bytes(view[key_start:data_start]), bytes(view[data_start:record_end])
+        if zlib.crc32(data, zlib.crc32(key)) != crc:
+            return
+        offset = record_end
+        yield offset, key.decode('utf-8'), data
+
+
+class Spool(object):
+    """Write-ahead spool: reports are appended to segment files which sinks read at their own pace.
+
+    Each record carries a CRC32, a record cut short by a crash is detected and truncated when the spool is opened
+    again. Appends are written sequentially and made durable in batches: the segment is fsync'ed after fsync_batch
+    records or fsync_interval seconds, whichever comes first, and when a segment is sealed. Segments roll over at
+    segment_bytes. Each sink has a named SpoolReader whose acknowledged position is kept in a cursor file, segments
+    every reader is past are deleted by compact. A sink which fails before acknowledging reads the reports again,
+    so delivery is at least once.
+    """
+
+    def __init__(self, folder, segment_bytes=64 * 2 ** 20, fsync_batch=256, fsync_interval=1.0):
+        """
+        :param folder: Folder of the segment and cursor files, created if needed
+        :param segment_bytes: Size after which a new segment is started
+        :param fsync_batch: Number of appended records after which the segment is fsync'ed
+        :param fsync_interval: Seconds after which appended records are fsync'ed, also by a background thread when no
+                               more records arrive. 0 only syncs by fsync_batch
+        """
+        self.folder = folder
+        self.segment_bytes = segment_bytes
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.statistics = {'appended': 0, 'appended_bytes': 0, 'fsyncs': 0, 'segments_removed': 0}
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._closed = threading.Event()
+        os.makedirs(folder, exist_ok=True)
+        segments = self.segments()
+        self.active_segment = segments[-1] if segments else 0
+        self._recover(self.active_segment)
+        self._file = open(self.segment_path(self.active_segment), 'ab')
+        self._flusher = None
+        if fsync_interval:
+            self._flusher = threading.Thread(target=self._flush_periodically, name='spool-fsync', daemon=True)
+            self._flusher.start()
+
+    def segments(self):
+        """Numbers of the segments on disk, oldest first"""
+        return sorted(int(os.path.basename(path)[:-len(SEGMENT_SUFFIX)])
+                      for path in glob.glob(os.path.join(self.folder, '*' + SEGMENT_SUFFIX)))
+
+    def segment_path(self, number):
+        return os.path.join(self.folder, segment_name(number))
+
+    def append(self, key, data):
+        """Appends a record and returns its position (segment, offset after the record)"""
+        record = encode_record(key, data)
+        with self._lock:
+            self._file.write(record)
+            self._unsynced += 1
+            self.statistics['appended'] += 1
+            self.statistics['appended_bytes'] += len(record)
+            position = (self.active_segment, self._file.tell())
+            if position[1] >= self.segment_bytes:
+                self._roll()
+            elif self._unsynced >= self.fsync_batch or \
+                    (self.fsync_interval and time.monotonic() - self._last_sync >= self.fsync_interval):
+                self._sync()
+            return position
+
+    def flush(self):
+        """Makes the appended records visible to readers without waiting for the fsync"""
+        with self._lock:
+            self._file.flush()
+
+    def sync(self):
+        """Makes the appended records durable"""
+        with self._lock:
+            self._sync()
+
+    def reader(self, name):
+        return SpoolReader(self, name)
+
+    def cursors(self):
+        """Acknowledged positions of all readers, dictionary of reader name to (segment, offset)"""
+        cursors = {}
+        for path in glob.glob(os.path.join(self.folder, '*' + CURSOR_SUFFIX)):
+            try:
+                with open(path, 'rb') as file:
+                    cursor = json_codec.loads(file.read())
+                cursors[os.path.basename(path)[:-len(CURSOR_SUFFIX)]] = (cursor['segment'], cursor['offset'])
+            except (OSError, ValueError, KeyError):
+                logger.warning("Ignoring unreadable spool cursor '{}'".format(path))
+        return cursors
+
+    def compact(self):
+        """Deletes the sealed segments all readers acknowledged, returns the number of deleted segments"""
+        cursors = self.cursors()
+        if not cursors:
+            return 0
+        oldest_needed = min(segment for segment, _ in cursors.values())
+        removed = 0
+        with self._lock:
+            for number in self.segments():
+                if number >= oldest_needed or number >= self.active_segment:
+                    break
+                try:
+                    os.remove(self.segment_path(number))
+                    removed += 1
+                except OSError as e:
+                    logger.warning("Unable to remove spool segment {}: {}".format(number, e))
+            self.statistics['segments_removed'] += removed
+        return removed
+
+    def close(self):
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        with self._lock:
+            self._sync()
+            self._file.close()
+
+    def _sync(self):
+        if self._unsynced:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.statistics['fsyncs'] += 1
+            self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _roll(self):
+        self._unsynced = max(self._unsynced, 1)
+        self._sync()
+        self._file.close()
+        self.active_segment += 1
+        self._file = open(self.segment_path(self.active_segment), 'ab')
+
+    def _recover(self, number):
+        """Truncates a torn record at the end of the segment written last"""
+        path = self.segment_path(number)
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb') as file:
+            buffer = file.read()
+        valid_end = 0
+        for valid_end, _, _ in decode_records(buffer):
+            pass
+        if valid_end < len(buffer):
+            logger.warning("Truncating {} bytes of an incomplete record at the end of spool segment {}".format(
+                len(buffer) - valid_end, number))
+            with open(path, 'r+b') as file:
+                file.truncate(valid_end)
+                file.flush()
+                os.fsync(file.fileno())
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.fsync_interval):
+            with self._lock:
+                if self._unsynced and time.monotonic() - self._last_sync >= self.fsync_interval:
+                    self._sync()
+
+
+class SpoolReader(object):
+    """Reads the records of a Spool in order for one sink and keeps the acknowledged position in a cursor file"""
+
+    def __init__(self, spool, name, block_size=1048576):
+        self.spool = spool
+        self.name = name
+        self.block_size = block_size
+        self.cursor_path = os.path.join(spool.folder, name + CURSOR_SUFFIX)
+        cursors = spool.cursors()
+        if name in cursors:
+            self.position = cursors[name]
+        else:
+            # A new reader keeps every segment from now on, compact must not remove them before its first ack
+            segments = spool.segments()
+            self.position = (segments[0] if segments else 0, 0)
+            self._write_cursor(self.position)
+        self.acknowledged = self.position
+
+    def read(self, max_records=1000):
+        """Returns up to max_records (position, key, data) after the last read position.
+
+        The position of a record is the one to pass to ack once the sink processed it. Records appended but not
+        flushed yet are returned by a later call.
+        """
+        records = []
+        segment, offset = self.position
+        block_size = self.block_size
+        while len(records) < max_records:
+            try:
+                with open(self.spool.segment_path(segment), 'rb') as file:
+                    file.seek(offset)
+                    buffer = file.read(block_size)
+            except FileNotFoundError:
+                buffer = b''
+            consumed = 0
+            for consumed, key, data in decode_records(buffer):
+                records.append(((segment, offset + consumed), key, data))
+                if len(records) >= max_records:
+                    break
+            if consumed:
+                offset += consumed
+                block_size = self.block_size
+                continue
+            if len(buffer) == block_size:  # a record larger than the block
+                block_size *= 2
+                continue
+            if segment >= self.spool.active_segment:
+                break
+            if buffer:
+                logger.error("Skipping {} bytes of corrupt records in sealed spool segment {}".format(
+                    len(buffer), segment))
+            # Sealed segment read completely
+            segment, offset = segment + 1, 0
+        self.position = (segment, offset)
+        return records
+
+    def ack(self, position):
+        """Records that all reports up to position were processed, they are not read again after a restart"""
+        self._write_cursor(position)
+        previous_segment = self.acknowledged[0]
+        self.acknowledged = position
+        if position[0] > previous_segment:
+            self.spool.compact()
+
+    def _write_cursor(self, position):
+        descriptor, temporary_file = tempfile.mkstemp(dir=self.spool.folder, suffix='.tmp')
+        with os.fdopen(descriptor, 'w') as file:
+            file.write(json_codec.dumps({'segment': position[0], 'offset': position[1]}))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_file, self.cursor_path)
+
+    def rewind(self):
+        """Reads again from the acknowledged position, for example after the sink failed"""
+        self.position = self.acknowledged
+
+    def lag(self):
+        """Number of bytes appended after the acknowledged position"""
+        segment, offset = self.acknowledged
+        total = -offset
+        for number in self.spool.segments():
+            if number >= segment:
+                try:
+                    total += os.path.getsize(self.spool.segment_path(number))
+                except OSError:
+                    pass
+        return max(total, 0)
@@ -0,0 +1,222 @@
+#
+# sse_collector.py Collects the MetricReports of the SSE streams of iDRACs and resumes them after a reconnect.
+#
+#
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+import asyncio
+import inspect
+import logging
+import random
+import re
+import threading
+from collections import deque
+
+from idrac_telemetry.ingest_queue import metric_report_id
+from idrac_telemetry.sequence_tracker import DUPLICATE, SequenceTracker
+
+# ReportSequence of a MetricReport, a string in the Redfish schema and a number on some firmware versions
+_REPORT_SEQUENCE = re.compile(rb'"ReportSequence"\s*:\s*"?(\d+)')
+_TIMESTAMP = re.compile(rb'"Timestamp"\s*:\s*"([^"]+)"')
+
+logger = logging.getLogger(__name__)
+
+
+def add_sse_arguments(parser):
+    """Adds the reconnect and replay options of the SSE collector to an argparse parser"""
+    parser.add_argument('--sse-backoff', help='Seconds to wait at most before the first reconnect of a broken SSE '
+                        'stream, doubled for every further failed attempt. The wait is random up to this limit, so '
+                        'iDRACs which lost their streams together do not reconnect together', type=float, default=1)
+    parser.add_argument('--sse-max-backoff', help='Maximum number of seconds to wait before a reconnect', type=float,
+                        default=60)
+    parser.add_argument('--sse-replay-size', help='Number of the latest reports of every iDRAC kept to pass them on '
+                        'again once a failing report sink works again', type=int, default=32)
+
+
+def collector_from_arguments(args, client, sink):
+    """Returns the SseCollector configured by the options of add_sse_arguments"""
+    return SseCollector(client, sink, replay_size=args["sse_replay_size"], backoff=args["sse_backoff"],
+                        max_backoff=args["sse_max_backoff"])
+
+
+class ReplayBuffer(object):
+    """The latest reports of one iDRAC, numbered in the order they were received, thread safe"""
+
+    def __init__(self, size=32):
+        self._reports = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.last_number = 0
+
+    def append(self, report_id, payload):
+        """Adds a report and returns its number"""
+        with self._lock:
+            self.last_number += 1
+            self._reports.append((self.last_number, report_id, payload))
+            return self.last_number
+
+    def since(self, number):
+        """Returns the (number, report Id, report) of the buffered reports after number and how many reports after
+        number are no longer buffered"""
+        with self._lock:
+            reports = [report for report in self._reports if report[0] > number]
+            lost = (reports[0][0] if reports else self.last_number + 1) - number - 1
+        return reports, lost
+
+    def __len__(self):
+        return len(self._reports)
+
+
+class SseCollector(object):
+    """Keeps the SSE streams of iDRACs open and hands every MetricReport once to sink(host, report_id, payload).
+
+    The id of the last event of every iDRAC is sent as Last-Event-ID when its stream is opened again, an iDRAC
+    supporting it resends the reports it sent while the stream was down. Resent reports and reports received
+    twice are recognised by their ReportSequence with a SequenceTracker and not passed on. A broken stream is
+    opened again after a random wait of up to backoff seconds, doubled up to max_backoff while the attempts keep
+    failing, so many iDRACs losing their streams at once, for example behind a restarting switch, do not reconnect
+    all at the same moment. The backoff of an iDRAC starts over once its stream delivered a report.
+
+    sink runs in the event loop and should hand the reports on, for example to a ReportPipeline, instead of
+    processing them. A sink returning an awaitable, like ReportPipeline.submit_async, is awaited before the next
+    event of the stream is read, the other streams are read meanwhile.
+
+    The last replay_size reports of every iDRAC are kept in a ReplayBuffer. When the sink raises, for example because
+    the queue behind it was closed or the broker it publishes to is down, the report is not lost yet: the next report
+    of the iDRAC first passes the buffered reports the sink did not take on again, in order. Reports which dropped out
+    of the buffer meanwhile are counted as lost.
+    """
+
+    def __init__(self, client, sink, replay_size=32, backoff=1.0, max_backoff=60.0, tracker=None, read_timeout=None):
+        """
+        :param client: Opened AsyncRedfishClient
+        :param sink: Callable taking the Host, the report Id and the report as bytes
+        :param replay_size: Number of reports kept per iDRAC to catch the sink up after it failed, 0 keeps none
+        :param backoff: Maximum seconds to wait before the first reconnect
+        :param max_backoff: Maximum seconds to wait before any reconnect
+        :param tracker: SequenceTracker shared with other collectors, a new one by default
+        :param read_timeout: Seconds without data, including keep alive comments, after which a stream is
+                             considered dead, no limit when None
+        """
+        self.client = client
+        self.sink = sink
+        self.replay_size = replay_size
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.tracker = tracker if tracker is not None else SequenceTracker()
+        self.read_timeout = read_timeout
+        self.last_event_ids = {}
+        self.buffers = {}
+        # Number of the last buffered report the sink took, per iDRAC whose sink failed
+        self.behind = {}
+        self.statistics = {'reports': 0, 'duplicates': 0, 'reconnects': 0, 'resumed': 0, 'sink_failures': 0,
+                           'replayed': 0, 'lost': 0}
+
+    async def run(self, hosts):
+        """Collects the reports of all hosts until cancelled"""
+        await asyncio.gather(*(self.collect(host, random.uniform(0, self.backoff)) for host in hosts))
+
+    async def collect(self, host, delay=0):
+        """Collects the reports of one host until cancelled, opening its stream again whenever it ends"""
+        failures = 0
+        while True:
+            if delay:
+                await asyncio.sleep(delay)
+            last_event_id = self.last_event_ids.get(host.ip)
+            if last_event_id is not None:
+                self.statistics['resumed'] += 1
+            delivered = False
+            try:
+                async for event in self.client.events(host, read_timeout=self.read_timeout,
+                                                      last_event_id=last_event_id):
+                    delivered = await self.receive(host, event) or delivered
+                reason = 'the stream was closed'
+            except RuntimeError as e:  # RedfishConnectionError, HostUnavailable or a refused stream
+                reason = str(e)
+            # a stream which delivered reports before it broke starts the backoff over
+            failures = 1 if delivered else failures + 1
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (failures - 1)))
+            self.statistics['reconnects'] += 1
+            logger.warning("- WARNING, SSE stream of iDRAC {} ended, {}, reconnecting in {} seconds{}".format(
+                host.ip, reason, round(delay, 1), " from event " + self.last_event_ids[host.ip]
+                if host.ip in self.last_event_ids else ""))
+
+    async def receive(self, host, event):
+        """Passes the report of an SseEvent on unless it was received before, returns True if the event held a
+        report, also a duplicate one"""
+        if event.id is not None:
+            self.last_event_ids[host.ip] = event.id
+        if not event.data:
+            return False
+        payload = event.data.encode('utf-8')
+        report_id = metric_report_id(payload)
+        match = _REPORT_SEQUENCE.search(payload)
+        if match is not None and self.tracker.observe(host.ip, report_id, match.group(1),
+                                                      self._timestamp(payload)) == DUPLICATE:
+            self.statistics['duplicates'] += 1
+            return True
+        self.statistics['reports'] += 1
+        if not self.replay_size:
+            try:
+                await self._pass_on(host, report_id, payload)
+            except Exception as e:
+                self.statistics['sink_failures'] += 1
+                self.statistics['lost'] += 1
+                logger.error("- FAIL, report sink failed for a {} report of iDRAC {}: {}".format(report_id, host.ip, e))
+            return True
+        buffer = self.buffers.get(host.ip)
+        if buffer is None:
+            buffer = self.buffers[host.ip] = ReplayBuffer(self.replay_size)
+        number = buffer.append(report_id, payload)
+        await self.replay(host, number - 1)
+        return True
+
+    async def replay(self, host, number):
+        """Passes the buffered reports of an iDRAC after number on to the sink, starting from the last report the sink
+        took instead when it failed before. Returns False if the sink failed again."""
+        buffer = self.buffers.get(host.ip)
+        if buffer is None:
+            return True
+        number = min(number, self.behind.get(host.ip, number))
+        reports, lost = buffer.since(number)
+        if lost:
+            self.statistics['lost'] += lost
+            logger.error("- FAIL, {} reports of iDRAC {} dropped out of the replay buffer before the sink took "
+                         "them".format(lost, host.ip))
+        for report_number, report_id, payload in reports:
+            try:
+                await self._pass_on(host, report_id, payload)
+            except Exception as e:
+                self.statistics['sink_failures'] += 1
+                if host.ip not in self.behind:
+                    logger.error("- FAIL, report sink failed for a {} report of iDRAC {}, passing the reports on again "
+                                 "from the replay buffer once it works: {}".format(report_id, host.ip, e))
+                self.behind[host.ip] = report_number - 1
+                return False
+            if host.ip in self.behind:
+                self.statistics['replayed'] += report_number < buffer.last_number
+                self.behind[host.ip] = report_number
+        if self.behind.pop(host.ip, None) is not None:
+            logger.info("- INFO, report sink of iDRAC {} caught up".format(host.ip))
+        return True
+
+    async def _pass_on(self, host, report_id, payload):
+        result = self.sink(host, report_id, payload)
+        if inspect.isawaitable(result):
+            await result
+
+    @staticmethod
+    def _timestamp(payload):
+        """Returns the last Timestamp of a report without decoding it. The iDRAC writes the one of the report after
+        the MetricValues, either way it is newer in every later report, which is all the SequenceTracker compares."""
+        position = payload.rfind(b'"Timestamp"')
+        match = _TIMESTAMP.match(payload, position) if position >= 0 else None
+        return match.group(1).decode('ascii', 'replace') if match is not None else None
@@ -0,0 +1,244 @@
+#
+# subscriptions.py Reads, plans and applies Redfish EventService subscriptions on many iDRACs concurrently.
+#
+#
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+from idrac_telemetry import json_codec
+from idrac_telemetry.hosts import session
+
+SUBSCRIPTIONS_URI = '/redfish/v1/EventService/Subscriptions'
+
+# Defaults of the subscriptions created by AddRedfishSubscription.py
+SUBSCRIPTION_DEFAULTS = {
+    "Protocol": "Redfish",
+    "SubscriptionType": "RedfishEvent",
+    "EventTypes": ["MetricReport"],
+    "EventFormatType": "MetricReport"}
+
+# Group of the desired subscriptions of all groups which have none of their own
+ALL_GROUPS = '*'
+
+logger = logging.getLogger(__name__)
+
+
+class HostPlan(object):
+    """The subscriptions of one iDRAC which have to be added and deleted to reach the desired state"""
+
+    __slots__ = ('host', 'add', 'delete', 'error')
+
+    def __init__(self, host, add=None, delete=None, error=None):
+        self.host = host
+        self.add = add or []
+        self.delete = delete or []
+        self.error = error
+
+    @property
+    def in_sync(self):
+        return self.error is None and not self.add and not self.delete
+
+
+def desired_subscription(subscription):
+    """Completes a desired subscription with the defaults of SUBSCRIPTION_DEFAULTS"""
+    if not subscription.get("Destination"):
+        raise ValueError("Desired subscription without Destination: {}".format(subscription))
+    desired = dict(SUBSCRIPTION_DEFAULTS)
+    desired.update(subscription)
+    return desired
+
+
+def subscription_key(subscription):
+    """Identity of a subscription, two subscriptions with the same key deliver the same events to the same place"""
+    destination = subscription.get("Destination") or ""
+    scheme, separator, rest = destination.partition('://')
+    if separator:
+        location, slash, path = rest.partition('/')
+        destination = scheme.lower() + '://' + location.lower() + (slash + path).rstrip('/')
+    return (destination.rstrip('/'), subscription.get("Context") or "",
+            subscription.get("EventFormatType") or SUBSCRIPTION_DEFAULTS["EventFormatType"],
+            tuple(sorted(subscription.get("EventTypes") or [])))
+
+
+def is_managed(subscription):
+    """Only push subscriptions are reconciled, SSE and SNMP/SMTP subscriptions are left alone"""
+    return (subscription.get("Protocol", "Redfish") == "Redfish" and
+            subscription.get("SubscriptionType", "RedfishEvent") == "RedfishEvent")
+
+
+def read_subscriptions(host, timeout=30):
+    """Returns the subscriptions of an iDRAC.
+
+    The collection is requested with $expand so one GET returns all members. Firmware which ignores $expand only
+    returns the member links, the members are then read one by one.
+    """
+    url = host.url(SUBSCRIPTIONS_URI)
+    response = session().get(url, params={'$expand': '*($levels=1)'}, auth=host.auth, timeout=timeout)
+    if response.status_code != 200:
+        raise RuntimeError("status code for reading subscriptions is not 200, code is: {}".format(
+            response.status_code))
+    subscriptions = []
+    for member in json_codec.loads(response.content).get("Members", []):
+        if "Destination" not in member:
+            member_response = session().get(host.url(member["@odata.id"]), auth=host.auth,
+                                            timeout=timeout)
+            if member_response.status_code == 404:  # deleted since the collection was read
+                continue
+            if member_response.status_code != 200:
+                raise RuntimeError("status code for reading subscription {} is not 200, code is: {}".format(
+                    member["@odata.id"], member_response.status_code))
+            member = json_codec.loads(member_response.content)
+        subscriptions.append(member)
+    return subscriptions
+
+
+def plan_host(host, desired, current, delete_unmanaged=True):
+    """Compares the current subscriptions of a host with the desired ones.
+
+    :param host: The Host
+    :param desired: Desired subscriptions, completed by desired_subscription
+    :param current: Subscriptions read from the iDRAC
+    :param delete_unmanaged: Delete the push subscriptions which are not desired, otherwise only add missing ones
+    :return: HostPlan
+    """
+    desired_by_key = {subscription_key(subscription): subscription for subscription in desired}
+    seen = set()
+    delete = []
+    for subscription in current:
+        if not is_managed(subscription):
+            continue
+        key = subscription_key(subscription)
+        if key in desired_by_key and key not in seen:
+            seen.add(key)
+        elif delete_unmanaged or key in seen:  # duplicates of a desired subscription are always removed
+            delete.append(subscription)
+    add = [subscription for key, subscription in desired_by_key.items() if key not in seen]
+    return HostPlan(host, add, delete)
+
+
+def apply_plan(plan, timeout=30):
+    """Deletes and adds the subscriptions of a plan, deletes first as the iDRAC limits the number of subscriptions.
+
+    :return: List of error messages, empty when all changes were applied
+    """
+    errors = []
+    host = plan.host
+    for subscription in plan.delete:
+        response = session().delete(host.url(subscription["@odata.id"]), auth=host.auth,
+                                    timeout=timeout)
+        if response.status_code not in (200, 202, 204, 404):
+            errors.append("status code for deleting subscription {} is not 200, code is: {}".format(
+                subscription.get("Id", subscription["@odata.id"]), response.status_code))
+    for subscription in plan.add:
+        response = session().post(host.url(SUBSCRIPTIONS_URI),
+                                  data=json_codec.dumps(subscription), auth=host.auth, timeout=timeout)
+        if response.status_code not in (200, 201):
+            errors.append("status code for adding subscription to '{}' is not 201, code is: {}".format(
+                subscription["Destination"], response.status_code))
+    return errors
+
+
+def _plan(host, desired, delete_unmanaged, timeout):
+    try:
+        return plan_host(host, desired, read_subscriptions(host, timeout), delete_unmanaged)
+    except (requests.RequestException, RuntimeError, ValueError) as e:
+        return HostPlan(host, error=str(e))
+
+
+def _apply(plan, timeout):
+    try:
+        return apply_plan(plan, timeout)
+    except requests.RequestException as e:
+        return [str(e)]
+
+
+class SubscriptionReconciler(object):
+    """Converges the push subscriptions of a fleet of iDRACs to a desired state.
+
+    Every pass reads the subscriptions of all hosts concurrently, plans the additions and deletions per host and
+    applies the plans of the hosts which differ, again concurrently. Passes are repeated until all hosts are in sync
+    or max_passes is reached. The requests to one iDRAC are sent one after the other.
+    """
+
+    def __init__(self, desired_groups, workers=32, delete_unmanaged=True, timeout=30, max_passes=3):
+        """
+        :param desired_groups: Dictionary of group name to the list of desired subscriptions of the group, the
+                               subscriptions of '*' apply to the groups without an entry of their own
+        :param workers: Number of iDRACs worked on at the same time
+        :param delete_unmanaged: Delete push subscriptions which are not desired
+        :param timeout: Timeout in seconds of each request
+        :param max_passes: Maximum number of apply passes
+        """
+        self.desired_groups = {group: [desired_subscription(subscription) for subscription in subscriptions]
+                               for group, subscriptions in desired_groups.items()}
+        self.workers = workers
+        self.delete_unmanaged = delete_unmanaged
+        self.timeout = timeout
+        self.max_passes = max_passes
+
+    def desired(self, host):
+        desired = self.desired_groups.get(host.group, self.desired_groups.get(ALL_GROUPS))
+        if desired is None:
+            raise ValueError("No desired subscriptions for group '{}' of iDRAC {}".format(host.group, host.ip))
+        return desired
+
+    def plan(self, hosts):
+        """Reads the current subscriptions of the hosts and returns their HostPlans in the order of the hosts"""
+        for host in hosts:
+            self.desired(host)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(lambda host: _plan(host, self.desired(host), self.delete_unmanaged,
+                                                        self.timeout), hosts))
+
+    def apply(self, plans):
+        """Applies the plans which are not in sync and returns a dictionary of iDRAC IP to error messages"""
+        errors = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(_apply, plan, self.timeout): plan for plan in plans if plan.add or plan.delete}
+            for future in as_completed(futures):
+                host_errors = future.result()
+                if host_errors:
+                    errors[futures[future].host.ip] = host_errors
+        return errors
+
+    def reconcile(self, hosts, dry_run=False):
+        """Converges the hosts to their desired subscriptions.
+
+        :param hosts: List of Host
+        :param dry_run: Only plan, do not change anything
+        :return: The HostPlans of the last pass, hosts which are in sync have empty plans
+        """
+        pending = list(hosts)
+        final = {}
+        # The pass after the last apply pass only verifies
+        for number in range(1, self.max_passes + 2):
+            plans = self.plan(pending)
+            for plan in plans:
+                final[plan.host.ip] = plan
+            changes = [plan for plan in plans if plan.error is None and not plan.in_sync]
+            logger.info("- INFO, pass {}: {} iDRACs read, {} in sync, {} to change ({} additions, {} deletions), "
+                        "{} unreachable".format(number, len(plans), sum(plan.in_sync for plan in plans), len(changes),
+                                                sum(len(plan.add) for plan in changes),
+                                                sum(len(plan.delete) for plan in changes),
+                                                sum(plan.error is not None for plan in plans)))
+            if dry_run or not changes or number > self.max_passes:
+                break
+            for ip, host_errors in self.apply(changes).items():
+                for error in host_errors:
+                    logger.error("- FAIL, iDRAC {}: {}".format(ip, error))
+            # Only the changed hosts are read again to verify they converged
+            pending = [plan.host for plan in changes]
+        return [final[host.ip] for host in hosts]
@@ -0,0 +1,303 @@
+#
+# telemetry_config.py Renders the Telemetry attributes of every iDRAC from a template with group overrides and applies
+# them to many iDRACs concurrently.
+#
+#
+#
+# Copyright (c) 2022, Dell, Inc.
+#
+# This software is licensed to you under the GNU General Public License,
+# version 2 (GPLv2). There is NO WARRANTY for this software, express or
+# implied, including the implied warranties of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. You should have received a copy of GPLv2
+# along with this software; if not, see
+# http://www.gnu.org/licenses/old-licenses/gpl-2.0.txt.
+#
+
+import fnmatch
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+
+from idrac_telemetry import json_codec
+from idrac_telemetry.async_redfish import RedfishConnectionError
+from idrac_telemetry.circuit_breaker import HostUnavailable
+from idrac_telemetry.redfish_cache import DEFAULT_CACHE_FOLDER
+
+ATTRIBUTES_URI = '/redfish/v1/Managers/iDRAC.Embedded.1/Attributes'
+IMPORT_URI = '/redfish/v1/Managers/iDRAC.Embedded.1/Actions/Oem/EID_674_Manager.ImportSystemConfiguration'
+DEFAULT_VERIFIED_FILE = os.path.join(os.path.dirname(DEFAULT_CACHE_FOLDER), 'verified-configurations.json')
+
+# Attributes of the Telemetry groups, like Telemetry.1.EnableTelemetry or TelemetryPowerMetrics.1.ReportInterval
+_TELEMETRY_ATTRIBUTE = re.compile(r'Telemetry', re.IGNORECASE)
+
+# Results of apply_host
+IN_SYNC = 'in sync'
+CHANGED = 'changed'
+CACHED = 'cached'
+PLANNED = 'planned'
+FAILED = 'failed'
+
+logger = logging.getLogger(__name__)
+
+
+def redfish_name(name):
+    """Returns the Redfish name of an attribute, 'Telemetry.1.EnableTelemetry' for 'Telemetry.1#EnableTelemetry'"""
+    return name.replace('#', '.')
+
+
+def scp_name(name):
+    """Returns the SCP name of an attribute, the reverse of redfish_name"""
+    group, _, attribute = redfish_name(name).rpartition('.')
+    return group + '#' + attribute if group else attribute
+
+
+def load_attributes(path):
+    """Reads Telemetry attributes by their Redfish name from a file of ExportTelemetryConfigurationUsingScpREDFISH.py,
+    a complete SCP export or a JSON object of attribute names to values
+
+    :raises OSError: The file can not be read
+    :raises ValueError: The file is no valid JSON or holds none of the formats
+    """
+    with open(path, 'rb') as file:
+        document = json_codec.loads(file.read())
+    if isinstance(document, dict) and 'SystemConfiguration' in document:
+        document = [attribute for component in document['SystemConfiguration'].get('Components', [])
+                    for attribute in component.get('Attributes', [])
+                    if _TELEMETRY_ATTRIBUTE.search(attribute.get('Name', ''))]
+    if isinstance(document, list):
+        return {redfish_name(attribute['Name']): attribute['Value'] for attribute in document
+                if isinstance(attribute, dict) and 'Name' in attribute and 'Value' in attribute}
+    if isinstance(document, dict):
+        return {redfish_name(name): value for name, value in document.items()}
+    raise ValueError("'{}' holds no Telemetry attributes".format(path))
+
+
+def fingerprint(attributes):
+    """Short hash of an attribute set, equal attribute sets have equal fingerprints"""
+    return hashlib.sha1(json_codec.dumps_bytes(sorted((name, str(value)) for name, value in attributes.items()),
+                                               'compact')).hexdigest()[:16]
+
+
+class TelemetryTemplate(object):
+    """Desired Telemetry attributes of a fleet, rendered per iDRAC.
+
+    The template is a JSON document:
+
+        {"base": "SCP_export_R740.json",
+         "attributes": {"Telemetry.1.EnableTelemetry": "Enabled"},
+         "groups": {"rack*": {"TelemetryPowerMetrics.1.ReportInterval": 60},
+                    "gpu-*": {"TelemetryGPUMetrics.1.EnableTelemetry": "Enabled"}},
+         "hosts": {"192.168.0.120": {"TelemetryPowerMetrics.1.ReportInterval": 10}}}
+
+    base is an export of ExportTelemetryConfigurationUsingScpREDFISH.py, read relative to the template, or an object
+    of attributes. The attributes of an iDRAC are those of base, overridden by attributes, by the groups whose name
+    or fnmatch pattern matches the group of the iDRAC in the order of the template and by its entry of hosts. Both
+    SCP names with # and Redfish names are accepted.
+    """
+
+    def __init__(self, document, folder='.'):
+        """
+        :param document: Template as dictionary
+        :param folder: Folder a base file name is relative to
+        :raises OSError: The base file can not be read
+        :raises ValueError: The template is invalid
+        """
+        if not isinstance(document, dict):
+            raise ValueError("The template is not a JSON object")
+        base = document.get('base') or {}
+        if isinstance(base, str):
+            base = load_attributes(os.path.join(folder, base))
+        self.attributes = self._section(base, 'base')
+        self.attributes.update(self._section(document.get('attributes'), 'attributes'))
+        self.groups = [(pattern, self._section(attributes, "group '{}'".format(pattern)))
+                       for pattern, attributes in (document.get('groups') or {}).items()]
+        self.hosts = {ip: self._section(attributes, "host '{}'".format(ip))
+                      for ip, attributes in (document.get('hosts') or {}).items()}
+
+    @staticmethod
+    def _section(attributes, name):
+        if not isinstance(attributes or {}, dict):
+            raise ValueError("The {} of the template is not an object of attribute names to values".format(name))
+        return {redfish_name(attribute): value for attribute, value in (attributes or {}).items()}
+
+    def render(self, host):
+        """Returns the attributes of one Host by their Redfish name"""
+        attributes = dict(self.attributes)
+        for pattern, overrides in self.groups:
+            if fnmatch.fnmatchcase(host.group, pattern):
+                attributes.update(overrides)
+        attributes.update(self.hosts.get(host.ip, {}))
+        return attributes
+
+
+def load_template(path):
+    """Returns the TelemetryTemplate of a JSON file
+
+    :raises OSError: The template or its base file can not be read
+    :raises ValueError: The template is invalid
+    """
+    with open(path, 'rb') as file:
+        document = json_codec.loads(file.read())
+    return TelemetryTemplate(document, os.path.dirname(os.path.abspath(path)))
+
+
+class VerifiedConfigurations(object):
+    """Fingerprint of the attribute set last verified on every iDRAC, saved to a JSON file.
+
+    An iDRAC whose rendered attributes have the fingerprint verified before is not contacted again, so applying an
+    unchanged template a second time sends no request. Changes made on the iDRAC by other means are only found with
+    a forced apply.
+    """
+
+    def __init__(self, path=DEFAULT_VERIFIED_FILE):
+        """
+        :param path: File the fingerprints are kept in, they are not persisted when None
+        """
+        self.path = path
+        self.fingerprints = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, 'rb') as file:
+                self.fingerprints = json_codec.loads(file.read()).get('verified', {})
+
+    def verified(self, ip, attributes):
+        with self._lock:
+            return self.fingerprints.get(ip) == fingerprint(attributes)
+
+    def record(self, ip, attributes=None):
+        """Records the attributes verified on an iDRAC, None forgets the iDRAC"""
+        with self._lock:
+            if attributes is None:
+                self.fingerprints.pop(ip, None)
+            else:
+                self.fingerprints[ip] = fingerprint(attributes)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            document = {'version': 1, 'verified': dict(self.fingerprints)}
+        folder = os.path.dirname(os.path.abspath(self.path))
+        try:
+            os.makedirs(folder, exist_ok=True)
+            descriptor, temporary_file = tempfile.mkstemp(dir=folder, suffix='.tmp')
+            with os.fdopen(descriptor, 'w') as file:
+                file.write(json_codec.dumps(document, 'compact'))
+            os.replace(temporary_file, self.path)
+        except OSError as e:
+            logger.error("Unable to save the verified configurations to '{}': {}".format(self.path, e))
+
+
+class ConfigResult(object):
+    """Outcome of applying the attributes of one iDRAC"""
+
+    __slots__ = ('host', 'status', 'changes', 'method', 'error')
+
+    def __init__(self, host, status, changes=None, method=None, error=None):
+        self.host = host
+        self.status = status
+        self.changes = changes or {}
+        self.method = method
+        self.error = error
+
+
+def _coerce(value, current):
+    """Converts a desired value to the type of the current one, SCP exports hold every value as string"""
+    if isinstance(current, bool) or not isinstance(value, str):
+        return value
+    if isinstance(current, int):
+        try:
+            return int(value)
+        except ValueError:
+            return value
+    return value
+
+
+def plan_changes(desired, current):
+    """Returns the attributes of desired which differ from current, with the types of current, and the names of
+    the desired attributes current does not have"""
+    changes, unknown = {}, []
+    for name, value in desired.items():
+        if name not in current:
+            unknown.append(name)
+        elif str(current[name]) != str(value):
+            changes[name] = _coerce(value, current[name])
+    return changes, unknown
+
+
+async def read_attributes(client, host):
+    """Returns the attributes of an iDRAC, None when the firmware has no Attributes resource"""
+    response = await client.get(host, ATTRIBUTES_URI)
+    if response.status_code in (404, 405):
+        return None
+    if response.status_code != 200:
+        raise RuntimeError("status code for reading attributes is not 200, code is: {}".format(response.status_code))
+    return response.json().get('Attributes', {})
+
+
+async def import_attributes(client, host, attributes, timeout=600):
+    """Applies attributes with an SCP import job and waits for it, for firmware without the Attributes resource"""
+    profile = {'SystemConfiguration': {'Components': [{'FQDD': 'iDRAC.Embedded.1', 'Attributes': [
+        {'Name': scp_name(name), 'Value': str(value)} for name, value in attributes.items()]}]}}
+    response = await client.post(host, IMPORT_URI, {"ImportBuffer": json_codec.dumps(profile),
+                                                    "ShareParameters": {"Target": "IDRAC"}})
+    if response.status_code != 202 or not response.headers.get('Location'):
+        raise RuntimeError("status code for SCP import is not 202, code is: {}".format(response.status_code))
+    task = await client.wait_for_task(host, response.headers['Location'], timeout=timeout)
+    if task.get('TaskState', task.get('JobState')) != 'Completed' or \
+            re.search('Fail', str(task.get('Message', '')), re.IGNORECASE):
+        raise RuntimeError("SCP import job failed: {}".format(task.get('Message') or task.get('TaskState')))
+
+
+async def apply_host(client, host, attributes, verified=None, force=False, dry_run=False):
+    """Converges the Telemetry attributes of one iDRAC.
+
+    The attributes are read with one GET and only the differing ones are set with one PATCH, which the iDRAC applies
+    without a job, then read again to verify them. Firmware without the Attributes resource gets all attributes with
+    an SCP import job instead.
+
+    :param attributes: Attributes rendered for the host
+    :param verified: VerifiedConfigurations, hosts verified with the same attributes before are skipped
+    :param force: Read the attributes of hosts which were verified before
+    :param dry_run: Only find the changes, do not apply them
+    :return: ConfigResult
+    """
+    if verified is not None and not force and verified.verified(host.ip, attributes):
+        return ConfigResult(host, CACHED)
+    try:
+        current = await read_attributes(client, host)
+        if current is None:
+            if dry_run:
+                return ConfigResult(host, PLANNED, attributes, 'SCP')
+            await import_attributes(client, host, attributes)
+            status, changes, method = CHANGED, attributes, 'SCP'
+        else:
+            changes, unknown = plan_changes(attributes, current)
+            if unknown:
+                raise ValueError("attributes unknown to the iDRAC: {}".format(", ".join(sorted(unknown))))
+            if not changes:
+                status, method = IN_SYNC, None
+            elif dry_run:
+                return ConfigResult(host, PLANNED, changes, 'PATCH')
+            else:
+                response = await client.patch(host, ATTRIBUTES_URI, {"Attributes": changes})
+                if response.status_code not in (200, 202, 204):
+                    raise RuntimeError("status code for setting attributes is not 200, code is: {}".format(
+                        response.status_code))
+                remaining, unknown = plan_changes(attributes, await read_attributes(client, host) or {})
+                if remaining or unknown:
+                    raise RuntimeError("attributes not set after PATCH: {}".format(
+                        ", ".join(sorted(list(remaining) + unknown))))
+                status, method = CHANGED, 'PATCH'
+    except (RedfishConnectionError, HostUnavailable, RuntimeError, ValueError) as e:
+        if verified is not None:
+            verified.record(host.ip)
+        return ConfigResult(host, FAILED, error=str(e))
+    if verified is not None:
+        verified.record(host.ip, attributes)
+    return ConfigResult(host, status, changes, method)
+